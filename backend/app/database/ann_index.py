@@ -0,0 +1,190 @@
+"""
+Approximate nearest-neighbour index for the vector store.
+
+An inverted-file (IVF) index: rows are clustered with spherical k-means
+over unit-normalized vectors, and a query only scores the rows in the
+n_probe lists whose centroids are closest to it. Built in pure NumPy,
+with incremental inserts; deleted rows are filtered by the store's
+tombstones and dropped when the store compacts. One writer may add rows
+while any number of threads search.
+"""
+
+import numpy as np
+from typing import List, Optional, Tuple
+
+# Rows scored per block when assigning vectors to centroids (bounds temporary memory)
+_ASSIGN_BLOCK = 65536
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, via argpartition."""
+    if k >= len(scores):
+        return np.argsort(scores)[::-1]
+    top = np.argpartition(scores, -k)[-k:]
+    return top[np.argsort(scores[top])[::-1]]
+
+
+class RunningTopK:
+    """Best k (row, score) pairs per query, kept across blocks of rows scored one at a time"""
+
+    def __init__(self, k: int, n_queries: int):
+        self.k = k
+        self._rows = np.empty((0, n_queries), dtype=np.int64)
+        self._scores = np.empty((0, n_queries), dtype=np.float32)
+
+    def push(self, rows: np.ndarray, scores: np.ndarray):
+        """Merge a block: rows (n,) and their scores (n, n_queries)"""
+        cand_rows = np.concatenate([self._rows, np.broadcast_to(np.asarray(rows)[:, None], scores.shape)])
+        cand_scores = np.concatenate([self._scores, scores])
+        if len(cand_scores) > self.k:
+            top = np.argpartition(cand_scores, -self.k, axis=0)[-self.k:]
+            cand_rows = np.take_along_axis(cand_rows, top, axis=0)
+            cand_scores = np.take_along_axis(cand_scores, top, axis=0)
+        self._rows, self._scores = cand_rows, cand_scores
+
+    def result(self) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """(rows, scores) per query, best first"""
+        order = np.argsort(-self._scores, axis=0)
+        rows = np.take_along_axis(self._rows, order, axis=0)
+        scores = np.take_along_axis(self._scores, order, axis=0)
+        return [(rows[:, j], scores[:, j]) for j in range(rows.shape[1])]
+
+
+def _nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK):
+        block = np.asarray(vectors[start:start + _ASSIGN_BLOCK], dtype=np.float32)
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def _kmeans(vectors: np.ndarray, k: int, n_iter: int, rng: np.random.Generator) -> np.ndarray:
+    """Spherical k-means: centroids are re-normalized means of their members"""
+    centroids = np.array(vectors[rng.choice(len(vectors), k, replace=False)], dtype=np.float32)
+    for _ in range(n_iter):
+        assign = _nearest_centroid(vectors, centroids)
+        counts = np.bincount(assign, minlength=k)
+        order = np.argsort(assign, kind="stable")
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        sums = np.add.reduceat(np.asarray(vectors, dtype=np.float32)[order], starts, axis=0)
+
+        new_centroids = centroids.copy()
+        new_centroids[filled] = sums
+        # Re-seed empty lists from random rows so every centroid stays useful
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            new_centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        new_centroids /= np.linalg.norm(new_centroids, axis=1, keepdims=True) + 1e-10
+        centroids = new_centroids
+    return centroids
+
+
+class _RowList:
+    """
+    Growable int64 array of store row indices for one inverted list.
+
+    The buffer and its used length are published together as one tuple, so a
+    search reading the list while a writer appends sees either the old or the
+    new rows, never a length that runs past the buffer it read.
+    """
+
+    def __init__(self, rows: Optional[np.ndarray] = None):
+        rows = rows if rows is not None else np.empty(0, dtype=np.int64)
+        self._view = (rows, len(rows))
+
+    @property
+    def rows(self) -> np.ndarray:
+        buffer, size = self._view
+        return buffer[:size]
+
+    def append(self, rows: np.ndarray):
+        buffer, size = self._view
+        needed = size + len(rows)
+        if needed > len(buffer):
+            grown = np.empty(max(needed, 2 * len(buffer), 16), dtype=np.int64)
+            grown[:size] = buffer[:size]
+            buffer = grown
+        buffer[size:needed] = rows
+        self._view = (buffer, needed)
+
+
+class IVFIndex:
+    """
+    Inverted-file index over a subset of store rows.
+
+    The index holds only row numbers; vectors are read from the store's
+    matrix at query time, so it adds ~8 bytes per row plus the centroids.
+    """
+
+    def __init__(self, n_lists: Optional[int] = None, n_probe: int = 8, n_iter: int = 10, seed: int = 0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[_RowList] = []
+        self.trained_size = 0
+        self.size = 0
+
+    def build(self, vectors: np.ndarray, rows: np.ndarray):
+        """Train centroids on (a sample of) vectors and assign every row"""
+        rng = np.random.default_rng(self.seed)
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(len(rows))))
+        n_lists = min(n_lists, len(rows))
+
+        # 64 points per centroid is plenty for training; assignment still covers all rows
+        sample_size = min(len(rows), 64 * n_lists)
+        sample = np.sort(rng.choice(len(rows), sample_size, replace=False))
+        self.centroids = _kmeans(vectors[sample], n_lists, self.n_iter, rng)
+
+        assign = _nearest_centroid(vectors, self.centroids)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(n_lists + 1))
+        sorted_rows = np.asarray(rows, dtype=np.int64)[order]
+        self._lists = [_RowList(sorted_rows[bounds[i]:bounds[i + 1]].copy()) for i in range(n_lists)]
+        self.trained_size = self.size = len(rows)
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray):
+        """Assign new rows to their nearest existing centroid"""
+        if self.centroids is None or len(rows) == 0:
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        assign = _nearest_centroid(vectors, self.centroids)
+        for list_id in np.unique(assign):
+            self._lists[list_id].append(rows[assign == list_id])
+        self.size += len(rows)
+
+    def remapped(self, new_index: np.ndarray, keep: np.ndarray) -> "IVFIndex":
+        """Copy without deleted rows and with the rest renumbered after the store is compacted"""
+        index = IVFIndex(self.n_lists, self.n_probe, self.n_iter, self.seed)
+        index.centroids = self.centroids
+        index.trained_size = self.trained_size
+        for row_list in self._lists:
+            rows = row_list.rows
+            index._lists.append(_RowList(new_index[rows[keep[rows]]]))
+            index.size += len(index._lists[-1].rows)
+        return index
+
+    def candidates(self, query: np.ndarray, n_probe: Optional[int] = None) -> np.ndarray:
+        """Rows in the n_probe lists whose centroids are closest to a normalized query"""
+        n_probe = min(n_probe or self.n_probe, len(self._lists))
+        probe = top_k_indices(self.centroids @ query, n_probe)
+        return np.concatenate([self._lists[i].rows for i in probe])
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, k: int, n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score rows in the n_probe closest lists against a normalized query.
+
+        Args:
+            vectors: The store's embedding matrix, indexed by row number
+
+        Returns:
+            (rows, scores) of the top k candidates, best first
+        """
+        candidates = self.candidates(query, n_probe)
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+        scores = vectors[candidates] @ query
+        top = top_k_indices(scores, min(k, len(candidates)))
+        return candidates[top], scores[top]
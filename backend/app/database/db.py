@@ -3,6 +3,7 @@ Database configuration and table creation
 Supports Supabase Postgres (via DATABASE_URL env) or local SQLite fallback.
 """
 
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
@@ -36,8 +37,23 @@ async def get_db():
         yield session
 
 
+def _add_missing_columns(conn):
+    """create_all() skips existing tables: add the nullable columns models gained since"""
+    inspector = inspect(conn)
+    if_not_exists = " IF NOT EXISTS" if conn.dialect.name == "postgresql" else ""
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN{if_not_exists} {column.name} {column_type}"))
+
+
 async def create_tables():
-    """Create all database tables"""
+    """Create all database tables, and add columns missing from existing ones"""
     from app.models import document, query_log  # noqa
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
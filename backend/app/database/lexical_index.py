@@ -0,0 +1,223 @@
+"""
+BM25 inverted index over chunk text, one per user partition.
+
+Tokens are lowercased runs of letters and digits. Runs joined by - _ . /
+(error codes, SKUs, versions, file names) are also indexed whole, so
+"ERR-4012" is matched exactly as well as on "err" and "4012".
+
+Postings hold local document numbers, mapped to store rows by `rows`.
+Postings from the initial build are packed in CSR arrays; documents
+added later go to small per-term tails. Like the IVF index, the store
+builds this on a background thread after a partition's first lexical
+search (that search builds a throwaway one inline if the partition is
+small) and extends it on every add. Deleted rows stay in the postings
+(filtered out by the store's tombstones at query time, but still
+counted in document frequencies) until compaction renumbers the store.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"[^\W_]+(?:[-_./][^\W_]+)*")
+_PART = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = _TOKEN.findall(text.lower())
+    for token in [t for t in tokens if not t.isalnum()]:
+        tokens.extend(_PART.findall(token))
+    return tokens
+
+
+def _grown(buffer: np.ndarray, used: int, needed: int) -> np.ndarray:
+    if needed <= len(buffer):
+        return buffer
+    grown = np.zeros(max(needed, 2 * len(buffer), 16), dtype=buffer.dtype)
+    grown[:used] = buffer[:used]
+    return grown
+
+
+class _Postings:
+    """Growable (doc, tf) pairs for one term, published as one tuple like _RowList"""
+
+    def __init__(self):
+        self._view = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), 0)
+
+    def get(self) -> Tuple[np.ndarray, np.ndarray]:
+        docs, tfs, size = self._view
+        return docs[:size], tfs[:size]
+
+    def append(self, docs: List[int], tfs: List[int]):
+        buf_docs, buf_tfs, size = self._view
+        needed = size + len(docs)
+        buf_docs = _grown(buf_docs, size, needed)
+        buf_tfs = _grown(buf_tfs, size, needed)
+        buf_docs[size:needed] = docs
+        buf_tfs[size:needed] = tfs
+        self._view = (buf_docs, buf_tfs, needed)
+
+
+class LexicalIndex:
+    """
+    BM25 (Okapi, k1/b) over a growing set of store rows.
+
+    One writer may add documents while any number of threads search: new
+    documents become visible when the (rows, lengths, count) view is swapped
+    in, after their postings are written.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        # CSR postings for the documents present at build time
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._docs = np.empty(0, dtype=np.int32)
+        self._tfs = np.empty(0, dtype=np.int32)
+        # term id -> postings added since the build
+        self._tail: Dict[int, _Postings] = {}
+        # (store row per local doc, token count per local doc, number of docs)
+        self._view = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), 0)
+
+    def __len__(self) -> int:
+        return self._view[2]
+
+    @property
+    def nbytes(self) -> int:
+        """Array memory (the vocabulary dict comes on top)"""
+        rows, lengths, _ = self._view
+        total = self._offsets.nbytes + self._docs.nbytes + self._tfs.nbytes + rows.nbytes + lengths.nbytes
+        for postings in self._tail.values():
+            docs, tfs, _ = postings._view
+            total += docs.nbytes + tfs.nbytes
+        return total
+
+    def _index_texts(self, rows: Sequence[int], texts: Sequence[str]):
+        """
+        Tokenize new documents into the row/length buffers (past the visible
+        count) and return their postings as parallel (term, doc, tf) lists.
+        """
+        buf_rows, buf_lengths, n = self._view
+        needed = n + len(rows)
+        buf_rows = _grown(buf_rows, n, needed)
+        buf_lengths = _grown(buf_lengths, n, needed)
+        buf_rows[n:needed] = rows
+        terms, docs, tfs = [], [], []
+        for offset, text in enumerate(texts):
+            tokens = tokenize(text or "")
+            buf_lengths[n + offset] = len(tokens)
+            counts = Counter(tokens)
+            terms.extend([self.vocab.setdefault(term, len(self.vocab)) for term in counts])
+            docs.extend([n + offset] * len(counts))
+            tfs.extend(counts.values())
+        return (buf_rows, buf_lengths, needed), terms, docs, tfs
+
+    def add(self, rows: Sequence[int], texts: Sequence[str]):
+        view, terms, docs, tfs = self._index_texts(rows, texts)
+        grouped: Dict[int, Tuple[List[int], List[int]]] = {}
+        for term_id, doc, tf in zip(terms, docs, tfs):
+            group = grouped.setdefault(term_id, ([], []))
+            group[0].append(doc)
+            group[1].append(tf)
+        for term_id, (term_docs, term_tfs) in grouped.items():
+            postings = self._tail.get(term_id)
+            if postings is None:
+                postings = self._tail[term_id] = _Postings()
+            postings.append(term_docs, term_tfs)
+        self._view = view
+
+    def build(self, rows: Sequence[int], texts: Sequence[str]):
+        """Index an initial set of documents straight into CSR form"""
+        self._view, terms, docs, tfs = self._index_texts(rows, texts)
+        self._set_csr(
+            np.array(terms, dtype=np.int64), np.array(docs, dtype=np.int32), np.array(tfs, dtype=np.int32)
+        )
+
+    def _set_csr(self, terms: np.ndarray, docs: np.ndarray, tfs: np.ndarray):
+        # Stable, so each term's docs stay ascending (base postings before tail postings)
+        order = np.argsort(terms, kind="stable")
+        counts = np.bincount(terms, minlength=len(self.vocab))
+        self._offsets = np.concatenate(([0], np.cumsum(counts)))
+        self._docs = docs[order]
+        self._tfs = tfs[order]
+        self._tail = {}
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        docs, tfs = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        if term_id + 1 < len(self._offsets):
+            lo, hi = self._offsets[term_id], self._offsets[term_id + 1]
+            docs, tfs = self._docs[lo:hi], self._tfs[lo:hi]
+        tail = self._tail.get(term_id)
+        if tail is not None:
+            tail_docs, tail_tfs = tail.get()
+            docs, tfs = np.concatenate([docs, tail_docs]), np.concatenate([tfs, tail_tfs])
+        return docs, tfs
+
+    def _pack(self, keep: np.ndarray):
+        """Rebuild the CSR arrays from all postings, keeping and renumbering the given local docs"""
+        rows, lengths, n = self._view
+        new_local = np.full(n, -1, dtype=np.int32)
+        new_local[keep] = np.arange(len(keep), dtype=np.int32)
+        terms = [np.repeat(np.arange(len(self._offsets) - 1), np.diff(self._offsets))]
+        docs, tfs = [self._docs], [self._tfs]
+        for term_id, postings in self._tail.items():
+            tail_docs, tail_tfs = postings.get()
+            terms.append(np.full(len(tail_docs), term_id, dtype=np.int64))
+            docs.append(tail_docs)
+            tfs.append(tail_tfs)
+        terms, docs, tfs = np.concatenate(terms), new_local[np.concatenate(docs)], np.concatenate(tfs)
+        kept = docs >= 0
+        self._set_csr(terms[kept], docs[kept], tfs[kept])
+        self._view = (rows[keep].copy(), lengths[keep].copy(), len(keep))
+
+    def remapped(self, new_index: np.ndarray, alive: np.ndarray) -> "LexicalIndex":
+        """Copy without deleted rows and with the rest renumbered after the store is compacted"""
+        index = LexicalIndex(self.k1, self.b)
+        index.vocab = dict(self.vocab)
+        index._offsets, index._docs, index._tfs = self._offsets, self._docs, self._tfs
+        index._tail = self._tail
+        index._view = self._view
+        rows = self.rows
+        keep = np.flatnonzero(alive[rows])
+        index._pack(keep)
+        rows, lengths, n = index._view
+        index._view = (new_index[rows], lengths, n)
+        return index
+
+    @property
+    def rows(self) -> np.ndarray:
+        rows, _, n = self._view
+        return rows[:n]
+
+    def search(self, tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 scores of every document matching at least one query token.
+
+        Returns:
+            (store rows, scores), unordered
+        """
+        rows, lengths, n = self._view
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        lengths = lengths[:n].astype(np.float32)
+        avgdl = max(float(lengths.mean()), 1.0)
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokens):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            docs, tfs = self._postings(term_id)
+            # Postings may already include documents added after this view was taken
+            visible = docs < n
+            docs, tfs = docs[visible], tfs[visible].astype(np.float32)
+            if len(docs) == 0:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[docs] / avgdl)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        matched = np.flatnonzero(scores)
+        return rows[matched], scores[matched]
@@ -0,0 +1,253 @@
+"""
+Column-wise chunk metadata for the vector store.
+
+Chunk metadata has a fixed shape (see chunk_text() and the upload route),
+so instead of one dict per chunk it is kept as one array per field:
+
+    source, user_id, file_type   int32 codes into per-field string dictionaries (-1 = missing)
+    chunk_index, total_chunks    int32  (-1 = missing)
+    char_start, char_end         int64  (-1 = missing)
+    uploaded_at                  float64 epoch seconds (NaN = missing)
+
+file_type is derived from the source's extension and never returned.
+Values that don't fit the schema (other keys, other types) are kept per
+row in a sparse dict. Dicts are rebuilt only for the rows a search
+returns, and filters are evaluated as NumPy masks over the columns.
+"""
+
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.database.vector_persistence import ArrayColumn
+
+# Fields in the order they are returned
+_STRING_FIELDS = ("source", "user_id")
+_INT_FIELDS = {
+    "chunk_index": np.int32,
+    "char_start": np.int64,
+    "char_end": np.int64,
+    "total_chunks": np.int32,
+}
+_FIELD_ORDER = ("source", "chunk_index", "char_start", "char_end", "total_chunks", "user_id", "uploaded_at")
+_DICTIONARIES = _STRING_FIELDS + ("file_type",)
+
+FILTER_KEYS = ("source", "file_type", "uploaded_after")
+
+
+def _file_type(source: str) -> str:
+    return os.path.splitext(source)[1].lower()
+
+
+def _as_list(value) -> List[str]:
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _epoch_seconds(value) -> float:
+    """datetime (naive = UTC, like Document.uploaded_at), ISO 8601 string or epoch seconds"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+class MetadataFilter:
+    """
+    Structured search filter, parsed from a dict such as
+    {"source": ["manual.pdf"], "file_type": [".pdf"], "uploaded_after": "2026-01-01"}.
+    Conditions on different keys are ANDed; values of one key are ORed.
+    """
+
+    def __init__(self, filters: Dict[str, Any]):
+        unknown = set(filters) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Unsupported filter keys: {', '.join(sorted(unknown))}")
+        source = filters.get("source")
+        file_type = filters.get("file_type")
+        uploaded_after = filters.get("uploaded_after")
+        self.sources: Optional[List[str]] = _as_list(source) if source is not None else None
+        self.file_types: Optional[List[str]] = None
+        if file_type is not None:
+            self.file_types = [t.lower() if t.startswith(".") else f".{t.lower()}" for t in _as_list(file_type)]
+        self.uploaded_after: Optional[float] = _epoch_seconds(uploaded_after) if uploaded_after is not None else None
+
+
+def parse_filters(filters: Optional[Dict[str, Any]]) -> Optional[MetadataFilter]:
+    """MetadataFilter for a filters dict, or None when there is nothing to filter on"""
+    if not filters or all(value is None for value in filters.values()):
+        return None
+    return filters if isinstance(filters, MetadataFilter) else MetadataFilter(filters)
+
+
+class _Dictionary:
+    """Append-only string <-> int32 code mapping"""
+
+    def __init__(self, values: Optional[List[str]] = None):
+        self.values: List[str] = list(values or [])
+        self.codes: Dict[str, int] = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+    def lookup(self, values: List[str]) -> np.ndarray:
+        """Codes of the values that have one (unknown values cannot match any row)"""
+        return np.array([self.codes[v] for v in values if v in self.codes], dtype=np.int32)
+
+
+class MetadataColumns:
+    """Per-chunk metadata as typed columns, row-aligned with the store's vectors"""
+
+    def __init__(self):
+        self.dictionaries: Dict[str, _Dictionary] = {name: _Dictionary() for name in _DICTIONARIES}
+        self.columns: Dict[str, ArrayColumn] = {name: ArrayColumn(dtype=np.int32) for name in _DICTIONARIES}
+        for name, dtype in _INT_FIELDS.items():
+            self.columns[name] = ArrayColumn(dtype=dtype)
+        self.columns["uploaded_at"] = ArrayColumn(dtype=np.float64)
+        # row -> {key: value} for anything outside the schema
+        self.extras: Dict[int, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.columns["uploaded_at"])
+
+    @classmethod
+    def from_dicts(cls, metadatas: List[Dict[str, Any]]) -> "MetadataColumns":
+        columns = cls()
+        columns.extend(metadatas)
+        return columns
+
+    def extend(self, metadatas: List[Dict[str, Any]]):
+        start = len(self)
+        n = len(metadatas)
+        codes = {name: np.full(n, -1, dtype=np.int32) for name in _DICTIONARIES}
+        ints = {name: np.full(n, -1, dtype=dtype) for name, dtype in _INT_FIELDS.items()}
+        uploaded_at = np.full(n, np.nan)
+
+        for i, m in enumerate(metadatas):
+            extra = {}
+            for key, value in (m or {}).items():
+                if key in _STRING_FIELDS and isinstance(value, str):
+                    codes[key][i] = self.dictionaries[key].encode(value)
+                    if key == "source":
+                        codes["file_type"][i] = self.dictionaries["file_type"].encode(_file_type(value))
+                elif key in _INT_FIELDS and isinstance(value, (int, np.integer)) and not isinstance(value, bool) and value >= 0:
+                    ints[key][i] = value
+                elif key == "uploaded_at" and isinstance(value, (int, float)) and not isinstance(value, bool):
+                    uploaded_at[i] = value
+                else:
+                    extra[key] = value
+            if extra:
+                self.extras[start + i] = extra
+
+        for name, values in {**codes, **ints, "uploaded_at": uploaded_at}.items():
+            self.columns[name].append(values)
+
+    def frozen(self) -> "MetadataColumns":
+        """Read-only view of the rows present now (dictionaries and extras are append-only, so shared)"""
+        view = MetadataColumns.__new__(MetadataColumns)
+        view.dictionaries = self.dictionaries
+        view.columns = {name: column.frozen() for name, column in self.columns.items()}
+        view.extras = self.extras
+        return view
+
+    def detached(self) -> "MetadataColumns":
+        """
+        Frozen view with its own copy of the dictionaries and extras, so it
+        can be read on another thread while the live columns keep growing
+        (e.g. persisted() by a checkpoint running without the store lock).
+        """
+        view = self.frozen()
+        view.dictionaries = {name: _Dictionary(d.values) for name, d in self.dictionaries.items()}
+        view.extras = dict(self.extras)
+        return view
+
+    def _take(self, field: str, rows: Optional[np.ndarray]) -> np.ndarray:
+        column = self.columns[field]
+        return column.materialize() if rows is None else column.take(rows)
+
+    def codes(self, field: str, start: int = 0) -> np.ndarray:
+        """Dictionary codes of a string field for rows start.."""
+        return self._take(field, np.arange(start, len(self)))
+
+    def decode(self, field: str, code: int) -> Optional[str]:
+        return self.dictionaries[field].values[code] if code >= 0 else None
+
+    def dicts(self, rows) -> List[Dict[str, Any]]:
+        """Rebuild metadata dicts for a few rows (e.g. search hits)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        values = {name: self._take(name, rows) for name in _FIELD_ORDER}
+        out = []
+        for i, row in enumerate(rows):
+            m = {}
+            for name in _FIELD_ORDER:
+                value = values[name][i]
+                if name in _STRING_FIELDS:
+                    if value >= 0:
+                        m[name] = self.dictionaries[name].values[value]
+                elif name == "uploaded_at":
+                    if not np.isnan(value):
+                        m[name] = float(value)
+                elif value >= 0:
+                    m[name] = int(value)
+            m.update(self.extras.get(int(row), {}))
+            out.append(m)
+        return out
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        return self.dicts([row])[0]
+
+    def matches(self, rows: Optional[np.ndarray], flt: MetadataFilter) -> np.ndarray:
+        """Boolean mask over rows (all rows if None) of those passing the filter"""
+        mask = np.ones(len(self) if rows is None else len(rows), dtype=bool)
+        if flt.sources is not None:
+            mask &= np.isin(self._take("source", rows), self.dictionaries["source"].lookup(flt.sources))
+        if flt.file_types is not None:
+            mask &= np.isin(self._take("file_type", rows), self.dictionaries["file_type"].lookup(flt.file_types))
+        if flt.uploaded_after is not None:
+            # NaN (unknown upload time) compares False, so those rows are excluded
+            mask &= self._take("uploaded_at", rows) > flt.uploaded_after
+        return mask
+
+    def persisted(self, rows: Optional[np.ndarray] = None) -> Tuple[Dict[str, Any], Dict[str, ArrayColumn]]:
+        """
+        (JSON document, arrays) for a snapshot that keeps only rows (all if None).
+        The arrays are subset by write_snapshot; extras are renumbered here.
+        """
+        extras = self.extras
+        if rows is not None and extras:
+            # rows is sorted, so each extra's new row number is its position in it
+            old = np.fromiter(extras, dtype=np.int64, count=len(extras))
+            pos = np.minimum(np.searchsorted(rows, old), len(rows) - 1)
+            kept = rows[pos] == old
+            extras = {int(p): extras[int(row)] for row, p, k in zip(old, pos, kept) if k}
+        doc = {
+            "dictionaries": {name: d.values for name, d in self.dictionaries.items()},
+            "extras": {str(row): extra for row, extra in extras.items()},
+        }
+        return doc, {f"meta_{name}": column for name, column in self.columns.items()}
+
+    @classmethod
+    def load(cls, doc, arrays: Dict[str, np.ndarray], n_rows: int) -> "MetadataColumns":
+        """Re-open columns written by persisted(), or convert a legacy list of dicts"""
+        if isinstance(doc, list):
+            return cls.from_dicts(doc)
+        columns = cls()
+        columns.dictionaries = {name: _Dictionary(values) for name, values in doc["dictionaries"].items()}
+        for name in columns.columns:
+            array = arrays.get(f"meta_{name}")
+            if array is None or len(array) != n_rows:
+                raise ValueError(f"Snapshot metadata column {name} is missing or truncated")
+            columns.columns[name] = ArrayColumn(base=array)
+        columns.extras = {int(row): extra for row, extra in doc["extras"].items()}
+        return columns
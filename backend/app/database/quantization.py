@@ -0,0 +1,171 @@
+"""
+Compressed embedding codes for the vector store's main scan.
+
+Kinds:
+    float16  2 bytes/dim
+    int8     1 byte/dim plus a float32 scale per row (symmetric, per-row max)
+    binary   1 bit/dim sign code, scored by Hamming distance
+
+The scan over codes only ranks candidates; the top k * rescore_factor
+(k * prefilter_factor for binary) are rescored exactly against the float32 rows, which stay in the memory-mapped
+snapshot and are only paged in for those candidates. With binary_prefilter,
+an int8/float16 scan first narrows the rows with the sign code.
+"""
+
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from app.database.ann_index import top_k_indices
+from app.database.vector_persistence import ArrayColumn
+
+QUANTIZATION_KINDS = ("none", "float16", "int8", "binary")
+
+# Rows scored per block so temporary float32 copies of codes stay in cache
+_SCORE_BLOCK = 2048
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[x].sum(axis=1, dtype=np.int32)
+
+
+def _encode(vecs: np.ndarray, kind: str) -> Dict[str, np.ndarray]:
+    out = {}
+    if kind == "float16":
+        out["codes"] = vecs.astype(np.float16)
+    elif kind == "int8":
+        scales = np.abs(vecs).max(axis=1) / 127 + 1e-12
+        out["codes"] = np.round(vecs / scales[:, None]).astype(np.int8)
+        out["scales"] = scales.astype(np.float32)
+    return out
+
+
+def _sign_bits(vecs: np.ndarray) -> np.ndarray:
+    return np.packbits(vecs > 0, axis=-1)
+
+
+class QuantizedIndex:
+    """Compressed copy of every store row plus the scan -> rescore search pipeline"""
+
+    def __init__(self, kind: str, binary_prefilter: bool = False, rescore_factor: int = 4, prefilter_factor: int = 40):
+        if kind not in QUANTIZATION_KINDS or kind == "none":
+            raise ValueError(f"Unsupported quantization kind: {kind}")
+        self.kind = kind
+        self.binary_prefilter = binary_prefilter or kind == "binary"
+        self.rescore_factor = rescore_factor
+        self.prefilter_factor = prefilter_factor
+        self.columns: Dict[str, ArrayColumn] = {}
+
+    def _column(self, name: str, rows: np.ndarray) -> ArrayColumn:
+        if name not in self.columns:
+            self.columns[name] = ArrayColumn(dtype=rows.dtype, width=rows.shape[1] if rows.ndim == 2 else None)
+        return self.columns[name]
+
+    def append(self, vecs: np.ndarray):
+        """Encode normalized float32 rows"""
+        if len(vecs) == 0:
+            return
+        encoded = _encode(vecs, self.kind)
+        if self.binary_prefilter:
+            encoded["signs"] = _sign_bits(vecs)
+        for name, rows in encoded.items():
+            self._column(name, rows).append(rows)
+
+    def build(self, vectors: ArrayColumn):
+        """Encode an existing column block by block"""
+        for _, segment in vectors.segments():
+            for start in range(0, len(segment), _SCORE_BLOCK):
+                self.append(np.asarray(segment[start:start + _SCORE_BLOCK], dtype=np.float32))
+
+    def frozen(self) -> "QuantizedIndex":
+        """Read-only view of the codes present now (see ArrayColumn.frozen)"""
+        index = QuantizedIndex(self.kind, self.binary_prefilter, self.rescore_factor, self.prefilter_factor)
+        index.columns = {name: column.frozen() for name, column in self.columns.items()}
+        return index
+
+    def persisted_arrays(self) -> Dict[str, ArrayColumn]:
+        """Arrays to store in a snapshot, named so load() can recognise them"""
+        return {f"quant_{self.kind}_{name}": column for name, column in self.columns.items()}
+
+    @classmethod
+    def load(cls, arrays: Dict[str, np.ndarray], n_rows: int, **kwargs) -> Optional["QuantizedIndex"]:
+        """Re-open codes written by persisted_arrays(); None if they are missing or stale"""
+        index = cls(**kwargs)
+        prefix = f"quant_{index.kind}_"
+        needed = {"float16": ["codes"], "int8": ["codes", "scales"], "binary": []}[index.kind]
+        if index.binary_prefilter:
+            needed.append("signs")
+        for name in needed:
+            array = arrays.get(prefix + name)
+            if array is None or len(array) != n_rows:
+                return None
+            index.columns[name] = ArrayColumn(base=array)
+        return index
+
+    @property
+    def nbytes_per_row(self) -> float:
+        total = 0
+        for column in self.columns.values():
+            total += column.dtype.itemsize * (column.width or 1)
+        return total
+
+    @staticmethod
+    def _blocks(column: ArrayColumn, rows: Optional[np.ndarray]):
+        """Yield (output offset, block of rows) by slicing when scanning everything, else gathering"""
+        if rows is None:
+            for first, segment in column.segments():
+                for start in range(0, len(segment), _SCORE_BLOCK):
+                    yield first + start, segment[start:start + _SCORE_BLOCK]
+        else:
+            for start in range(0, len(rows), _SCORE_BLOCK):
+                yield start, column.take(rows[start:start + _SCORE_BLOCK])
+
+    def _approx_scores(self, rows: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        codes = self.columns["codes"]
+        scores = np.empty(len(codes) if rows is None else len(rows), dtype=np.float32)
+        for start, block in self._blocks(codes, rows):
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        if self.kind == "int8":
+            scales = self.columns["scales"]
+            scores *= scales.materialize() if rows is None else scales.take(rows)
+        return scores
+
+    def _hamming(self, rows: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        query_bits = _sign_bits(query)
+        signs = self.columns["signs"]
+        distances = np.empty(len(signs) if rows is None else len(rows), dtype=np.int32)
+        for start, block in self._blocks(signs, rows):
+            distances[start:start + len(block)] = _popcount(block ^ query_bits)
+        return distances
+
+    def search(self, vectors: ArrayColumn, rows: Optional[np.ndarray], query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rank rows (all rows if None) with the compressed codes, then rescore
+        the best candidates exactly against the float32 vectors.
+
+        Returns:
+            (rows, scores) of the top k, best first
+        """
+        candidates = None if rows is None else np.asarray(rows, dtype=np.int64)
+        n_candidates = len(vectors) if rows is None else len(candidates)
+        if self.binary_prefilter:
+            keep = k * self.prefilter_factor
+            if n_candidates > keep:
+                distances = self._hamming(candidates, query)
+                best = np.argpartition(distances, keep)[:keep]
+                candidates = best if candidates is None else candidates[best]
+                n_candidates = keep
+        if self.kind != "binary":
+            keep = k * self.rescore_factor
+            if n_candidates > keep:
+                best = top_k_indices(self._approx_scores(candidates, query), keep)
+                candidates = best if candidates is None else candidates[best]
+        if candidates is None:
+            candidates = np.arange(len(vectors))
+
+        scores = vectors.take(candidates) @ query
+        top = top_k_indices(scores, min(k, len(candidates)))
+        return candidates[top], scores[top]
@@ -0,0 +1,282 @@
+"""
+SQLite-backed vector store (VECTOR_BACKEND=sqlite).
+
+Chunks live in one table, embeddings as normalized float32 BLOBs next to
+their text and metadata, indexed by (user_id, source). Nothing is held in
+memory between requests: a search streams the matching rows' rowid and
+embedding in fixed-size blocks, scores each block with one NumPy product
+and keeps a running top-k (ann_index.RunningTopK), so peak memory is one
+block whatever the corpus size. Only the final k rows' text and metadata
+are read. Filters (source, file type, upload time) become SQL predicates.
+
+The embedding column precedes the text in each record and pages are 8 KiB,
+so a 1024-dim embedding (4 KiB) stays on the row's main page and the scan
+never follows the text's overflow pages.
+
+Keyword search uses an FTS5 table (bm25 with the same k1/b as
+lexical_index.LexicalIndex) over the output of lexical_index.tokenize, so
+compound tokens such as error codes match as in the in-memory store.
+
+SQLite's own locking and WAL journal make the file safe to share between
+threads and worker processes; each thread gets its own connection.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.database.ann_index import RunningTopK
+from app.database.lexical_index import tokenize
+from app.database.metadata_columns import MetadataFilter, parse_filters
+from app.database.vector_persistence import normalize_rows
+from app.database.vector_store_base import VectorStore, empty_result, stamp_upload_time
+
+IS_VERCEL = os.environ.get("VERCEL") == "1"
+SQLITE_PATH = os.environ.get("VECTOR_SQLITE_PATH") or (
+    "/tmp/vector_store.sqlite3" if IS_VERCEL else os.path.join(os.path.dirname(__file__), "..", "..", "vector_store.sqlite3")
+)
+# Rows fetched and scored per block of a search scan (peak search memory is ~3 copies of one block)
+SCAN_BLOCK = int(os.environ.get("VECTOR_SQLITE_BLOCK", "1024"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    user_id TEXT,
+    source TEXT,
+    file_type TEXT,
+    uploaded_at REAL,
+    embedding BLOB NOT NULL,
+    document TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_user_source ON chunks (user_id, source);
+CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5 (
+    terms, content='', tokenize="unicode61 tokenchars '-_./'"
+);
+"""
+
+
+def _file_type(source: Optional[str]) -> Optional[str]:
+    return os.path.splitext(source)[1].lower() if isinstance(source, str) else None
+
+
+def _terms(document: str) -> str:
+    return " ".join(tokenize(document or ""))
+
+
+def _where(user_id: Optional[str], flt: Optional[MetadataFilter]):
+    """SQL predicate and parameters for a search scope"""
+    clauses, params = [], []
+    if user_id:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if flt is not None:
+        if flt.sources is not None:
+            clauses.append(f"source IN ({', '.join('?' * len(flt.sources))})")
+            params.extend(flt.sources)
+        if flt.file_types is not None:
+            clauses.append(f"file_type IN ({', '.join('?' * len(flt.file_types))})")
+            params.extend(flt.file_types)
+        if flt.uploaded_after is not None:
+            clauses.append("uploaded_at > ?")
+            params.append(flt.uploaded_after)
+    if not clauses:
+        return "", params
+    return " WHERE " + " AND ".join(clauses), params
+
+
+class SQLiteVectorStore(VectorStore):
+    def __init__(self, path: str = None, scan_block: int = None):
+        self.path = path or SQLITE_PATH
+        self.scan_block = scan_block or SCAN_BLOCK
+        self._local = threading.local()
+        conn = self._conn()
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks'").fetchone():
+            # Only takes effect before the first table is created (and before WAL mode)
+            conn.execute("PRAGMA journal_mode = DELETE")
+            conn.execute("PRAGMA page_size = 8192")
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA journal_mode = WAL")
+        with conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, ids: List[str], documents: List[str], embeddings: List[List[float]], metadatas: List[Dict]):
+        """Insert chunks and their FTS terms in one transaction"""
+        vecs = normalize_rows(embeddings)
+        metadatas = stamp_upload_time(metadatas)
+        conn = self._conn()
+        with conn:
+            for chunk_id, document, vec, m in zip(ids, documents, vecs, metadatas):
+                uploaded_at = m.get("uploaded_at")
+                cursor = conn.execute(
+                    "INSERT INTO chunks (id, user_id, source, file_type, uploaded_at, embedding, document, metadata)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        chunk_id,
+                        m.get("user_id"),
+                        m.get("source"),
+                        _file_type(m.get("source")),
+                        uploaded_at if isinstance(uploaded_at, (int, float)) else None,
+                        vec.tobytes(),
+                        document,
+                        json.dumps(m),
+                    ),
+                )
+                conn.execute("INSERT INTO chunks_fts (rowid, terms) VALUES (?, ?)", (cursor.lastrowid, _terms(document)))
+
+    def _scan(self, user_id: Optional[str], flt: Optional[MetadataFilter], queries: np.ndarray, k: int):
+        """Exact top-k per query over the scoped rows, fetched and scored SCAN_BLOCK rows at a time"""
+        where, params = _where(user_id, flt)
+        cursor = self._conn().execute(f"SELECT rowid, embedding FROM chunks{where}", params)
+        best = RunningTopK(k, len(queries))
+        while True:
+            block = cursor.fetchmany(self.scan_block)
+            if not block:
+                break
+            rows = np.fromiter((row for row, _ in block), dtype=np.int64, count=len(block))
+            vectors = np.frombuffer(b"".join(blob for _, blob in block), dtype=np.float32).reshape(len(block), -1)
+            best.push(rows, vectors @ queries.T)
+        return best.result()
+
+    def _fetch(self, rows: np.ndarray) -> Dict[int, tuple]:
+        """rowid -> (id, document, metadata, embedding) for a few rows"""
+        rows = [int(row) for row in rows]
+        if not rows:
+            return {}
+        cursor = self._conn().execute(
+            f"SELECT rowid, id, document, metadata, embedding FROM chunks WHERE rowid IN ({', '.join('?' * len(rows))})",
+            rows,
+        )
+        return {
+            row: (chunk_id, document, json.loads(metadata), np.frombuffer(blob, dtype=np.float32))
+            for row, chunk_id, document, metadata, blob in cursor
+        }
+
+    def _results(self, hits, score_key: str = "distances") -> Dict[str, Any]:
+        result = empty_result(0, score_key)
+        for rows, scores in hits:
+            fetched = self._fetch(rows)
+            found = [(fetched[int(row)], score) for row, score in zip(rows, scores) if int(row) in fetched]
+            result["ids"].append([chunk_id for (chunk_id, _, _, _), _ in found])
+            result["documents"].append([document for (_, document, _, _), _ in found])
+            result["metadatas"].append([metadata for (_, _, metadata, _), _ in found])
+            result["embeddings"].append([vector for (_, _, _, vector), _ in found])
+            if score_key == "distances":
+                result["distances"].append([float(1 - score) for _, score in found])
+            else:
+                result[score_key].append([float(score) for _, score in found])
+        return result
+
+    def search(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        user_id: str = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Search for similar documents using cosine similarity, filtered by user_id.
+
+        Args:
+            filters: Optional structured filter; see MetadataFilter
+        """
+        return self.search_many([query_embedding], n_results, user_id=user_id, filters=filters)
+
+    def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 5,
+        user_id: str = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Search for a batch of queries in a single scan, one matrix-matrix product per block"""
+        flt = parse_filters(filters)
+        queries = normalize_rows(query_embeddings)
+        if len(queries) == 0:
+            return empty_result(0)
+        return self._results(self._scan(user_id, flt, queries, n_results))
+
+    def search_lexical(
+        self,
+        query: str,
+        n_results: int = 5,
+        user_id: str = None,
+        filters: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Rank chunks by BM25 through the FTS5 index.
+
+        Returns the same shape as search() with "scores" (BM25, higher is
+        better) instead of "distances", plus the hits' cosine "distances"
+        if query_embedding is given.
+        """
+        flt = parse_filters(filters)
+        tokens = set(tokenize(query))
+        if not tokens:
+            return super().search_lexical(query, n_results, user_id, filters, query_embedding)
+        match = " OR ".join('"' + token.replace('"', '""') + '"' for token in tokens)
+        where, params = _where(user_id, flt)
+        where = where.replace(" WHERE ", " AND ", 1)
+        cursor = self._conn().execute(
+            "SELECT chunks.rowid, -bm25(chunks_fts) AS score FROM chunks_fts"
+            " JOIN chunks ON chunks.rowid = chunks_fts.rowid"
+            f" WHERE chunks_fts MATCH ?{where} ORDER BY score DESC LIMIT ?",
+            [match, *params, n_results],
+        )
+        hits = cursor.fetchall()
+        rows = np.array([row for row, _ in hits], dtype=np.int64)
+        scores = np.array([score for _, score in hits], dtype=np.float32)
+        result = self._results([(rows, scores)], score_key="scores")
+        if query_embedding is not None:
+            query_vec = normalize_rows([query_embedding])[0]
+            result["distances"] = [[float(1 - vector @ query_vec) for vector in result["embeddings"][0]]]
+        return result
+
+    def count(self, user_id: str = None) -> int:
+        where, params = _where(user_id, None)
+        return self._conn().execute(f"SELECT COUNT(*) FROM chunks{where}", params).fetchone()[0]
+
+    def get_all_sources(self, user_id: str = None) -> List[str]:
+        where, params = _where(user_id, None)
+        cursor = self._conn().execute(f"SELECT DISTINCT source FROM chunks{where}", params)
+        return [source for (source,) in cursor if source is not None]
+
+    def delete_by_source(self, source: str, user_id: str = None, ids: Optional[List[str]] = None):
+        """Delete all chunks from a specific source (or only those with these ids), scoped to user"""
+        where, params = _where(user_id, MetadataFilter({"source": source}))
+        # ids are matched a batch at a time to stay under SQLite's limit on query parameters
+        scopes = [(where, params)] if ids is None else [
+            (f"{where} AND id IN ({', '.join('?' * len(batch))})", params + list(batch))
+            for batch in (ids[i:i + 500] for i in range(0, len(ids), 500))
+        ]
+        conn = self._conn()
+        with conn:
+            for scope_where, scope_params in scopes:
+                # The FTS table keeps no text, so entries are removed by re-supplying their terms
+                for row, document in conn.execute(
+                    f"SELECT rowid, document FROM chunks{scope_where}", scope_params
+                ).fetchall():
+                    conn.execute(
+                        "INSERT INTO chunks_fts (chunks_fts, rowid, terms) VALUES ('delete', ?, ?)", (row, _terms(document))
+                    )
+                conn.execute(f"DELETE FROM chunks{scope_where}", scope_params)
+
+    def checkpoint(self):
+        """Fold the SQLite WAL back into the database file"""
+        self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
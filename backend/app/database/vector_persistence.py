@@ -0,0 +1,551 @@
+"""
+Binary on-disk format for the vector store.
+
+A store directory holds numbered snapshot generations plus a CURRENT
+pointer file that is swapped atomically once a generation is complete:
+
+    CURRENT                  -> "snapshot-000003"
+    snapshot-000003/
+        embeddings.npy       float32 (n, d), unit-normalized, opened with np.memmap
+        ids.bin / ids.idx.npy              UTF-8 strings packed with int64 offsets
+        documents.bin / documents.idx.npy
+        metadatas.json       string dictionaries and off-schema values for the metadata columns
+                             (a list of per-row dicts in format 1 snapshots)
+        <name>.npy           named arrays (metadata columns, quantized codes), memory-mapped
+    wal-000003.log           records appended since snapshot-000003 was written
+    LOCK                     flock()ed by writers (exclusive) and refreshing readers (shared)
+    CHECKPOINT.LOCK          flock()ed by the one process writing a new generation
+    VERSION                  uint64 commit counter, memory-mapped by every process
+
+The WAL is named after the generation it applies on top of, so a crash
+between publishing a snapshot and removing the old log never replays
+records twice.
+
+Several processes (uvicorn workers) may open the same directory. They
+share the snapshot through the page cache, take turns writing under
+LOCK, and notice each other's commits by polling VERSION.
+"""
+
+import json
+import os
+import shutil
+import struct
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+FORMAT_VERSION = 2
+CURRENT_FILE = "CURRENT"
+SNAPSHOT_PREFIX = "snapshot-"
+WAL_PREFIX = "wal-"
+LOCK_FILE = "LOCK"
+CHECKPOINT_LOCK_FILE = "CHECKPOINT.LOCK"
+VERSION_FILE = "VERSION"
+
+# Record frame: header length, payload length, then header JSON, float32 payload, crc32
+_FRAME = struct.Struct("<II")
+_CRC = struct.Struct("<I")
+
+
+class PackedStrings(Sequence):
+    """Read-only UTF-8 strings stored back to back in one buffer, indexed by offsets"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @classmethod
+    def open(cls, path: str) -> "PackedStrings":
+        offsets = np.load(path + ".idx.npy")
+        if offsets[-1] == 0:
+            return cls(np.zeros(0, dtype=np.uint8), offsets)
+        return cls(np.memmap(path + ".bin", dtype=np.uint8, mode="r"), offsets)
+
+    @staticmethod
+    def write(path: str, strings: Sequence[str], rows: Optional[np.ndarray] = None):
+        """Pack strings (or just strings[rows], in that order) into path.bin / path.idx.npy"""
+        count = len(strings) if rows is None else len(rows)
+        values = strings if rows is None else (strings[int(r)] for r in rows)
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        with open(path + ".bin", "wb") as f:
+            for i, s in enumerate(values):
+                data = s.encode("utf-8")
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        np.save(path + ".idx.npy", offsets)
+
+
+class StringColumn(Sequence):
+    """Packed strings from a snapshot followed by strings appended since"""
+
+    def __init__(self, base: Optional[Sequence[str]] = None, tail: Optional[List[str]] = None):
+        self._base = base if base is not None else []
+        self._tail = tail if tail is not None else []
+
+    def __len__(self) -> int:
+        return len(self._base) + len(self._tail)
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        n_base = len(self._base)
+        return self._base[i] if i < n_base else self._tail[i - n_base]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._base
+        yield from self._tail
+
+    def extend(self, values: Sequence[str]):
+        self._tail.extend(values)
+
+
+class ArrayColumn:
+    """
+    Rows from a snapshot (usually a read-only memmap) followed by rows
+    appended since, kept in a buffer that grows by amortized doubling.
+    """
+
+    def __init__(self, base: Optional[np.ndarray] = None, dtype=np.float32, width: Optional[int] = None):
+        self._base = base
+        self.dtype = np.dtype(base.dtype if base is not None else dtype)
+        self.width = base.shape[1] if base is not None and base.ndim == 2 else width
+        self._tail: Optional[np.ndarray] = None
+        self._tail_size = 0
+
+    @property
+    def n_base(self) -> int:
+        return len(self._base) if self._base is not None else 0
+
+    def __len__(self) -> int:
+        return self.n_base + self._tail_size
+
+    @property
+    def tail_nbytes(self) -> int:
+        """Anonymous memory held by the tail buffer (the base is file-backed)"""
+        return self._tail.nbytes if self._tail is not None else 0
+
+    def append(self, rows: np.ndarray):
+        rows = np.asarray(rows, dtype=self.dtype)
+        if len(rows) == 0:
+            return
+        if self.width is None and rows.ndim == 2:
+            self.width = rows.shape[1]
+        needed = self._tail_size + len(rows)
+        if self._tail is None or needed > len(self._tail):
+            capacity = max(needed, 2 * (len(self._tail) if self._tail is not None else 0), 64)
+            grown = np.empty((capacity,) + rows.shape[1:], dtype=self.dtype)
+            if self._tail is not None:
+                grown[:self._tail_size] = self._tail[:self._tail_size]
+            self._tail = grown
+        self._tail[self._tail_size:needed] = rows
+        self._tail_size = needed
+
+    def frozen(self) -> "ArrayColumn":
+        """
+        Read-only view of the rows present now. It shares the buffers: later
+        appends only write past its end or move to a new buffer, so the view
+        never changes. Never append to the view itself.
+        """
+        view = ArrayColumn(base=self._base, dtype=self.dtype, width=self.width)
+        view._tail = self._tail
+        view._tail_size = self._tail_size
+        return view
+
+    def segments(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """(first row, array) for the base and the tail"""
+        if self.n_base:
+            yield 0, self._base
+        if self._tail_size:
+            yield self.n_base, self._tail[:self._tail_size]
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """Gather rows by index into a new in-memory array"""
+        rows = np.asarray(rows, dtype=np.int64)
+        n_base = self.n_base
+        if self._tail_size == 0:
+            if self._base is None:
+                return np.empty((0, self.width or 0), dtype=self.dtype)
+            return np.asarray(self._base[rows])
+        if n_base == 0:
+            return self._tail[rows]
+        out = np.empty((len(rows),) + self._tail.shape[1:], dtype=self.dtype)
+        in_base = rows < n_base
+        out[in_base] = self._base[rows[in_base]]
+        out[~in_base] = self._tail[rows[~in_base] - n_base]
+        return out
+
+    def materialize(self) -> np.ndarray:
+        parts = [np.asarray(a) for _, a in self.segments()]
+        if not parts:
+            return np.empty((0, self.width or 0), dtype=self.dtype)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+# Rows copied per block when a snapshot keeps only some rows
+_WRITE_BLOCK = 65536
+
+
+def _save_array(path: str, array, rows: Optional[np.ndarray] = None):
+    """Write an ndarray or ArrayColumn (or just its rows) as .npy, streaming in blocks"""
+    if not isinstance(array, ArrayColumn):
+        array = ArrayColumn(base=np.asarray(array))
+    count = len(array) if rows is None else len(rows)
+    shape = (count,) + ((array.width,) if array.width is not None else ())
+    if count == 0:
+        np.save(path, np.empty(shape, dtype=array.dtype))
+        return
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=array.dtype, shape=shape)
+    if rows is None:
+        for start, segment in array.segments():
+            out[start:start + len(segment)] = segment
+    else:
+        for start in range(0, count, _WRITE_BLOCK):
+            block = rows[start:start + _WRITE_BLOCK]
+            out[start:start + len(block)] = array.take(block)
+    out.flush()
+    del out
+
+
+def _fsync(path: str):
+    """Flush a file's data, or a directory's entries, to disk"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except (IsADirectoryError, PermissionError):
+        # Windows can't open directories; NTFS journals their entries itself
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _snapshot_dir(store_dir: str, generation: int) -> str:
+    return os.path.join(store_dir, f"{SNAPSHOT_PREFIX}{generation:06d}")
+
+
+def wal_path(store_dir: str, generation: Optional[int]) -> str:
+    return os.path.join(store_dir, f"{WAL_PREFIX}{generation or 0:06d}.log")
+
+
+def current_generation(store_dir: str) -> Optional[int]:
+    """Generation number named by CURRENT, or None if no snapshot exists"""
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        return int(name[len(SNAPSHOT_PREFIX):])
+    except (OSError, ValueError):
+        return None
+
+
+def read_snapshot(
+    store_dir: str, generation: Optional[int] = None
+) -> Optional[Tuple[StringColumn, StringColumn, np.ndarray, Any, Dict[str, np.ndarray]]]:
+    """
+    Open the current snapshot (or a given, possibly unpublished, generation).
+    Embeddings are memory-mapped read-only and strings are decoded lazily,
+    so this costs little beyond parsing metadatas.json.
+
+    Returns:
+        (ids, documents, embeddings, metadatas, arrays) or None if there is no snapshot
+    """
+    if generation is None:
+        generation = current_generation(store_dir)
+    if generation is None:
+        return None
+    path = _snapshot_dir(store_dir, generation)
+
+    embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    ids = StringColumn(PackedStrings.open(os.path.join(path, "ids")))
+    documents = StringColumn(PackedStrings.open(os.path.join(path, "documents")))
+    with open(os.path.join(path, "metadatas.json"), "r", encoding="utf-8") as f:
+        metadatas = json.load(f)
+    arrays = {
+        name[:-len(".npy")]: np.load(os.path.join(path, name), mmap_mode="r")
+        for name in os.listdir(path)
+        if name.endswith(".npy") and not name.endswith(".idx.npy") and name != "embeddings.npy"
+    }
+    return ids, documents, embeddings, metadatas, arrays
+
+
+def write_generation(
+    store_dir: str,
+    generation: int,
+    ids: Sequence[str],
+    documents: Sequence[str],
+    embeddings,
+    metadatas: Any,
+    arrays: Optional[Dict[str, Any]] = None,
+    rows: Optional[np.ndarray] = None,
+) -> str:
+    """
+    Write (and fsync) the files of a snapshot generation without publishing it.
+    embeddings and arrays may be ndarrays or ArrayColumns; if rows is given,
+    only those rows are kept (this is how deleted rows are reclaimed).
+    metadatas is written as-is, except that a list of per-row dicts is
+    subset by rows too. Returns the generation's directory.
+    """
+    path = _snapshot_dir(store_dir, generation)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+    _save_array(os.path.join(path, "embeddings.npy"), embeddings, rows)
+    for name, array in (arrays or {}).items():
+        _save_array(os.path.join(path, f"{name}.npy"), array, rows)
+    PackedStrings.write(os.path.join(path, "ids"), ids, rows)
+    PackedStrings.write(os.path.join(path, "documents"), documents, rows)
+    if rows is not None and isinstance(metadatas, list):
+        metadatas = [metadatas[int(r)] for r in rows]
+    with open(os.path.join(path, "metadatas.json"), "w", encoding="utf-8") as f:
+        json.dump(metadatas, f, separators=(",", ":"))
+    with open(os.path.join(path, "FORMAT"), "w", encoding="utf-8") as f:
+        f.write(str(FORMAT_VERSION))
+    # The generation must be on disk before CURRENT names it: the WAL that
+    # could rebuild it is deleted when it is published
+    for name in os.listdir(path):
+        _fsync(os.path.join(path, name))
+    _fsync(path)
+    return path
+
+
+def publish_generation(store_dir: str, generation: int):
+    """Point CURRENT at a written generation, then drop older snapshots and logs"""
+    path = _snapshot_dir(store_dir, generation)
+    tmp = os.path.join(store_dir, CURRENT_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(path))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(store_dir, CURRENT_FILE))
+    # Persist the new CURRENT and snapshot directory entries before the old WAL goes
+    _fsync(store_dir)
+
+    for name in os.listdir(store_dir):
+        if name.startswith(WAL_PREFIX) and name != os.path.basename(wal_path(store_dir, generation)):
+            os.remove(os.path.join(store_dir, name))
+        elif name.startswith(SNAPSHOT_PREFIX) and name != os.path.basename(path):
+            # Open memmaps keep the old inode alive on POSIX; on Windows the
+            # directory is left behind and removed on a later snapshot
+            shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
+
+
+def write_snapshot(
+    store_dir: str,
+    ids: Sequence[str],
+    documents: Sequence[str],
+    embeddings,
+    metadatas: Any,
+    arrays: Optional[Dict[str, Any]] = None,
+    rows: Optional[np.ndarray] = None,
+) -> int:
+    """Write a new snapshot generation, publish it via CURRENT and drop older ones (see write_generation)"""
+    os.makedirs(store_dir, exist_ok=True)
+    generation = (current_generation(store_dir) or 0) + 1
+    write_generation(store_dir, generation, ids, documents, embeddings, metadatas, arrays, rows)
+    publish_generation(store_dir, generation)
+    return generation
+
+
+def start_wal(store_dir: str, generation: int, carried_from: Optional[str] = None, offset: int = 0):
+    """
+    Create the (empty) WAL of a generation that is about to be published,
+    seeded with the records of carried_from past offset: those committed
+    while the generation was being written, which it doesn't contain.
+    Overwrites a log left by an earlier attempt that never got published.
+    """
+    path = wal_path(store_dir, generation)
+    with open(path, "wb") as out:
+        if carried_from is not None and os.path.exists(carried_from):
+            with open(carried_from, "rb") as f:
+                f.seek(offset)
+                shutil.copyfileobj(f, out)
+        out.flush()
+        os.fsync(out.fileno())
+
+
+def normalize_rows(embeddings) -> np.ndarray:
+    vecs = np.asarray(embeddings, dtype=np.float32)
+    if vecs.ndim != 2:
+        return np.empty((0, 0), dtype=np.float32)
+    return vecs / (np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-10)
+
+
+def migrate_json_store(json_path: str, store_dir: str) -> bool:
+    """
+    One-time migration from the legacy single-file vector_store.json.
+    The JSON file is renamed to *.migrated once the snapshot is published.
+
+    Returns:
+        True if a legacy file was migrated
+    """
+    if not os.path.exists(json_path) or current_generation(store_dir) is not None:
+        return False
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    write_snapshot(
+        store_dir,
+        ids=data.get("ids", []),
+        documents=data.get("documents", []),
+        embeddings=normalize_rows(data.get("embeddings", [])),
+        metadatas=data.get("metadatas", []),
+    )
+    os.replace(json_path, json_path + ".migrated")
+    return True
+
+
+class WriteAheadLog:
+    """
+    Append-only log of store mutations since the last snapshot.
+
+    Each record is a JSON header (op, ids, documents, metadatas, ...) plus an
+    optional float32 matrix, framed with lengths and a CRC so a torn write
+    at the tail is detected and discarded on replay.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Bytes of the log already applied to the in-memory store
+        self.size_bytes = 0
+        self._file = None
+
+    def replay(self) -> Iterator[Tuple[Dict[str, Any], Optional[np.ndarray]]]:
+        """
+        Yield (header, vectors) for every intact record after the ones already
+        applied, truncating any torn tail. Calling it again later picks up
+        records appended since, e.g. by another process.
+        """
+        if not os.path.exists(self.path):
+            return
+        good = self.size_bytes
+        with open(self.path, "rb") as f:
+            f.seek(good)
+            while True:
+                frame = f.read(_FRAME.size)
+                if len(frame) < _FRAME.size:
+                    break
+                header_len, payload_len = _FRAME.unpack(frame)
+                body = f.read(header_len + payload_len)
+                crc = f.read(_CRC.size)
+                if len(body) < header_len + payload_len or len(crc) < _CRC.size:
+                    break
+                if zlib.crc32(frame + body) != _CRC.unpack(crc)[0]:
+                    break
+                header = json.loads(body[:header_len].decode("utf-8"))
+                vectors = None
+                if payload_len:
+                    vectors = np.frombuffer(body[header_len:], dtype=np.float32).reshape(-1, header["dim"])
+                good = f.tell()
+                self.size_bytes = good
+                yield header, vectors
+
+        if good < os.path.getsize(self.path):
+            print(f"VECTOR STORE WAL: discarding torn tail of {self.path} at byte {good}")
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+
+    def append(self, header: Dict[str, Any], vectors: Optional[np.ndarray] = None):
+        """Append one record and fsync it before returning"""
+        payload = b""
+        if vectors is not None:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            header = {**header, "dim": vectors.shape[1]}
+            payload = vectors.tobytes()
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        frame = _FRAME.pack(len(header_bytes), len(payload))
+        body = header_bytes + payload
+        record = frame + body + _CRC.pack(zlib.crc32(frame + body))
+
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "ab")
+        self._file.write(record)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.size_bytes += len(record)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StoreLock:
+    """
+    Cross-process reader/writer lock on a store directory, via flock() on
+    its LOCK file. Re-entrant within a process, provided callers already
+    serialize their threads (the store holds its own lock around this one).
+    Without fcntl it only counts, which is enough for a single process.
+    """
+
+    def __init__(self, store_dir: str, name: str = LOCK_FILE):
+        os.makedirs(store_dir, exist_ok=True)
+        self._fd = os.open(os.path.join(store_dir, name), os.O_RDWR | os.O_CREAT) if fcntl else None
+        self._depth = 0
+
+    def acquire(self, exclusive: bool = True, blocking: bool = True) -> bool:
+        if self._depth == 0 and self._fd is not None:
+            flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            try:
+                fcntl.flock(self._fd, flags if blocking else flags | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def hold(self, exclusive: bool = True):
+        self.acquire(exclusive)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class StoreVersion:
+    """
+    Commit counter shared by every process that opens a store directory.
+
+    An 8-byte file mapped MAP_SHARED, so a writer's bump is visible to
+    other processes immediately and checking it costs one memory read.
+    Only a hint: readers re-check the snapshot and WAL under StoreLock.
+    """
+
+    def __init__(self, store_dir: str):
+        os.makedirs(store_dir, exist_ok=True)
+        path = os.path.join(store_dir, VERSION_FILE)
+        with open(path, "ab") as f:
+            if f.tell() < 8:
+                f.write(b"\0" * (8 - f.tell()))
+        self._counter = np.memmap(path, dtype=np.uint64, mode="r+", shape=(1,))
+
+    def read(self) -> int:
+        return int(self._counter[0])
+
+    def bump(self) -> int:
+        self._counter[0] += 1
+        return int(self._counter[0])
@@ -2,133 +2,894 @@
 Simple In-Memory Vector Store (Python 3.14 compatible)
 Uses numpy for cosine similarity - no external vector DB needed.
 Supports per-user data isolation via user_id in metadata.
+Persisted as memory-mapped binary snapshots plus an append-only
+write-ahead log (see vector_persistence.py).
+
+Chunk metadata is held column-wise (see metadata_columns.py); searches
+take structured filters (source, file type, upload time) that are applied
+as NumPy masks before any vector is scored. search_lexical() ranks the
+same chunks by BM25 over their text, for exact terms such as error codes.
+
+Deletes only set tombstones; rows are physically reclaimed when the
+store is compacted into a new snapshot in a background thread.
+
+Writers are serialized by a lock and publish each new version of the
+store by swapping in an immutable view; searches read whichever view
+was current when they started and never block or see a partial write.
+
+Each uvicorn worker process opens its own store on the same directory.
+The snapshot is memory-mapped, so its pages are shared rather than
+copied per worker. Writes from any worker take an exclusive file lock,
+first catch up on other workers' WAL records, then bump a shared
+version counter; every search checks that counter and catches up
+before running, so an upload is searchable on all workers as soon as
+its add() returns. A search waits at most VECTOR_REFRESH_WAIT_MS for a
+write in progress to finish; past that it runs on the version it has,
+and a later search catches up.
+
+VECTOR_BACKEND=sqlite switches the module-level store to
+SQLiteVectorStore (sqlite_vector_store.py), which keeps chunks on disk
+and streams them through a blocked scan instead of holding them in RAM.
 """
 
 import numpy as np
 from typing import List, Dict, Any, Optional
-import json
 import os
+import threading
+import time
+
+from app.database.ann_index import IVFIndex, RunningTopK, top_k_indices
+from app.database.lexical_index import LexicalIndex, tokenize
+from app.database.metadata_columns import MetadataColumns, MetadataFilter, parse_filters
+from app.database.quantization import QuantizedIndex
+from app.database.vector_persistence import (
+    CHECKPOINT_LOCK_FILE,
+    ArrayColumn,
+    StoreLock,
+    StoreVersion,
+    StringColumn,
+    WriteAheadLog,
+    current_generation,
+    migrate_json_store,
+    normalize_rows,
+    publish_generation,
+    read_snapshot,
+    start_wal,
+    wal_path,
+    write_generation,
+)
+from app.database.vector_store_base import VectorStore, empty_result, stamp_upload_time
+
+# "memory" (SimpleVectorStore) or "sqlite" (SQLiteVectorStore)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "memory")
 
 # Simple file-based persistence
 IS_VERCEL = os.environ.get("VERCEL") == "1"
-STORE_PATH = "/tmp/vector_store.json" if IS_VERCEL else os.path.join(os.path.dirname(__file__), "..", "..", "vector_store.json")
+STORE_DIR = "/tmp/vector_store" if IS_VERCEL else os.path.join(os.path.dirname(__file__), "..", "..", "vector_store")
+# Pre-binary single-file format, migrated into STORE_DIR on first load
+LEGACY_STORE_PATH = "/tmp/vector_store.json" if IS_VERCEL else os.path.join(os.path.dirname(__file__), "..", "..", "vector_store.json")
+# Fold the WAL into a new snapshot once it grows past this size
+WAL_CHECKPOINT_BYTES = int(os.environ.get("VECTOR_WAL_CHECKPOINT_MB", "64")) * 1024 * 1024
+# "exact" (brute force) or "ivf" (approximate, for tenants above VECTOR_ANN_MIN_ROWS chunks)
+VECTOR_INDEX = os.environ.get("VECTOR_INDEX", "exact")
+ANN_MIN_ROWS = int(os.environ.get("VECTOR_ANN_MIN_ROWS", "50000"))
+ANN_N_PROBE = int(os.environ.get("VECTOR_ANN_N_PROBE", "16"))
+# "none", "float16", "int8" or "binary" codes for the main scan; float32 rows are only
+# read (from the memory-mapped snapshot) to rescore the top candidates
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "none")
+VECTOR_BINARY_PREFILTER = os.environ.get("VECTOR_BINARY_PREFILTER") == "true"
+# Compact in the background once this fraction of rows are tombstones
+COMPACT_DEAD_RATIO = float(os.environ.get("VECTOR_COMPACT_DEAD_RATIO", "0.2"))
+# Longest a search waits behind a write to catch up on other workers' records
+REFRESH_WAIT_SECONDS = float(os.environ.get("VECTOR_REFRESH_WAIT_MS", "200")) / 1000
+# A lexical search builds a missing BM25 index inline for partitions up to this many
+# chunks rather than leave them without keyword hits until the background build is done
+LEXICAL_INLINE_ROWS = int(os.environ.get("VECTOR_LEXICAL_INLINE_ROWS", "20000"))
+# Rows scored per matrix-matrix product in search_many (bounds the score block to rows x queries)
+BATCH_SEARCH_BLOCK = 16384
+
+
+def _grow(array: np.ndarray, used: int, needed: int) -> np.ndarray:
+    """Return array with capacity >= needed (amortized doubling), keeping [:used]"""
+    if needed <= len(array):
+        return array
+    grown = np.zeros(max(needed, 2 * len(array), 16), dtype=array.dtype)
+    grown[:used] = array[:used]
+    return grown
+
+
+class _Partition:
+    """
+    Live row indices and per-source rows for one user_id.
+    
+    Never modified once it is in a published state: writers derive a new
+    partition and swap it in. Appends share the row buffer, since they only
+    write past the end of the rows this partition can see.
+    """
+    
+    def __init__(self, rows: np.ndarray = None, size: int = None, sources: Dict[str, List[int]] = None):
+        self._rows = rows if rows is not None else np.empty(0, dtype=np.int64)
+        self._size = len(self._rows) if size is None else size
+        self.sources: Dict[str, List[int]] = sources if sources is not None else {}
+    
+    @property
+    def rows(self) -> np.ndarray:
+        return self._rows[:self._size]
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def appended(self, rows: np.ndarray, sources: Dict[str, List[int]]) -> "_Partition":
+        needed = self._size + len(rows)
+        buffer = _grow(self._rows, self._size, needed)
+        buffer[self._size:needed] = rows
+        merged = dict(self.sources)
+        for source, source_rows in sources.items():
+            merged[source] = merged.get(source, []) + source_rows
+        return _Partition(buffer, needed, merged)
+    
+    def without(self, source: str, dead: np.ndarray) -> "_Partition":
+        """Copy without the rows of a source that were just tombstoned (all or some of them)"""
+        rows = self.rows
+        sources = dict(self.sources)
+        left = [row for row in sources[source] if not dead[row]]
+        if left:
+            sources[source] = left
+        else:
+            del sources[source]
+        return _Partition(rows[~dead[rows]], sources=sources)
+    
+    def remapped(self, new_index: np.ndarray) -> "_Partition":
+        """Copy of this partition with rows renumbered after compaction"""
+        return _Partition(
+            new_index[self.rows],
+            sources={s: new_index[rows].tolist() for s, rows in self.sources.items()},
+        )
 
 
-class SimpleVectorStore:
-    def __init__(self):
-        self.documents: List[str] = []
-        self.embeddings: List[List[float]] = []
-        self.metadatas: List[Dict[str, Any]] = []
-        self.ids: List[str] = []
-        self._load()
+class _State:
+    """
+    Everything addressed by row number.
+    
+    The writer owns the live state and mutates it under the store lock;
+    searches only ever see a frozen() copy of it, published by swapping one
+    attribute. Row data (ids, documents, metadatas, vector buffers) is
+    append-only within a state, so freezing is cheap: it records the current
+    size and copies the small partition map. Anything that renumbers rows
+    (compaction) builds a new _State instead.
+    """
+    
+    def __init__(self, vectors: ArrayColumn, quantized: Optional[QuantizedIndex] = None):
+        self.ids: StringColumn = StringColumn()
+        self.documents: StringColumn = StringColumn()
+        self.metadatas = MetadataColumns()
+        # Unit-normalized float32 rows: memory-mapped snapshot plus an in-memory tail
+        self.vectors = vectors
+        self.quantized = quantized
+        # user_id -> _Partition, so tenant-scoped operations never touch other tenants' rows
+        self.partitions: Dict[Optional[str], _Partition] = {}
+        # user_id -> IVF index over that partition. Shared by every frozen copy of this
+        # state: searches drop rows past their own size and rows dead in their own mask
+        self.ann: Dict[Optional[str], IVFIndex] = {}
+        # user_id -> BM25 index over that partition's text, built in the background after
+        # the partition's first lexical search (which builds its own meanwhile if the
+        # partition is small). Shared by frozen copies like ann
+        self.lexical: Dict[Optional[str], LexicalIndex] = {}
+        # Tombstones for deleted rows, dropped at the next compaction. Replaced, not
+        # modified, on delete; only grown (with False) on add
+        self.dead = np.zeros(0, dtype=bool)
+        self.n_dead = 0
+    
+    @property
+    def size(self) -> int:
+        return len(self.vectors)
+    
+    def frozen(self) -> "_State":
+        """Immutable view of the rows and partitions present now"""
+        state = _State(self.vectors.frozen(), self.quantized.frozen() if self.quantized is not None else None)
+        state.ids, state.documents, state.metadatas = self.ids, self.documents, self.metadatas.frozen()
+        state.partitions = dict(self.partitions)
+        state.ann = self.ann
+        state.lexical = self.lexical
+        state.dead = self.dead
+        state.n_dead = self.n_dead
+        return state
+
+
+class SimpleVectorStore(VectorStore):
+    def __init__(
+        self,
+        store_dir: str = None,
+        index_type: str = None,
+        ann_min_rows: int = None,
+        quantization: str = None,
+        binary_prefilter: bool = None,
+        compact_dead_ratio: float = None,
+    ):
+        self.store_dir = store_dir or STORE_DIR
+        self.index_type = index_type or VECTOR_INDEX
+        if self.index_type not in ("exact", "ivf"):
+            raise ValueError(f"Unsupported index type: {self.index_type}")
+        self.ann_min_rows = ANN_MIN_ROWS if ann_min_rows is None else ann_min_rows
+        self.quantization = quantization or VECTOR_QUANTIZATION
+        self.binary_prefilter = VECTOR_BINARY_PREFILTER if binary_prefilter is None else binary_prefilter
+        self.compact_dead_ratio = COMPACT_DEAD_RATIO if compact_dead_ratio is None else compact_dead_ratio
+        # Live state, owned by writers; searches read the frozen _snapshot instead
+        self._state = _State(ArrayColumn(), self._new_quantized())
+        self._snapshot = self._state.frozen()
+        self._generation: Optional[int] = None
+        self._wal: Optional[WriteAheadLog] = None
+        # Serializes writers (add, delete, checkpoint, installing a trained index). Searches
+        # never wait for it: _refresh only tries it, and index training runs on a background thread
+        self._lock = threading.RLock()
+        # The same, across worker processes sharing store_dir; always taken inside _lock
+        self._file_lock = StoreLock(self.store_dir)
+        # Taken before _lock by checkpoint(), which releases _lock while it writes
+        self._checkpoint_lock = threading.Lock()
+        self._checkpoint_file_lock = StoreLock(self.store_dir, CHECKPOINT_LOCK_FILE)
+        self._version = StoreVersion(self.store_dir)
+        self._seen_version = -1
+        self._compactor: Optional[threading.Thread] = None
+        # (kind, user_id) of the partition indexes being trained in the background
+        self._index_builds: set = set()
+        self._index_builds_lock = threading.Lock()
+        with self._lock, self._file_lock.hold():
+            if self.store_dir == STORE_DIR:
+                try:
+                    migrate_json_store(LEGACY_STORE_PATH, self.store_dir)
+                except Exception as e:
+                    print(f"VECTOR STORE LOAD ERROR: {str(e)}")
+            self._load()
+    
+    def _new_quantized(self) -> Optional[QuantizedIndex]:
+        if self.quantization == "none":
+            return None
+        return QuantizedIndex(self.quantization, binary_prefilter=self.binary_prefilter)
+    
+    def _state_from_snapshot(self, snapshot) -> _State:
+        """Fresh state whose ids, documents, vectors and codes point at a snapshot"""
+        ids, documents, vectors, metadatas, arrays = snapshot
+        state = _State(ArrayColumn(base=vectors))
+        state.ids, state.documents = ids, documents
+        state.metadatas = MetadataColumns.load(metadatas, arrays, len(vectors))
+        state.dead = np.zeros(len(vectors), dtype=bool)
+        if self.quantization != "none":
+            state.quantized = QuantizedIndex.load(
+                arrays, len(vectors), kind=self.quantization, binary_prefilter=self.binary_prefilter
+            )
+            if state.quantized is None:
+                # Snapshot written without (or with different) codes: encode once from the floats
+                state.quantized = self._new_quantized()
+                state.quantized.build(state.vectors)
+        return state
     
     def _load(self):
-        """Load from disk if exists"""
-        if os.path.exists(STORE_PATH):
+        """Load the latest snapshot from disk, then replay the WAL written after it"""
+        # Indexes are rebuilt from the new rows: train again the ones searches were using
+        in_use = [("ann", u) for u in self._state.ann] + [("lexical", u) for u in self._state.lexical]
+        self._seen_version = self._version.read()
+        try:
+            self._generation = current_generation(self.store_dir)
+            snapshot = read_snapshot(self.store_dir)
+        except Exception as e:
+            print(f"VECTOR STORE LOAD ERROR: {str(e)}")
+            snapshot = None
+        
+        if snapshot is not None:
+            self._state = self._state_from_snapshot(snapshot)
+            self._index_rows(self._state, 0)
+        else:
+            self._state = _State(ArrayColumn(), self._new_quantized())
+        
+        if self._wal is not None:
+            self._wal.close()
+        self._wal = WriteAheadLog(wal_path(self.store_dir, self._generation))
+        self._replay()
+        for kind, user_id in in_use:
+            self._request_index(kind, user_id)
+    
+    def _replay(self):
+        """Apply WAL records this process has not seen yet and publish the result"""
+        # Runs of adds are applied as one batch: per-call overhead dominates small uploads
+        ids, documents, vectors, metadatas = [], [], [], []
+        
+        def flush():
+            if ids:
+                self._apply_add(ids, documents, np.concatenate(vectors), metadatas)
+                ids.clear(), documents.clear(), vectors.clear(), metadatas.clear()
+        
+        for header, record_vectors in self._wal.replay():
+            if header["op"] == "add":
+                ids.extend(header["ids"])
+                documents.extend(header["documents"])
+                vectors.append(record_vectors)
+                metadatas.extend(header["metadatas"])
+            elif header["op"] == "delete":
+                flush()
+                self._apply_delete(header["source"], header.get("user_id"), header.get("ids"))
+        flush()
+        self._publish()
+    
+    def _catch_up(self):
+        """
+        Apply commits made by other processes since this one last looked.
+        Callers hold _lock and the file lock, so no writer is mid-commit.
+        """
+        version = self._version.read()
+        if version == self._seen_version:
+            return
+        if current_generation(self.store_dir) != self._generation:
+            # Another worker checkpointed: re-open its snapshot (old mappings stay valid until dropped)
+            self._load()
+        else:
+            self._replay()
+        self._seen_version = version
+    
+    def _refresh(self):
+        """
+        Called before every read. Costs one shared-memory read unless another
+        worker has committed; then waits for the locks (up to
+        REFRESH_WAIT_SECONDS, while a write is in progress) and catches up.
+        """
+        if self._version.read() == self._seen_version:
+            return
+        deadline = time.monotonic() + REFRESH_WAIT_SECONDS
+        if not self._lock.acquire(timeout=REFRESH_WAIT_SECONDS):
+            return
+        try:
+            # A writer in this process may have caught up while we waited
+            if self._version.read() == self._seen_version:
+                return
+            # flock() has no timeout: poll for the shared lock until the deadline
+            while not self._file_lock.acquire(exclusive=False, blocking=False):
+                if time.monotonic() >= deadline:
+                    return
+                time.sleep(0.001)
             try:
-                with open(STORE_PATH, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.documents = data.get("documents", [])
-                    self.embeddings = data.get("embeddings", [])
-                    self.metadatas = data.get("metadatas", [])
-                    self.ids = data.get("ids", [])
-            except Exception:
-                pass
-    
-    def _save(self):
-        """Persist to disk"""
-        os.makedirs(os.path.dirname(STORE_PATH), exist_ok=True)
-        with open(STORE_PATH, 'w', encoding='utf-8') as f:
-            json.dump({
-                "documents": self.documents,
-                "embeddings": self.embeddings,
-                "metadatas": self.metadatas,
-                "ids": self.ids
-            }, f)
+                self._catch_up()
+            finally:
+                self._file_lock.release()
+        finally:
+            self._lock.release()
+    
+    def checkpoint(self):
+        """
+        Fold the WAL into a new snapshot generation, dropping tombstoned rows,
+        and start a new log. The generation is written from a frozen view
+        with no lock held, so searches and writers carry on meanwhile; the
+        locks are only taken to freeze the view and then to swap the new
+        generation in, with the records committed while it was written
+        carried over into its log.
+        """
+        # One checkpoint at a time, across threads and across processes
+        with self._checkpoint_lock, self._checkpoint_file_lock.hold():
+            with self._lock, self._file_lock.hold():
+                self._catch_up()
+                state = self._state.frozen()
+                if self._wal.size_bytes == 0 and not state.n_dead:
+                    # Nothing to fold (e.g. every worker checkpointing at shutdown)
+                    return
+                state.metadatas = self._state.metadatas.detached()
+                generation = (self._generation or 0) + 1
+                wal_offset = self._wal.size_bytes
+            
+            n = state.size
+            alive = ~state.dead[:n]
+            # Always explicit rows: ids and documents are shared with the live state and keep growing
+            keep = np.flatnonzero(alive)
+            meta_doc, arrays = state.metadatas.persisted(keep)
+            if state.quantized is not None:
+                arrays.update(state.quantized.persisted_arrays())
+            write_generation(
+                self.store_dir, generation, state.ids, state.documents, state.vectors, meta_doc,
+                arrays=arrays, rows=keep,
+            )
+            # Re-open the new generation so in-memory tails are released to the page cache
+            new_state = self._state_from_snapshot(read_snapshot(self.store_dir, generation))
+            new_index = np.cumsum(alive) - 1
+            new_state.partitions = {
+                user_id: partition.remapped(new_index)
+                for user_id, partition in state.partitions.items()
+                if len(partition)
+            }
+            
+            with self._lock, self._file_lock.hold():
+                self._catch_up()
+                self._wal.close()
+                start_wal(self.store_dir, generation, carried_from=self._wal.path, offset=wal_offset)
+                publish_generation(self.store_dir, generation)
+                self._generation = generation
+                
+                # The indexes are shared with the live state, so they also hold rows added after
+                # the frozen view: those are dropped here and re-added by the carried records
+                live = self._state
+                alive = np.concatenate([alive, np.zeros(live.size - n, dtype=bool)])
+                new_index = np.concatenate([new_index, np.full(live.size - n, -1)])
+                new_state.ann = {
+                    user_id: index.remapped(new_index, alive)
+                    for user_id, index in live.ann.items()
+                    if user_id in new_state.partitions
+                }
+                new_state.lexical = {
+                    user_id: index.remapped(new_index, alive)
+                    for user_id, index in live.lexical.items()
+                    if user_id in new_state.partitions
+                }
+                self._state = new_state
+                self._wal = WriteAheadLog(wal_path(self.store_dir, generation))
+                self._replay()
+                self._commit()
+    
+    def _publish(self):
+        """Make the writer's state visible to searches (one attribute swap)"""
+        self._snapshot = self._state.frozen()
+    
+    def _maybe_compact(self):
+        """Start a background compaction once enough rows are tombstones"""
+        state = self._state
+        if not state.n_dead or state.n_dead < self.compact_dead_ratio * state.size:
+            return
+        self._checkpoint_in_background()
+    
+    def _checkpoint_in_background(self):
+        """Writers hold _lock, which checkpoint() must not be entered with, so they start it on a thread"""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.checkpoint, name="vector-store-compaction", daemon=True)
+        self._compactor.start()
+    
+    def _commit(self):
+        """Tell other processes a durable change is ready to pick up"""
+        self._seen_version = self._version.bump()
+    
+    def _log(self, header: Dict[str, Any], vectors: np.ndarray = None):
+        """Durably append one mutation, checkpointing when the log gets large"""
+        self._wal.append(header, vectors)
+        self._commit()
+        if self._wal.size_bytes >= WAL_CHECKPOINT_BYTES:
+            self._checkpoint_in_background()
+    
+    @staticmethod
+    def _groups(codes: np.ndarray):
+        """(code, positions) for each distinct code, positions ascending"""
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+        for positions in np.split(order, bounds):
+            if len(positions):
+                yield int(codes[positions[0]]), positions
+    
+    def _index_rows(self, state: _State, start: int):
+        """Assign rows start.. to their user's partition (and its ANN and BM25 indexes, if built)"""
+        meta = state.metadatas
+        users = meta.codes("user_id", start)
+        sources = meta.codes("source", start)
+        for user_code, positions in self._groups(users):
+            user_id = meta.decode("user_id", user_code)
+            rows = start + positions
+            by_source = {
+                meta.decode("source", source_code): (start + positions[source_positions]).tolist()
+                for source_code, source_positions in self._groups(sources[positions])
+                if source_code >= 0
+            }
+            index = state.ann.get(user_id)
+            if index is not None:
+                index.add(state.vectors.take(rows), rows)
+            lexical = state.lexical.get(user_id)
+            if lexical is not None:
+                lexical.add(rows, [state.documents[int(row)] for row in rows])
+            state.partitions[user_id] = state.partitions.get(user_id, _Partition()).appended(rows, by_source)
+    
+    def _apply_add(self, ids: List[str], documents: List[str], vecs: np.ndarray, metadatas: List[Dict]):
+        state = self._state
+        start = state.size
+        state.ids.extend(ids)
+        state.documents.extend(documents)
+        state.metadatas.extend(metadatas)
+        state.dead = _grow(state.dead, start, start + len(vecs))
+        if state.quantized is not None:
+            state.quantized.append(vecs)
+        state.vectors.append(vecs)
+        self._index_rows(state, start)
     
     def add(self, ids: List[str], documents: List[str], embeddings: List[List[float]], metadatas: List[Dict]):
-        """Add documents to the store"""
-        self.ids.extend(ids)
-        self.documents.extend(documents)
-        self.embeddings.extend(embeddings)
-        self.metadatas.extend(metadatas)
-        self._save()
-    
-    def search(self, query_embedding: List[float], n_results: int = 5, user_id: str = None) -> Dict[str, Any]:
-        """Search for similar documents using cosine similarity, filtered by user_id"""
-        if not self.embeddings:
-            return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
-        
-        # Filter indices by user_id
-        if user_id:
-            indices = [i for i, m in enumerate(self.metadatas) if m.get("user_id") == user_id]
-        else:
-            indices = list(range(len(self.embeddings)))
-        
-        if not indices:
-            return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
+        """Add documents to the store. Only the new records are written to disk."""
+        vecs = normalize_rows(embeddings)
+        # Stamped before logging so replay restores the same upload time
+        metadatas = stamp_upload_time(metadatas)
+        with self._lock, self._file_lock.hold():
+            self._catch_up()
+            self._apply_add(ids, documents, vecs, metadatas)
+            self._publish()
+            self._log({"op": "add", "ids": list(ids), "documents": list(documents), "metadatas": list(metadatas)}, vecs)
+    
+    def search(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        user_id: str = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Search for similar documents using cosine similarity, filtered by user_id.
         
-        query_vec = np.array(query_embedding)
-        filtered_embeddings = np.array([self.embeddings[i] for i in indices])
+        Args:
+            filters: Optional structured filter, e.g. {"source": ["manual.pdf"],
+                "file_type": [".pdf"], "uploaded_after": datetime}; see MetadataFilter
+        """
+        self._refresh()
+        state = self._snapshot
+        flt = parse_filters(filters)
+        if state.size == 0:
+            return empty_result()
         
-        # Cosine similarity
-        query_norm = query_vec / (np.linalg.norm(query_vec) + 1e-10)
-        doc_norms = filtered_embeddings / (np.linalg.norm(filtered_embeddings, axis=1, keepdims=True) + 1e-10)
-        similarities = np.dot(doc_norms, query_norm)
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        query_vec = query_vec / (np.linalg.norm(query_vec) + 1e-10)
         
-        # Get top N
-        top_k = min(n_results, len(indices))
-        top_relative = np.argsort(similarities)[::-1][:top_k]
-        top_indices = [indices[i] for i in top_relative]
+        # Rows are pre-normalized, so cosine similarity is a single matrix-vector product
+        # over the user's partition only, narrowed by the filter before scoring
+        rows, partition = self._scope(state, user_id, flt)
+        if rows is not None and len(rows) == 0:
+            return empty_result()
+        if partition is not None:
+            top_indices, top_scores = self._search_partition(state, user_id, partition, query_vec, n_results, flt)
+        else:
+            top_indices, top_scores = self._score_rows(state, rows, query_vec, n_results)
         
-        distances = [float(1 - similarities[i]) for i in top_relative]
-        documents = [self.documents[idx] for idx in top_indices]
-        metadatas = [self.metadatas[idx] for idx in top_indices]
+        distances = [float(1 - s) for s in top_scores]
+        documents = [state.documents[idx] for idx in top_indices]
+        metadatas = state.metadatas.dicts(top_indices)
         
         return {
+            "ids": [[state.ids[idx] for idx in top_indices]],
             "documents": [documents],
             "metadatas": [metadatas],
-            "distances": [distances]
+            "distances": [distances],
+            "embeddings": [list(state.vectors.take(top_indices))]
         }
     
+    def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 5,
+        user_id: str = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Search for a batch of queries at once. Exact search scores the whole batch
+        with one matrix-matrix product per block of rows; the result has one inner
+        list per query, in the same shape as search().
+        """
+        self._refresh()
+        state = self._snapshot
+        flt = parse_filters(filters)
+        queries = normalize_rows(query_embeddings)
+        empty = empty_result(len(queries))
+        if state.size == 0 or len(queries) == 0:
+            return empty
+        
+        rows, partition = self._scope(state, user_id, flt)
+        if rows is not None and len(rows) == 0:
+            return empty
+        if rows is None and state.n_dead:
+            rows = np.flatnonzero(~state.dead[:state.size])
+        
+        if partition is not None or state.quantized is not None:
+            # Candidate sets differ per query on these paths, so score them one at a time
+            hits = [
+                self._search_partition(state, user_id, partition, q, n_results, flt) if partition is not None
+                else self._score_rows(state, rows, q, n_results)
+                for q in queries
+            ]
+        else:
+            hits = self._score_rows_batch(state, rows, queries, n_results)
+        
+        result = empty_result(0)
+        for top_indices, top_scores in hits:
+            result["ids"].append([state.ids[idx] for idx in top_indices])
+            result["documents"].append([state.documents[idx] for idx in top_indices])
+            result["metadatas"].append(state.metadatas.dicts(top_indices))
+            result["distances"].append([float(1 - s) for s in top_scores])
+            result["embeddings"].append(list(state.vectors.take(top_indices)))
+        return result
+    
+    def search_lexical(
+        self,
+        query: str,
+        n_results: int = 5,
+        user_id: str = None,
+        filters: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Rank chunks by BM25 over their text; no embedding needed.
+        
+        Returns the same shape as search() with "scores" (BM25, higher is
+        better) instead of "distances", unless query_embedding is given, in
+        which case the hits' cosine "distances" are included as well.
+        
+        A partition's BM25 index is built in the background on its first
+        lexical search (and again after a reload). Until it is ready, searches
+        build one inline from their own view for partitions of up to
+        VECTOR_LEXICAL_INLINE_ROWS chunks; larger partitions have no lexical
+        hits meanwhile, so hybrid search ranks them dense-only.
+        """
+        self._refresh()
+        state = self._snapshot
+        flt = parse_filters(filters)
+        result = empty_result(score_key="scores")
+        tokens = tokenize(query)
+        if state.size == 0 or not tokens:
+            return result
+        
+        user_ids = [user_id] if user_id else list(state.partitions)
+        found_rows, found_scores = [], []
+        for uid in user_ids:
+            partition = state.partitions.get(uid)
+            if partition is None or len(partition) == 0:
+                continue
+            index = state.lexical.get(uid)
+            if index is None:
+                self._request_index("lexical", uid)
+                if len(partition) > LEXICAL_INLINE_ROWS:
+                    continue
+                index = self._train_lexical(state, partition.rows)
+            rows, scores = index.search(tokens)
+            # The index is shared with newer versions of this state: keep only rows this one can see
+            visible = rows < state.size
+            rows, scores = rows[visible], scores[visible]
+            live = ~state.dead[rows]
+            if flt is not None:
+                live &= state.metadatas.matches(rows, flt)
+            found_rows.append(rows[live])
+            found_scores.append(scores[live])
+        if not found_rows:
+            return result
+        
+        rows, scores = np.concatenate(found_rows), np.concatenate(found_scores)
+        top = top_k_indices(scores, min(n_results, len(rows)))
+        rows, scores = rows[top], scores[top]
+        vectors = state.vectors.take(rows)
+        result = {
+            "ids": [[state.ids[idx] for idx in rows]],
+            "documents": [[state.documents[idx] for idx in rows]],
+            "metadatas": [state.metadatas.dicts(rows)],
+            "scores": [[float(s) for s in scores]],
+            "embeddings": [list(vectors)],
+        }
+        if query_embedding is not None:
+            query_vec = np.asarray(query_embedding, dtype=np.float32)
+            query_vec = query_vec / (np.linalg.norm(query_vec) + 1e-10)
+            result["distances"] = [[float(1 - s) for s in vectors @ query_vec]]
+        return result
+    
+    def _scope(self, state: _State, user_id: Optional[str], flt: Optional[MetadataFilter]):
+        """
+        Rows a search may return, with the filter already applied:
+        (rows, None), or (None, None) for every live row, or (None, partition)
+        when the partition is large enough to search through its IVF index.
+        """
+        if user_id:
+            partition = state.partitions.get(user_id)
+            if partition is None or len(partition) == 0:
+                return np.empty(0, dtype=np.int64), None
+            if flt is None:
+                use_ann = self.index_type == "ivf" and len(partition) >= self.ann_min_rows
+                return (None, partition) if use_ann else (partition.rows, None)
+            if flt.sources is not None:
+                # Source lists are already per partition: no scan over the user's other documents
+                picked = [partition.sources[s] for s in flt.sources if s in partition.sources]
+                rows = np.sort(np.concatenate(picked)).astype(np.int64) if picked else np.empty(0, dtype=np.int64)
+            elif self.index_type == "ivf" and len(partition) >= self.ann_min_rows:
+                return None, partition
+            else:
+                rows = partition.rows
+            return rows[state.metadatas.matches(rows, flt)], None
+        
+        if flt is None:
+            return None, None
+        mask = state.metadatas.matches(None, flt)
+        if state.n_dead:
+            mask &= ~state.dead[:state.size]
+        return np.flatnonzero(mask), None
+    
+    def _score_rows_batch(self, state: _State, rows: Optional[np.ndarray], queries: np.ndarray, k: int):
+        """Exact top-k for every query, keeping a running (k, n_queries) best set across row blocks"""
+        n_rows = state.size if rows is None else len(rows)
+        best = RunningTopK(k, len(queries))
+        for start in range(0, n_rows, BATCH_SEARCH_BLOCK):
+            if rows is None:
+                block_rows = np.arange(start, min(n_rows, start + BATCH_SEARCH_BLOCK))
+            else:
+                block_rows = rows[start:start + BATCH_SEARCH_BLOCK]
+            best.push(block_rows, state.vectors.take(block_rows) @ queries.T)
+        return best.result()
+    
+    def _score_rows(self, state: _State, rows: Optional[np.ndarray], query_vec: np.ndarray, k: int):
+        """Top-k (rows, scores) among live rows (all if None), via the quantized codes if enabled"""
+        if rows is None and state.n_dead:
+            rows = np.flatnonzero(~state.dead[:state.size])
+        
+        if state.quantized is not None:
+            return state.quantized.search(state.vectors, rows, query_vec, k)
+        
+        if rows is not None and 2 * len(rows) < state.size:
+            scores = state.vectors.take(rows) @ query_vec
+        else:
+            # Slicing every row is cheaper than gathering most of them
+            scores = np.concatenate([segment @ query_vec for _, segment in state.vectors.segments()])
+            if rows is None:
+                rows = np.arange(state.size)
+            else:
+                scores = scores[rows]
+        top = top_k_indices(scores, min(k, len(rows)))
+        return rows[top], scores[top]
+    
+    def _search_partition(
+        self,
+        state: _State,
+        user_id: str,
+        partition: _Partition,
+        query_vec: np.ndarray,
+        k: int,
+        flt: Optional[MetadataFilter] = None,
+    ):
+        """
+        Top-k (rows, scores) within one partition, via its IVF index when
+        large enough. The index is trained in the background; until it is
+        ready the partition is scanned exactly.
+        """
+        if self.index_type == "ivf" and len(partition) >= self.ann_min_rows:
+            index = state.ann.get(user_id)
+            # Retrain once the partition has doubled since training so lists stay balanced
+            if index is None or index.size >= 2 * index.trained_size:
+                self._request_index("ann", user_id)
+            if index is not None:
+                candidates = index.candidates(query_vec)
+                # The index is shared with newer versions of this state: keep only rows this one can see
+                candidates = candidates[candidates < state.size]
+                candidates = candidates[~state.dead[candidates]]
+                if flt is not None:
+                    candidates = candidates[state.metadatas.matches(candidates, flt)]
+                return self._score_rows(state, candidates, query_vec, k)
+        
+        rows = partition.rows
+        if flt is not None:
+            rows = rows[state.metadatas.matches(rows, flt)]
+        return self._score_rows(state, rows, query_vec, k)
+    
+    def _request_index(self, kind: str, user_id: str):
+        """Start training a partition's "ann" or "lexical" index on a background thread, unless it already is"""
+        key = (kind, user_id)
+        with self._index_builds_lock:
+            if key in self._index_builds:
+                return
+            self._index_builds.add(key)
+        threading.Thread(
+            target=self._build_index, args=(kind, user_id), name=f"vector-store-{kind}-index", daemon=True
+        ).start()
+    
+    def _build_index(self, kind: str, user_id: str):
+        """
+        Train an index on the published view with no lock held, then take
+        _lock only to add the rows written meanwhile and install it. Trained
+        again if a compaction renumbers the rows in between.
+        """
+        key = (kind, user_id)
+        try:
+            for _ in range(3):
+                state = self._snapshot
+                partition = state.partitions.get(user_id)
+                if partition is None or len(partition) == 0:
+                    return
+                if kind == "ann":
+                    index = self._train_ann(state, partition.rows)
+                else:
+                    index = self._train_lexical(state, partition.rows)
+                with self._lock:
+                    live = self._state
+                    indexes = live.ann if kind == "ann" else live.lexical
+                    if indexes is not (state.ann if kind == "ann" else state.lexical):
+                        continue
+                    live_partition = live.partitions.get(user_id)
+                    if live_partition is not None:
+                        newer = live_partition.rows[live_partition.rows >= state.size]
+                        if kind == "ann":
+                            index.add(live.vectors.take(newer), newer)
+                        else:
+                            index.add(newer, [live.documents[int(row)] for row in newer])
+                    indexes[user_id] = index
+                    return
+        except Exception as e:
+            print(f"VECTOR STORE INDEX ERROR ({kind}, user {user_id}): {str(e)}")
+        finally:
+            with self._index_builds_lock:
+                self._index_builds.discard(key)
+    
+    @staticmethod
+    def _train_lexical(state: _State, rows: np.ndarray) -> LexicalIndex:
+        index = LexicalIndex()
+        index.build(rows, [state.documents[int(row)] for row in rows])
+        return index
+    
+    @staticmethod
+    def _train_ann(state: _State, rows: np.ndarray) -> IVFIndex:
+        index = IVFIndex(n_probe=ANN_N_PROBE)
+        index.build(state.vectors.take(rows), rows)
+        return index
+    
     def count(self, user_id: str = None) -> int:
+        self._refresh()
+        state = self._snapshot
         if user_id:
-            return sum(1 for m in self.metadatas if m.get("user_id") == user_id)
-        return len(self.documents)
+            partition = state.partitions.get(user_id)
+            return len(partition) if partition else 0
+        return state.size - state.n_dead
     
     def get_all_sources(self, user_id: str = None) -> List[str]:
+        self._refresh()
+        state = self._snapshot
+        if user_id is not None:
+            partition = state.partitions.get(user_id)
+            return list(partition.sources) if partition else []
         sources = set()
-        for m in self.metadatas:
-            if m and "source" in m:
-                if user_id is None or m.get("user_id") == user_id:
-                    sources.add(m["source"])
+        for partition in state.partitions.values():
+            sources.update(partition.sources)
         return list(sources)
     
-    def delete_by_source(self, source: str, user_id: str = None):
-        """Delete all chunks from a specific source, scoped to user"""
+    def delete_by_source(self, source: str, user_id: str = None, ids: Optional[List[str]] = None):
+        """
+        Delete all chunks from a specific source, scoped to user; with ids,
+        only the source's chunks that have one of them (e.g. one upload's).
+        Rows are tombstoned immediately and reclaimed by a later compaction.
+        """
+        with self._lock, self._file_lock.hold():
+            self._catch_up()
+            if self._apply_delete(source, user_id, ids):
+                self._publish()
+                record = {"op": "delete", "source": source, "user_id": user_id}
+                if ids is not None:
+                    record["ids"] = list(ids)
+                self._log(record)
+                self._maybe_compact()
+    
+    def _apply_delete(self, source: str, user_id: str = None, ids: Optional[List[str]] = None) -> int:
+        state = self._state
         if user_id:
-            indices_to_keep = [
-                i for i, m in enumerate(self.metadatas)
-                if not (m.get("source") == source and m.get("user_id") == user_id)
-            ]
+            partition = state.partitions.get(user_id)
+            partitions = [(user_id, partition)] if partition is not None and source in partition.sources else []
         else:
-            indices_to_keep = [i for i, m in enumerate(self.metadatas) if m.get("source") != source]
+            partitions = [(u, p) for u, p in state.partitions.items() if source in p.sources]
         
-        self.ids = [self.ids[i] for i in indices_to_keep]
-        self.documents = [self.documents[i] for i in indices_to_keep]
-        self.embeddings = [self.embeddings[i] for i in indices_to_keep]
-        self.metadatas = [self.metadatas[i] for i in indices_to_keep]
-        self._save()
+        wanted = set(ids) if ids is not None else None
+        removed = 0
+        dead = state.dead.copy()
+        for user_id, partition in partitions:
+            doomed = partition.sources[source]
+            if wanted is not None:
+                doomed = [row for row in doomed if state.ids[row] in wanted]
+                if not doomed:
+                    continue
+            dead[doomed] = True
+            state.partitions[user_id] = partition.without(source, dead)
+            removed += len(doomed)
+        state.dead = dead
+        state.n_dead += removed
+        return removed
 
 
 # Global instance
-_store: Optional[SimpleVectorStore] = None
+_store: Optional[VectorStore] = None
 
 
-def get_store() -> SimpleVectorStore:
+def get_store() -> VectorStore:
     global _store
     if _store is None:
-        _store = SimpleVectorStore()
+        if VECTOR_BACKEND == "sqlite":
+            from app.database.sqlite_vector_store import SQLiteVectorStore
+            _store = SQLiteVectorStore()
+        else:
+            _store = SimpleVectorStore()
     return _store
 
 
@@ -136,17 +897,47 @@ def add_documents(ids: List[str], documents: List[str], embeddings: List[List[fl
     get_store().add(ids, documents, embeddings, metadatas)
 
 
-def search_similar(query_embedding: List[float], n_results: int = 5, user_id: str = None) -> Dict[str, Any]:
-    return get_store().search(query_embedding, n_results, user_id=user_id)
+def search_similar(
+    query_embedding: List[float],
+    n_results: int = 5,
+    user_id: str = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    return get_store().search(query_embedding, n_results, user_id=user_id, filters=filters)
+
+
+def search_similar_many(
+    query_embeddings: List[List[float]],
+    n_results: int = 5,
+    user_id: str = None,
+    filters: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    return get_store().search_many(query_embeddings, n_results, user_id=user_id, filters=filters)
+
+
+def search_lexical(
+    query: str,
+    n_results: int = 5,
+    user_id: str = None,
+    filters: Optional[Dict[str, Any]] = None,
+    query_embedding: Optional[List[float]] = None,
+) -> Dict[str, Any]:
+    return get_store().search_lexical(query, n_results, user_id=user_id, filters=filters, query_embedding=query_embedding)
 
 
 def get_document_count(user_id: str = None) -> int:
     return get_store().count(user_id=user_id)
 
 
-def delete_by_source(source_file: str, user_id: str = None) -> None:
-    get_store().delete_by_source(source_file, user_id=user_id)
+def delete_by_source(source_file: str, user_id: str = None, ids: Optional[List[str]] = None) -> None:
+    get_store().delete_by_source(source_file, user_id=user_id, ids=ids)
 
 
 def get_all_sources(user_id: str = None) -> List[str]:
     return get_store().get_all_sources(user_id=user_id)
+
+
+def checkpoint_store() -> None:
+    """Fold pending WAL records into the store's files (no-op if the store was never opened)"""
+    if _store is not None:
+        _store.checkpoint()
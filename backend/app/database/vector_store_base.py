@@ -0,0 +1,88 @@
+"""
+Interface shared by the vector store backends.
+
+    SimpleVectorStore   (vector_store.py)          NumPy in memory over memory-mapped snapshots
+    SQLiteVectorStore   (sqlite_vector_store.py)   rows and float32 BLOBs in SQLite, scanned in blocks
+
+Results use the Chroma-style shape the RAG engine expects: a dict of
+"ids", "documents", "metadatas", "distances" (cosine distance, 1 -
+similarity) and "embeddings" (the hits' unit vectors as float32 arrays,
+so results can be reranked without fetching them again), each holding one
+inner list per query.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+
+def empty_result(n_queries: int = 1, score_key: str = "distances") -> Dict[str, Any]:
+    return {key: [[] for _ in range(n_queries)] for key in ("ids", "documents", "metadatas", score_key, "embeddings")}
+
+
+def stamp_upload_time(metadatas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copy metadatas with uploaded_at (epoch seconds) set where missing, for uploaded_after filters"""
+    now = time.time()
+    return [m if m and "uploaded_at" in m else {**(m or {}), "uploaded_at": now} for m in metadatas]
+
+
+class VectorStore(ABC):
+    """Chunk storage with cosine similarity search, scoped by user_id"""
+
+    @abstractmethod
+    def add(self, ids: List[str], documents: List[str], embeddings: List[List[float]], metadatas: List[Dict]):
+        """Add chunks; metadatas carry user_id and source"""
+
+    @abstractmethod
+    def search(
+        self,
+        query_embedding: List[float],
+        n_results: int = 5,
+        user_id: str = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Top n_results chunks by cosine similarity, optionally filtered (see metadata_columns.MetadataFilter)"""
+
+    def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 5,
+        user_id: str = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """search() for a batch of queries; backends override this to share the scan"""
+        result = empty_result(0)
+        for query_embedding in query_embeddings:
+            hits = self.search(query_embedding, n_results, user_id=user_id, filters=filters)
+            for key in result:
+                result[key].extend(hits[key])
+        return result
+
+    def search_lexical(
+        self,
+        query: str,
+        n_results: int = 5,
+        user_id: str = None,
+        filters: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None,
+    ) -> Dict[str, Any]:
+        """Keyword (BM25) ranking with "scores" instead of "distances"; empty if the backend has none"""
+        result = empty_result(score_key="scores")
+        if query_embedding is not None:
+            result["distances"] = [[]]
+        return result
+
+    @abstractmethod
+    def count(self, user_id: str = None) -> int:
+        """Number of live chunks"""
+
+    @abstractmethod
+    def get_all_sources(self, user_id: str = None) -> List[str]:
+        """Distinct source file names"""
+
+    @abstractmethod
+    def delete_by_source(self, source: str, user_id: str = None, ids: Optional[List[str]] = None):
+        """Delete all chunks of one source (or only those with these ids), scoped to user"""
+
+    def checkpoint(self):
+        """Make pending writes compact and durable on disk (e.g. at shutdown)"""
@@ -13,6 +13,10 @@ load_dotenv()
 
 from app.routes import query, documents, analytics
 from app.database.db import create_tables
+from app.database.vector_store import checkpoint_store
+from app.services.answer_cache import flush_answer_cache_stats
+from app.services.cohere_client import close_async_client
+from app.services.ingestion import start_workers, stop_workers
 
 app = FastAPI(
     title="AgentIQ API",
@@ -37,8 +41,18 @@ app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"]
 
 @app.on_event("startup")
 async def startup():
-    """Initialize database tables on startup"""
+    """Initialize database tables and resume document ingestion on startup"""
     await create_tables()
+    await start_workers()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Fold the vector store WAL into a snapshot so the next start replays nothing, and save cache counters"""
+    await stop_workers()
+    checkpoint_store()
+    flush_answer_cache_stats()
+    await close_async_client()
 
 
 @app.get("/")
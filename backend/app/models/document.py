@@ -20,6 +20,9 @@ class Document(Base):
     chunk_count = Column(Integer, default=0)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     status = Column(String(50), default="processed")
+    # Ingestion lease: when, and by which process (see ingestion.BOOT_ID), the job was last claimed or renewed
+    claimed_at = Column(DateTime, nullable=True)
+    claimed_by = Column(String(64), nullable=True)
     
     def to_dict(self):
         return {
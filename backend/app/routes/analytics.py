@@ -13,6 +13,7 @@ from app.database.db import get_db
 from app.database.vector_store import get_document_count, get_all_sources
 from app.models.query_log import QueryLog
 from app.models.document import Document
+from app.services.answer_cache import ANSWER_CACHE, get_answer_cache
 from app.middleware.auth import get_current_user
 
 router = APIRouter()
@@ -59,7 +60,9 @@ async def get_stats(
         "total_queries": total_queries,
         "average_confidence": round(avg_confidence, 1),
         "helpful_rate": round(helpful_rate, 1),
-        "feedback_count": total_feedback
+        "feedback_count": total_feedback,
+        # hits, misses, hit_rate (%) and saved_latency_ms: generation time not spent thanks to hits
+        "answer_cache": get_answer_cache().stats(user_id) if ANSWER_CACHE else None
     }
 
 
@@ -18,7 +18,10 @@ async def debug_system():
         },
         "imports": {},
         "filesystem": {},
-        "database": "Not Checked"
+        "database": "Not Checked",
+        "query_embedding_cache": "Not Checked",
+        "query_embedding_batches": "Not Checked",
+        "llm": "Not Checked"
     }
 
     # 1. Check Imports
@@ -52,4 +55,19 @@ async def debug_system():
     except Exception as e:
         report["database"] = f"FAILED: {str(e)}"
 
+    # 4. Query embedding cache and batching counters (this worker process only)
+    try:
+        from app.services.embedder import get_query_batch_stats, get_query_cache_stats
+        report["query_embedding_cache"] = get_query_cache_stats()
+        report["query_embedding_batches"] = get_query_batch_stats()
+    except Exception as e:
+        report["query_embedding_cache"] = f"FAILED: {str(e)}"
+
+    # 5. LLM circuit breaker state, hedge rate and deadline counters (this worker process only)
+    try:
+        from app.services.llm_client import get_llm_stats
+        report["llm"] = get_llm_stats()
+    except Exception as e:
+        report["llm"] = f"FAILED: {str(e)}"
+
     return report
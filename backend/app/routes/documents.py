@@ -4,26 +4,69 @@ All routes are authenticated and scoped to the current user.
 """
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+import asyncio
+import hashlib
 import os
 import uuid
-from typing import List
+from typing import List, Tuple
 
 from app.database.db import get_db
-from app.database.vector_store import add_documents, get_all_sources, delete_by_source, get_document_count
+from app.database.vector_store import get_all_sources, delete_by_source, get_document_count
 from app.models.document import Document
-from app.services.chunker import extract_text, chunk_text
-from app.services.embedder import get_embeddings
+from app.services import ingestion
+from app.services.ingestion import UPLOAD_DIR, invalidate_answers
 from app.middleware.auth import get_current_user
 
 router = APIRouter()
 
-IS_VERCEL = os.environ.get("VERCEL") == "1"
-UPLOAD_DIR = "/tmp/uploads" if IS_VERCEL else os.path.join(os.path.dirname(__file__), "..", "..", "uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 ALLOWED_EXTENSIONS = {".pdf", ".txt", ".md", ".markdown", ".docx"}
+# Uploads larger than this are rejected with 413 (0 = no limit)
+MAX_UPLOAD_BYTES = int(float(os.environ.get("UPLOAD_MAX_MB", "100")) * 1024 * 1024)
+# Bytes held in memory per upload while it is copied to disk
+UPLOAD_BUFFER_BYTES = int(os.environ.get("UPLOAD_BUFFER_KB", "1024")) * 1024
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large. Maximum size: {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+    )
+
+
+def _write_block(f, digest, block: bytes):
+    digest.update(block)
+    f.write(block)
+
+
+async def _save_upload(file: UploadFile, file_path: str) -> Tuple[int, str]:
+    """
+    Copy an upload to file_path one buffer at a time, hashing as it goes.
+    Returns (size, sha256 hex digest). Raises 413 as soon as the size passes
+    MAX_UPLOAD_BYTES, leaving no file behind.
+    """
+    if MAX_UPLOAD_BYTES and file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _too_large()
+    
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(file_path, "wb") as f:
+            while True:
+                block = await file.read(UPLOAD_BUFFER_BYTES)
+                if not block:
+                    break
+                size += len(block)
+                if MAX_UPLOAD_BYTES and size > MAX_UPLOAD_BYTES:
+                    raise _too_large()
+                await asyncio.to_thread(_write_block, f, digest, block)
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return size, digest.hexdigest()
 
 
 @router.post("/upload")
@@ -32,7 +75,12 @@ async def upload_document(
     db: AsyncSession = Depends(get_db),
     user_id: str = Depends(get_current_user),
 ):
-    """Upload a document to the user's private knowledge base."""
+    """
+    Upload a document to the user's private knowledge base.
+    
+    Returns 202 once the file is saved; extraction, embedding and indexing
+    run in the background (follow them at /{document_id}/status).
+    """
     file_ext = os.path.splitext(file.filename)[1].lower()
     if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
@@ -43,61 +91,53 @@ async def upload_document(
     unique_filename = f"{uuid.uuid4().hex}{file_ext}"
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
     
-    content = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(content)
+    # Hashed and measured while streaming, so nothing reads the file back before extraction does
+    file_size, sha256 = await _save_upload(file, file_path)
+    
+    doc = Document(
+        user_id=user_id,
+        filename=unique_filename,
+        original_name=file.filename,
+        file_type=file_ext,
+        file_size=file_size,
+        chunk_count=0,
+        status=ingestion.QUEUED
+    )
+    db.add(doc)
+    await db.commit()
+    await db.refresh(doc)
     
     try:
-        text = extract_text(file_path)
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="Could not extract text from document")
-        
-        chunks = chunk_text(text, source=file.filename)
-        if not chunks:
-            raise HTTPException(status_code=400, detail="No content to process")
-        
-        chunk_texts = [c["text"] for c in chunks]
-        embeddings = get_embeddings(chunk_texts)
-        
-        chunk_ids = [f"{user_id}_{file.filename}_{i}" for i in range(len(chunks))]
-        # Add user_id to each chunk's metadata for isolation
-        metadatas = [{**c["metadata"], "user_id": user_id} for c in chunks]
-        
-        add_documents(
-            ids=chunk_ids,
-            documents=chunk_texts,
-            embeddings=embeddings,
-            metadatas=metadatas
-        )
-        
-        doc = Document(
-            user_id=user_id,
-            filename=unique_filename,
-            original_name=file.filename,
-            file_type=file_ext,
-            file_size=len(content),
-            chunk_count=len(chunks)
-        )
-        db.add(doc)
-        await db.commit()
-        await db.refresh(doc)
-        
-        return {
-            "message": "Document uploaded successfully",
-            "document": doc.to_dict(),
-            "chunks_created": len(chunks)
-        }
-        
+        await ingestion.submit(doc.id)
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"UPLOAD ERROR: {str(e)}\n{error_trace}")
-        
+        # Ingested inside this request and failed: nothing retries it, so keep no trace of the upload
+        await db.delete(doc)
+        await db.commit()
         if os.path.exists(file_path):
             os.remove(file_path)
-            
+        if isinstance(e, ingestion.IngestionError):
+            raise HTTPException(status_code=400, detail=str(e))
         # RETURN THE ACTUAL ERROR FOR DEBUGGING
         raise HTTPException(status_code=500, detail=f"Server Error: {str(e)}")
+    
+    if ingestion.is_background():
+        return JSONResponse(
+            status_code=202,
+            content={
+                "message": "Document queued for processing",
+                "document": doc.to_dict(),
+                "sha256": sha256,
+                "status_url": f"/api/documents/{doc.id}/status"
+            }
+        )
+    
+    await db.refresh(doc)
+    return {
+        "message": "Document uploaded successfully",
+        "document": doc.to_dict(),
+        "sha256": sha256,
+        "chunks_created": doc.chunk_count
+    }
 
 
 @router.get("/")
@@ -126,6 +166,31 @@ async def list_sources(user_id: str = Depends(get_current_user)):
     return {"sources": sources, "count": len(sources)}
 
 
+@router.get("/{document_id}/status")
+async def document_status(
+    document_id: int,
+    db: AsyncSession = Depends(get_db),
+    user_id: str = Depends(get_current_user),
+):
+    """Ingestion status of an uploaded document (only if owned by the current user)"""
+    result = await db.execute(
+        select(Document).where(Document.id == document_id, Document.user_id == user_id)
+    )
+    doc = result.scalar_one_or_none()
+    
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    return {
+        "document_id": doc.id,
+        "original_name": doc.original_name,
+        "status": doc.status,
+        "done": doc.status in (ingestion.PROCESSED, ingestion.FAILED),
+        "chunk_count": doc.chunk_count,
+        "error": ingestion.get_error(doc) if doc.status == ingestion.FAILED else None
+    }
+
+
 @router.delete("/{document_id}")
 async def delete_document(
     document_id: int,
@@ -141,7 +206,9 @@ async def delete_document(
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    delete_by_source(doc.original_name, user_id=user_id)
+    # Off the event loop: the store may be mid-compaction and make this wait
+    await asyncio.to_thread(delete_by_source, doc.original_name, user_id=user_id)
+    await asyncio.to_thread(invalidate_answers, user_id, doc.original_name)
     
     file_path = os.path.join(UPLOAD_DIR, doc.filename)
     if os.path.exists(file_path):
@@ -160,7 +227,8 @@ async def delete_document_by_source(
     user_id: str = Depends(get_current_user),
 ):
     """Delete a document by source name (only for current user)"""
-    delete_by_source(source_name, user_id=user_id)
+    await asyncio.to_thread(delete_by_source, source_name, user_id=user_id)
+    await asyncio.to_thread(invalidate_answers, user_id, source_name)
     
     result = await db.execute(
         select(Document).where(Document.original_name == source_name, Document.user_id == user_id)
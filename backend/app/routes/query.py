@@ -4,14 +4,19 @@ All routes are authenticated and scoped to the current user.
 """
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from datetime import datetime
+from typing import List, Optional
+import asyncio
 import json
+import time
 
-from app.database.db import get_db
+from app.database.db import async_session, get_db
 from app.models.query_log import QueryLog
-from app.services.rag_engine import query_knowledge_base, get_context_preview
+from app.services.rag_engine import query_knowledge_base, get_lexical_preview, stream_knowledge_base
 from app.middleware.auth import get_current_user
 
 router = APIRouter()
@@ -20,6 +25,13 @@ router = APIRouter()
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 5
+    # Optional restrictions on which chunks may be retrieved
+    sources: Optional[List[str]] = None
+    file_types: Optional[List[str]] = None
+    uploaded_after: Optional[datetime] = None
+    
+    def filters(self) -> dict:
+        return {"source": self.sources, "file_type": self.file_types, "uploaded_after": self.uploaded_after}
 
 
 class FeedbackRequest(BaseModel):
@@ -32,9 +44,13 @@ class QueryResponse(BaseModel):
     answer: str
     confidence: float
     sources: list
+    # Hits above min_relevance, and the passages they were packed into for the prompt
     chunks_retrieved: int
+    passages_used: int = 0
     response_time_ms: int
     query_id: int | None = None
+    # True when served from the answer cache (a near-identical earlier question)
+    cached: bool = False
 
 
 @router.post("/query", response_model=QueryResponse)
@@ -48,7 +64,7 @@ async def ask_question(
         raise HTTPException(status_code=400, detail="Query cannot be empty")
     
     # Run RAG pipeline scoped to user
-    result = query_knowledge_base(request.query, top_k=request.top_k, user_id=user_id)
+    result = await query_knowledge_base(request.query, top_k=request.top_k, user_id=user_id, filters=request.filters())
     
     # Log the query
     query_log = QueryLog(
@@ -67,13 +83,88 @@ async def ask_question(
     return result
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _log_streamed_query(user_id: str, query: str, result: dict) -> int:
+    # The request's own session may already be closed once the response streams
+    async with async_session() as db:
+        query_log = QueryLog(
+            user_id=user_id,
+            query_text=query,
+            answer_text=result["answer"],
+            confidence_score=result["confidence"],
+            sources_used=json.dumps(result["sources"]),
+            response_time_ms=result["response_time_ms"]
+        )
+        db.add(query_log)
+        await db.commit()
+        return query_log.id
+
+
+@router.post("/query/stream")
+async def ask_question_stream(
+    request: QueryRequest,
+    user_id: str = Depends(get_current_user),
+):
+    """
+    Ask a question and receive the answer as Server-Sent Events:
+    "sources" (retrieved chunks) first, then "token" events with answer text
+    as it is generated, then "done" with confidence and query_id once the
+    query is logged. If the query fails part way, the stream ends with an
+    "error" event instead of "done"; the failure is logged as well.
+    """
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
+    async def events():
+        start_time = time.time()
+        sources = []
+        try:
+            result = None
+            async for event in stream_knowledge_base(
+                request.query, top_k=request.top_k, user_id=user_id, filters=request.filters()
+            ):
+                if event["event"] == "done":
+                    result = event["data"]
+                else:
+                    if event["event"] == "sources":
+                        sources = event["data"]["sources"]
+                    yield _sse(event["event"], event["data"])
+            result["query_id"] = await _log_streamed_query(user_id, request.query, result)
+        except Exception as e:
+            print(f"STREAM QUERY ERROR (user {user_id}): {str(e)}")
+            failed = {
+                "answer": f"Error: {str(e)}",
+                "confidence": 0.0,
+                "sources": sources,
+                "response_time_ms": int((time.time() - start_time) * 1000),
+            }
+            try:
+                query_id = await _log_streamed_query(user_id, request.query, failed)
+            except Exception:
+                query_id = None
+            yield _sse("error", {"detail": str(e), "query_id": query_id})
+            return
+        yield _sse("done", result)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/query/preview")
 async def preview_context(
     request: QueryRequest,
     user_id: str = Depends(get_current_user),
 ):
-    """Preview matching context for the current user's documents."""
-    chunks = get_context_preview(request.query, top_k=request.top_k, user_id=user_id)
+    """Preview matching context for the current user's documents (keyword match, semantic if nothing matches)."""
+    chunks = await asyncio.to_thread(
+        get_lexical_preview, request.query, top_k=request.top_k, user_id=user_id, filters=request.filters()
+    )
     return {"query": request.query, "matching_chunks": chunks}
 
 
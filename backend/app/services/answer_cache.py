@@ -0,0 +1,242 @@
+"""
+Per-tenant semantic cache of generated answers.
+
+A question whose embedding has cosine similarity >= ANSWER_CACHE_THRESHOLD
+with a cached question from the same user (asked with the same top_k and
+filters) gets the cached answer, sources and confidence back without
+search or generation.
+
+Entries live in memory, per worker process. Invalidations and hit/miss
+counters live in a small SQLite file shared by all workers: deleting or
+re-uploading a source records its time there, and an entry citing a
+source invalidated after the entry was created is dropped on lookup, so
+every worker stops serving it. Hits and misses are counted in memory and
+added to the shared counters every ANSWER_CACHE_STATS_FLUSH_SECONDS, when
+stats are read, and on shutdown, so lookups don't write to SQLite.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+ANSWER_CACHE = os.environ.get("ANSWER_CACHE", "true") == "true"
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL", "86400"))
+# Entries kept per user and scope; the oldest are dropped first
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+# Hit/miss counts not yet written to SQLite are lost if the process dies without shutting down
+ANSWER_CACHE_STATS_FLUSH_SECONDS = float(os.environ.get("ANSWER_CACHE_STATS_FLUSH_SECONDS", "10"))
+IS_VERCEL = os.environ.get("VERCEL") == "1"
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH") or (
+    "/tmp/answer_cache.sqlite3" if IS_VERCEL else os.path.join(os.path.dirname(__file__), "..", "..", "answer_cache.sqlite3")
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS source_invalidations (
+    user_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    invalidated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, source)
+);
+CREATE TABLE IF NOT EXISTS answer_cache_stats (
+    user_id TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    saved_ms INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _scope(top_k: int, filters: Optional[Dict[str, Any]]) -> str:
+    """Answers are only reused for questions retrieved the same way"""
+    active = {key: value for key, value in (filters or {}).items() if value is not None}
+    return json.dumps({"top_k": top_k, "filters": active}, sort_keys=True, default=str)
+
+
+class _Bucket:
+    """One user's entries for one scope: unit query vectors row-aligned with (created_at, answer, sources)"""
+
+    def __init__(self):
+        self.vectors: Optional[np.ndarray] = None
+        self.entries: List[Tuple[float, Dict[str, Any], frozenset]] = []
+
+    def add(self, vector: np.ndarray, entry: Tuple[float, Dict[str, Any], frozenset], max_entries: int):
+        self.vectors = vector[None, :] if self.vectors is None else np.vstack([self.vectors, vector])
+        self.entries.append(entry)
+        if len(self.entries) > max_entries:
+            self.drop(np.arange(len(self.entries) - max_entries))
+
+    def drop(self, rows):
+        rows = set(int(row) for row in rows)
+        keep = [i for i in range(len(self.entries)) if i not in rows]
+        self.vectors = self.vectors[keep] if keep else None
+        self.entries = [self.entries[i] for i in keep]
+
+
+class AnswerCache:
+    def __init__(self, path: str = None, threshold: float = None, ttl_seconds: float = None, max_entries: int = None):
+        self.path = path or ANSWER_CACHE_PATH
+        self.threshold = ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self.ttl_seconds = ANSWER_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_entries = ANSWER_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self._buckets: Dict[Tuple[str, str], _Bucket] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # user_id -> [hits, misses, saved_ms] recorded since the last flush
+        self._pending: Dict[str, List[int]] = {}
+        self._pending_lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode = WAL")
+        with conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _invalidated_since(self, user_id: str, sources: frozenset, created_at: float) -> bool:
+        if not sources:
+            return False
+        placeholders = ", ".join("?" * len(sources))
+        row = self._conn().execute(
+            f"SELECT MAX(invalidated_at) FROM source_invalidations WHERE user_id = ? AND source IN ({placeholders})",
+            [user_id or "", *sources],
+        ).fetchone()
+        return row[0] is not None and row[0] >= created_at
+
+    def lookup(
+        self, user_id: str, query_embedding: List[float], top_k: int, filters: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """The cached answer for the most similar earlier question, if it is close enough and still valid"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) + 1e-10)
+        key = (user_id or "", _scope(top_k, filters))
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.vectors is None:
+                return None
+            scores = bucket.vectors @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            created_at, answer, sources = bucket.entries[best]
+        if time.time() - created_at > self.ttl_seconds or self._invalidated_since(user_id, sources, created_at):
+            with self._lock:
+                # Re-find the row: another thread may have changed the bucket meanwhile
+                rows = [i for i, entry in enumerate(bucket.entries) if entry[0] == created_at and entry[1] is answer]
+                if rows:
+                    bucket.drop(rows)
+            return None
+        return dict(answer)
+
+    def store(
+        self,
+        user_id: str,
+        query_embedding: List[float],
+        top_k: int,
+        filters: Optional[Dict[str, Any]],
+        answer: Dict[str, Any],
+        created_at: float = None,
+    ):
+        """
+        Cache a generated answer (the result dict of query_knowledge_base).
+        created_at should be when the question's retrieval started: a source
+        invalidated after that, even during generation, makes the entry stale.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) + 1e-10)
+        sources = frozenset(s["source"] for s in answer.get("sources", []))
+        key = (user_id or "", _scope(top_k, filters))
+        with self._lock:
+            bucket = self._buckets.setdefault(key, _Bucket())
+            bucket.add(query, (created_at or time.time(), dict(answer), sources), self.max_entries)
+
+    def invalidate_sources(self, user_id: str, sources: List[str]):
+        """Drop every cached answer citing any of these sources, in all worker processes"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO source_invalidations (user_id, source, invalidated_at) VALUES (?, ?, ?)",
+                [(user_id or "", source, now) for source in sources],
+            )
+        doomed = set(sources)
+        with self._lock:
+            for (owner, _), bucket in self._buckets.items():
+                if owner == (user_id or ""):
+                    bucket.drop([i for i, (_, _, cited) in enumerate(bucket.entries) if cited & doomed])
+
+    def record(self, user_id: str, hit: bool, saved_ms: int = 0):
+        with self._pending_lock:
+            counts = self._pending.setdefault(user_id or "", [0, 0, 0])
+            counts[0 if hit else 1] += 1
+            counts[2] += max(0, int(saved_ms))
+            due = time.monotonic() - self._flushed_at >= ANSWER_CACHE_STATS_FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Add the hits and misses counted in this process to the shared counters"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            conn = self._conn()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO answer_cache_stats (user_id, hits, misses, saved_ms) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT (user_id) DO UPDATE SET hits = hits + excluded.hits,"
+                    " misses = misses + excluded.misses, saved_ms = saved_ms + excluded.saved_ms",
+                    [(user_id, *counts) for user_id, counts in pending.items()],
+                )
+        except Exception:
+            # Keep the counts for the next flush
+            with self._pending_lock:
+                for user_id, counts in pending.items():
+                    merged = self._pending.setdefault(user_id, [0, 0, 0])
+                    for i, count in enumerate(counts):
+                        merged[i] += count
+            raise
+
+    def stats(self, user_id: str) -> Dict[str, Any]:
+        self.flush()
+        row = self._conn().execute(
+            "SELECT hits, misses, saved_ms FROM answer_cache_stats WHERE user_id = ?", (user_id or "",)
+        ).fetchone() or (0, 0, 0)
+        hits, misses, saved_ms = row
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups * 100, 1) if lookups else 0.0,
+            "saved_latency_ms": saved_ms,
+        }
+
+
+_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        _cache = AnswerCache()
+    return _cache
+
+
+def flush_answer_cache_stats():
+    """Write this process's pending hit/miss counts (on shutdown)"""
+    if _cache is not None:
+        _cache.flush()
@@ -0,0 +1,68 @@
+"""
+Cohere clients shared by the embedder and the LLM client
+
+Both go through one connection pool, so a question's embed and chat
+calls reuse warm TLS connections instead of opening their own. The async
+client is bound to the event loop it was created on, so it is recreated
+if the loop changes (tests, scripts calling asyncio.run repeatedly).
+"""
+
+from typing import Any, Optional, Tuple
+import asyncio
+import cohere
+import httpx
+import os
+
+# Connections open to the Cohere API at once, per worker process (requests beyond it queue for one)
+COHERE_MAX_CONNECTIONS = int(os.environ.get("COHERE_MAX_CONNECTIONS", "64"))
+# Idle connections kept open for reuse
+COHERE_KEEPALIVE_CONNECTIONS = int(os.environ.get("COHERE_KEEPALIVE_CONNECTIONS", "20"))
+COHERE_TIMEOUT_SECONDS = float(os.environ.get("COHERE_TIMEOUT_SECONDS", "300"))
+# Alternative API endpoint (a proxy, or a local fake server in benchmarks)
+COHERE_BASE_URL = os.environ.get("COHERE_BASE_URL") or None
+
+# Lazy-initialized clients (avoids crash at import time if key is missing)
+_co = None
+# (event loop, AsyncClient, pooled httpx client)
+_async_state: Optional[Tuple[asyncio.AbstractEventLoop, Any, httpx.AsyncClient]] = None
+
+
+def _api_key() -> str:
+    api_key = os.environ.get("COHERE_API_KEY")
+    if not api_key:
+        raise RuntimeError("COHERE_API_KEY environment variable is not set")
+    return api_key
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=COHERE_MAX_CONNECTIONS, max_keepalive_connections=COHERE_KEEPALIVE_CONNECTIONS)
+
+
+def get_client():
+    """Get or create the sync Cohere client. Raises RuntimeError if API key is not set."""
+    global _co
+    if _co is None:
+        _co = cohere.Client(
+            api_key=_api_key(),
+            base_url=COHERE_BASE_URL,
+            httpx_client=httpx.Client(timeout=COHERE_TIMEOUT_SECONDS, limits=_limits()),
+        )
+    return _co
+
+
+def get_async_client():
+    """The async Cohere client for the running event loop. Raises RuntimeError if API key is not set."""
+    global _async_state
+    loop = asyncio.get_running_loop()
+    if _async_state is None or _async_state[0] is not loop:
+        http = httpx.AsyncClient(timeout=COHERE_TIMEOUT_SECONDS, limits=_limits())
+        _async_state = (loop, cohere.AsyncClient(api_key=_api_key(), base_url=COHERE_BASE_URL, httpx_client=http), http)
+    return _async_state[1]
+
+
+async def close_async_client():
+    """Close the pooled connections of this loop's async client (on shutdown)"""
+    global _async_state
+    if _async_state is not None and _async_state[0] is asyncio.get_running_loop():
+        await _async_state[2].aclose()
+        _async_state = None
@@ -0,0 +1,157 @@
+"""
+Context assembly between retrieval and generation.
+
+Retrieved chunks overlap (chunk_text repeats chunk_overlap characters
+between neighbours) and grow with top_k, so they are packed before they
+reach the prompt:
+
+1. Ordered by maximal marginal relevance on the vectors the search
+   already returned: each pick trades its similarity to the question
+   against its similarity to chunks already picked, and chunks nearly
+   identical to a picked one are dropped.
+2. Taken in that order while they fit CONTEXT_TOKEN_BUDGET (the first
+   always is). A chunk that overlaps one already taken only costs its new
+   text.
+3. Chunks of one source whose char_start/char_end ranges overlap or touch
+   are merged into one passage with the repeated text removed.
+"""
+
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+
+# Prompt tokens for retrieved context (0 = unlimited)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", "3000"))
+# MMR trade-off: 1 ranks by relevance only, lower values favour chunks unlike those already picked
+MMR_LAMBDA = float(os.environ.get("RAG_MMR_LAMBDA", "0.7"))
+# Chunks this similar (cosine) to one already picked add nothing and are dropped
+DUPLICATE_SIMILARITY = float(os.environ.get("RAG_DUPLICATE_SIMILARITY", "0.95"))
+# No tokenizer for the chat model is available offline; English averages ~4 characters per token
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(n_chars: int) -> int:
+    return n_chars // CHARS_PER_TOKEN + 1
+
+
+def _mmr_order(chunks: List[Dict[str, Any]], mmr_lambda: float, duplicate_similarity: float) -> List[int]:
+    """Chunk positions in MMR order, near-duplicates left out; relevance order if any vector is missing"""
+    if any(chunk.get("embedding") is None for chunk in chunks):
+        return sorted(range(len(chunks)), key=lambda i: -chunks[i]["similarity"])
+    vectors = np.asarray([chunk["embedding"] for chunk in chunks], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-10
+    pairwise = vectors @ vectors.T
+    relevance = np.array([chunk["similarity"] for chunk in chunks])
+
+    order: List[int] = []
+    # Highest similarity of each chunk to any picked chunk
+    redundancy = np.full(len(chunks), -np.inf)
+    remaining = np.ones(len(chunks), dtype=bool)
+    while remaining.any():
+        penalty = np.where(np.isinf(redundancy), 0.0, redundancy)
+        scores = np.where(remaining, mmr_lambda * relevance - (1 - mmr_lambda) * penalty, -np.inf)
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        remaining[pick] = False
+        redundancy = np.maximum(redundancy, pairwise[pick])
+        remaining &= redundancy < duplicate_similarity
+    return order
+
+
+def _span(chunk: Dict[str, Any]):
+    """(source, char_start, char_end), or None if the chunk has no offsets"""
+    metadata = chunk.get("metadata", {})
+    start, end = metadata.get("char_start"), metadata.get("char_end")
+    if start is None or end is None:
+        return None
+    return metadata.get("source", "Unknown"), start, end
+
+
+def _join(first: str, second: str, overlap: int) -> str:
+    """first + second without the up to overlap characters second repeats from first's end"""
+    for n in range(min(len(second), overlap), 0, -1):
+        if first.endswith(second[:n]):
+            return first + second[n:]
+    return f"{first} {second}"
+
+
+def _new_chars(chunk: Dict[str, Any], taken: List[Dict[str, Any]]) -> int:
+    """Characters of chunk not already covered by an overlapping taken chunk of the same source"""
+    span = _span(chunk)
+    if span is None:
+        return len(chunk["text"])
+    source, start, end = span
+    covered = 0
+    for other in taken:
+        other_span = _span(other)
+        if other_span and other_span[0] == source:
+            covered += max(0, min(end, other_span[2]) - max(start, other_span[1]))
+    return max(0, len(chunk["text"]) - covered)
+
+
+def _merge(taken: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge taken chunks whose ranges in one source overlap or touch, in order of their best pick"""
+    passages = []
+    by_source: Dict[Any, List[tuple]] = {}
+    for rank, chunk in enumerate(taken):
+        span = _span(chunk)
+        if span is None:
+            passages.append((rank, {**chunk, "parts": [chunk]}))
+        else:
+            by_source.setdefault(span[0], []).append((span[1], span[2], rank, chunk))
+
+    for spans in by_source.values():
+        spans.sort(key=lambda s: (s[0], s[1]))
+        run = None
+        for start, end, rank, chunk in spans:
+            if run is not None and start <= run["end"]:
+                if end > run["end"]:
+                    run["text"] = _join(run["text"], chunk["text"], run["end"] - start)
+                    run["end"] = end
+                run["rank"] = min(run["rank"], rank)
+                run["parts"].append(chunk)
+                continue
+            if run is not None:
+                passages.append(_passage(run))
+            run = {"start": start, "end": end, "rank": rank, "text": chunk["text"], "parts": [chunk]}
+        passages.append(_passage(run))
+
+    passages.sort(key=lambda p: p[0])
+    return [passage for _, passage in passages]
+
+
+def _passage(run: Dict[str, Any]):
+    best = max(run["parts"], key=lambda c: c["similarity"])
+    metadata = {**best.get("metadata", {}), "char_start": run["start"], "char_end": run["end"]}
+    return run["rank"], {"text": run["text"], "metadata": metadata, "similarity": best["similarity"], "parts": run["parts"]}
+
+
+def pack_context(
+    chunks: List[Dict[str, Any]],
+    token_budget: int = None,
+    mmr_lambda: float = None,
+    duplicate_similarity: float = None,
+) -> List[Dict[str, Any]]:
+    """
+    Pack retrieved chunks ({"text", "metadata", "similarity", "embedding"}) for the prompt.
+
+    Returns passages in the same form (without "embedding"), most relevant
+    first, each with "parts": the retrieved chunks it was assembled from.
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    mmr_lambda = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    duplicate_similarity = DUPLICATE_SIMILARITY if duplicate_similarity is None else duplicate_similarity
+    if not chunks:
+        return []
+
+    taken, used = [], 0
+    for i in _mmr_order(chunks, mmr_lambda, duplicate_similarity):
+        chunk = {key: value for key, value in chunks[i].items() if key != "embedding"}
+        cost = estimate_tokens(_new_chars(chunk, taken))
+        if token_budget and taken and used + cost > token_budget:
+            # A smaller chunk further down may still fit
+            continue
+        taken.append(chunk)
+        used += cost
+    return _merge(taken)
@@ -0,0 +1,113 @@
+"""
+Micro-batching of concurrent single-text embedding requests.
+
+Callers submit one text and get a Future. A dispatcher thread takes the
+first waiting request, keeps collecting for up to the batch window or
+until the batch is full, and hands the batch to a small pool of sender
+threads, which send the distinct texts in one embed call and resolve
+every Future from the result. Up to max_in_flight batches are sent at
+once, so one batch backing off after a 429 doesn't hold up the rest;
+when every sender is busy the dispatcher waits, and requests arriving
+meanwhile form the next, larger batch. Sync callers block on
+Future.result(); async callers await asyncio.wrap_future().
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+# Upper bounds of the batch size histogram buckets
+_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 96)
+
+
+class EmbedCoalescer:
+    def __init__(
+        self,
+        embed: Callable[[List[str]], List[List[float]]],
+        max_batch: int,
+        window_seconds: float,
+        max_in_flight: int = 1,
+    ):
+        self.embed = embed
+        self.max_batch = max_batch
+        self.window_seconds = window_seconds
+        self.max_in_flight = max(1, max_in_flight)
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        # Free senders; the dispatcher takes one before collecting a batch
+        self._senders = threading.Semaphore(self.max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed-coalescer-send")
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.wait_seconds = 0.0
+        self.size_histogram = {bucket: 0 for bucket in _SIZE_BUCKETS}
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embed-coalescer", daemon=True)
+                    self._thread.start()
+        return future
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window_seconds
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._senders.acquire()
+            batch = self._collect()
+            self._record(batch)
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch: List[tuple]):
+        try:
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                embedded = dict(zip(texts, self.embed(texts)))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                return
+            for text, future, _ in batch:
+                future.set_result(embedded[text])
+        finally:
+            self._senders.release()
+
+    def _record(self, batch: List[tuple]):
+        now = time.monotonic()
+        size = len(batch)
+        with self._stats_lock:
+            self.requests += size
+            self.batches += 1
+            self.wait_seconds += sum(now - queued for _, _, queued in batch)
+            bucket = next((b for b in _SIZE_BUCKETS if size <= b), _SIZE_BUCKETS[-1])
+            self.size_histogram[bucket] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_in_flight": self.max_in_flight,
+                "window_ms": self.window_seconds * 1000,
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "mean_wait_ms": round(self.wait_seconds / self.requests * 1000, 2) if self.requests else 0.0,
+                # "<=N": number of batches with at most N (and more than the previous bucket's) requests
+                "batch_size_histogram": {f"<={bucket}": count for bucket, count in self.size_histogram.items()},
+            }
@@ -1,72 +1,412 @@
 """
 Embedding service using Cohere API
+
+Document embeddings go through a persistent content-addressed cache
+(see embedding_cache.py); only chunks not seen before are sent to Cohere.
+Query embeddings are kept in a small in-process LRU cache with a TTL, so
+repeated questions skip the API round-trip. Single-question misses from
+concurrent requests are coalesced into one batched embed call (see
+embed_coalescer.py).
+
+API calls are split into batches of at most EMBED_BATCH_SIZE texts, paced
+by a rate limiter shared by every request in the process, and retried
+with exponential backoff on transient errors (429, 5xx, network). The
+async path (get_embeddings_async, used by uploads, and
+get_query_embedding_async) runs up to EMBED_CONCURRENCY batches at once on
+the cohere.AsyncClient shared with the LLM client (cohere_client.py).
+
+The provider is picked from a registry by EMBEDDING_BACKEND: "cohere"
+(default) or "hashing", an offline NumPy backend (hashing_embedder.py)
+that is deterministic per text, for development, load tests and
+benchmarks. MOCK_EMBEDDINGS=true selects "hashing" too.
 """
 
-from typing import List
-import cohere
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+from cohere.core.api_error import ApiError
+import httpx
 import os
+import random
+import threading
+import time
+
+from app.services.cohere_client import get_async_client, get_client
+from app.services.embed_coalescer import EmbedCoalescer
+from app.services.embedding_cache import cache_key, get_cache, normalize_text
+from app.services.hashing_embedder import hash_embed
+
+EMBED_MODEL = "embed-english-v3.0"
+# Cohere accepts at most 96 texts per embed call
+EMBED_BATCH_SIZE = 96
+# Set EMBEDDING_CACHE=false to always call the API for documents
+EMBEDDING_CACHE = os.environ.get("EMBEDDING_CACHE", "true") == "true"
+# Query embedding cache bounds (0 entries disables it)
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL_SECONDS = float(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+# Concurrent query embeddings are sent together once this many are waiting
+QUERY_BATCH_MAX_SIZE = min(int(os.environ.get("QUERY_BATCH_MAX_SIZE", "32")), EMBED_BATCH_SIZE)
+# ... or this long after the first one arrived (0 sends each query on its own)
+QUERY_BATCH_WINDOW_MS = float(os.environ.get("QUERY_BATCH_WINDOW_MS", "5"))
+# Embed calls in flight at once on the async path, across all requests in this process
+# (and coalesced query batches in flight at once, per model)
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "4"))
+# Embed calls per minute across all requests in this process (0 = unlimited)
+EMBED_RATE_LIMIT_PER_MIN = float(os.environ.get("EMBED_RATE_LIMIT_PER_MIN", "1000"))
+EMBED_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", "4"))
+EMBED_RETRY_BASE_SECONDS = 0.5
+
+_TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+# (event loop, Semaphore), recreated if the loop changes
+_async_state: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Concurrency semaphore of async embed calls for the running event loop"""
+    global _async_state
+    loop = asyncio.get_running_loop()
+    if _async_state is None or _async_state[0] is not loop:
+        _async_state = (loop, asyncio.Semaphore(max(1, EMBED_CONCURRENCY)))
+    return _async_state[1]
+
 
-# Lazy-initialized Cohere client (avoids crash at import time if key is missing)
-_co = None
+class _RateLimiter:
+    """Spaces calls at least 1/rate apart; reserve() books the next slot and returns how long to wait for it"""
 
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
 
-def _get_client():
-    """Get or create the Cohere client. Raises RuntimeError if API key is not set."""
-    global _co
-    if _co is None:
-        api_key = os.environ.get("COHERE_API_KEY")
-        if not api_key:
-            raise RuntimeError("COHERE_API_KEY environment variable is not set")
-        _co = cohere.Client(api_key=api_key)
-    return _co
+    def reserve(self) -> float:
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+            return slot - now
 
 
-def _is_mock():
-    return os.environ.get("MOCK_EMBEDDINGS") == "true"
+_rate_limiter = _RateLimiter(EMBED_RATE_LIMIT_PER_MIN)
 
-def _get_mock_embedding(dim=1024) -> List[float]:
-    import random
-    return [random.uniform(-1, 1) for _ in range(dim)]
+
+def _retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """Seconds to wait before retrying, or None if the error is not transient or retries are used up"""
+    if attempt >= EMBED_MAX_RETRIES:
+        return None
+    if isinstance(error, ApiError):
+        if error.status_code not in _TRANSIENT_STATUS:
+            return None
+        retry_after = (error.headers or {}).get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    elif not isinstance(error, httpx.TransportError):
+        return None
+    # Exponential backoff with full jitter
+    return random.uniform(0, EMBED_RETRY_BASE_SECONDS * 2 ** attempt)
 
 
 def get_embedding(text: str) -> List[float]:
     """Generate embedding for a single text (for documents)"""
-    if _is_mock():
-        return _get_mock_embedding()
-        
-    response = _get_client().embed(
-        texts=[text],
-        model="embed-english-v3.0",
-        input_type="search_document"
-    )
-    return response.embeddings[0]
+    return get_embeddings([text])[0]
+
+
+def _batches(texts: List[str]) -> List[List[str]]:
+    return [texts[start:start + EMBED_BATCH_SIZE] for start in range(0, len(texts), EMBED_BATCH_SIZE)]
+
+
+def _embed_batch(texts: List[str], input_type: str) -> List[List[float]]:
+    attempt = 0
+    while True:
+        time.sleep(_rate_limiter.reserve())
+        try:
+            return get_client().embed(texts=texts, model=EMBED_MODEL, input_type=input_type).embeddings
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                raise
+            print(f"EMBED RETRY {attempt + 1}/{EMBED_MAX_RETRIES} in {delay:.2f}s: {str(e)}")
+            time.sleep(delay)
+            attempt += 1
+
+
+def _embed(texts: List[str], input_type: str) -> List[List[float]]:
+    """Call the API in as few requests as possible"""
+    embeddings = []
+    for batch in _batches(texts):
+        embeddings.extend(_embed_batch(batch, input_type))
+    return embeddings
+
+
+async def _embed_batch_async(texts: List[str], input_type: str) -> List[List[float]]:
+    client, semaphore = get_async_client(), _get_semaphore()
+    attempt = 0
+    while True:
+        async with semaphore:
+            await asyncio.sleep(_rate_limiter.reserve())
+            try:
+                return (await client.embed(texts=texts, model=EMBED_MODEL, input_type=input_type)).embeddings
+            except Exception as e:
+                delay = _retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                print(f"EMBED RETRY {attempt + 1}/{EMBED_MAX_RETRIES} in {delay:.2f}s: {str(e)}")
+        # Back off without holding a concurrency slot
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def _embed_async(texts: List[str], input_type: str) -> List[List[float]]:
+    """Embed all batches concurrently (bounded by EMBED_CONCURRENCY), results in input order"""
+    results = await asyncio.gather(*(_embed_batch_async(batch, input_type) for batch in _batches(texts)))
+    return [embedding for batch in results for embedding in batch]
+
+
+class EmbeddingBackend:
+    """An embedding provider: its model name (part of cache keys) and batch embed calls"""
+
+    model: str = ""
+    # Remote backends are worth caching; local ones are cheaper to recompute than to look up
+    cacheable: bool = True
+
+    def embed(self, texts: List[str], input_type: str) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def embed_async(self, texts: List[str], input_type: str) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed, texts, input_type)
+
+
+class CohereBackend(EmbeddingBackend):
+    model = EMBED_MODEL
+
+    def embed(self, texts: List[str], input_type: str) -> List[List[float]]:
+        return _embed(texts, input_type)
+
+    async def embed_async(self, texts: List[str], input_type: str) -> List[List[float]]:
+        return await _embed_async(texts, input_type)
+
+
+class HashingBackend(EmbeddingBackend):
+    """Hashed character n-grams; input_type is ignored (queries and documents share one space)"""
+
+    cacheable = False
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.model = f"hashed-ngrams-{dim}"
+
+    def embed(self, texts: List[str], input_type: str) -> List[List[float]]:
+        return hash_embed(texts, self.dim).tolist()
+
+
+_backends: Dict[str, EmbeddingBackend] = {"cohere": CohereBackend(), "hashing": HashingBackend()}
+
+
+def register_backend(name: str, backend: EmbeddingBackend):
+    """Make a backend selectable with EMBEDDING_BACKEND=name"""
+    _backends[name] = backend
+
+
+def get_backend() -> EmbeddingBackend:
+    name = os.environ.get("EMBEDDING_BACKEND") or ("hashing" if os.environ.get("MOCK_EMBEDDINGS") == "true" else "cohere")
+    if name not in _backends:
+        raise ValueError(f"Unknown embedding backend: {name} (available: {', '.join(sorted(_backends))})")
+    return _backends[name]
+
+
+def _cache_lookup(
+    backend: EmbeddingBackend, texts: List[str]
+) -> Tuple[List[bytes], Dict[bytes, List[float]], Dict[bytes, str]]:
+    """(cache key per text, cached embeddings, distinct uncached texts by key)"""
+    keys = [cache_key(backend.model, "search_document", text) for text in texts]
+    try:
+        found = get_cache().get_many(keys) if EMBEDDING_CACHE else {}
+    except Exception as e:
+        print(f"EMBEDDING CACHE ERROR: {str(e)}")
+        found = {}
+    # One API input per distinct text, even when it repeats within the batch
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            missing.setdefault(key, text)
+    return keys, found, missing
+
+
+def _cache_store(embedded: Dict[bytes, List[float]]):
+    if not EMBEDDING_CACHE:
+        return
+    try:
+        get_cache().put_many(embedded)
+    except Exception as e:
+        print(f"EMBEDDING CACHE ERROR: {str(e)}")
 
 
 def get_embeddings(texts: List[str]) -> List[List[float]]:
-    """Generate embeddings for multiple texts"""
+    """Generate embeddings for multiple texts, embedding only those not already cached"""
+    if not texts:
+        return []
+    
+    backend = get_backend()
+    if not backend.cacheable:
+        return backend.embed(texts, "search_document")
+    
+    keys, found, missing = _cache_lookup(backend, texts)
+    if missing:
+        embedded = dict(zip(missing, backend.embed(list(missing.values()), "search_document")))
+        _cache_store(embedded)
+        found.update(embedded)
+    return [found[key] for key in keys]
+
+
+async def get_embeddings_async(texts: List[str]) -> List[List[float]]:
+    """get_embeddings() for async callers: batches run concurrently and the event loop is never blocked"""
+    if not texts:
+        return []
+    
+    backend = get_backend()
+    if not backend.cacheable:
+        return await backend.embed_async(texts, "search_document")
+    
+    keys, found, missing = await asyncio.to_thread(_cache_lookup, backend, texts)
+    if missing:
+        embedded = dict(zip(missing, await backend.embed_async(list(missing.values()), "search_document")))
+        await asyncio.to_thread(_cache_store, embedded)
+        found.update(embedded)
+    return [found[key] for key in keys]
+
+
+class _QueryCache:
+    """Thread-safe LRU of query embeddings by normalized text, entries expiring after a TTL"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # (model, normalized text) -> (expiry, embedding)
+        self._entries: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple[str, str], embedding: List[float]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            }
+
+
+_query_cache = _QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS)
+
+
+def get_query_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the query embedding cache in this process"""
+    return _query_cache.stats()
+
+
+def get_query_embeddings(texts: List[str]) -> List[List[float]]:
+    """Generate query embeddings for a batch of questions, calling the API only for uncached ones"""
     if not texts:
         return []
     
-    if _is_mock():
-        return [_get_mock_embedding() for _ in texts]
+    backend = get_backend()
+    if not backend.cacheable:
+        return backend.embed(texts, "search_query")
     
-    # Cohere can handle batch embeddings
-    response = _get_client().embed(
-        texts=texts,
-        model="embed-english-v3.0",
-        input_type="search_document"
-    )
-    return response.embeddings
+    keys = [(backend.model, normalize_text(text)) for text in texts]
+    found = {}
+    for key in dict.fromkeys(keys):
+        embedding = _query_cache.get(key)
+        if embedding is not None:
+            found[key] = embedding
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+    if missing:
+        for key, embedding in zip(missing, backend.embed([text for _, text in missing], "search_query")):
+            _query_cache.put(key, embedding)
+            found[key] = embedding
+    return [found[key] for key in keys]
+
+
+_coalescers: Dict[str, EmbedCoalescer] = {}
+_coalescers_lock = threading.Lock()
+
+
+def _get_coalescer(backend: EmbeddingBackend) -> EmbedCoalescer:
+    with _coalescers_lock:
+        coalescer = _coalescers.get(backend.model)
+        if coalescer is None:
+            coalescer = _coalescers[backend.model] = EmbedCoalescer(
+                lambda texts: backend.embed(texts, "search_query"),
+                max_batch=QUERY_BATCH_MAX_SIZE,
+                window_seconds=QUERY_BATCH_WINDOW_MS / 1000,
+                max_in_flight=EMBED_CONCURRENCY,
+            )
+        return coalescer
+
+
+def get_query_batch_stats() -> Dict[str, Any]:
+    """Per-model batch counts and batch size distribution of coalesced query embeddings in this process"""
+    with _coalescers_lock:
+        coalescers = dict(_coalescers)
+    return {model: coalescer.stats() for model, coalescer in coalescers.items()}
 
 
 def get_query_embedding(text: str) -> List[float]:
-    """Generate embedding optimized for queries/search"""
-    if _is_mock():
-        return _get_mock_embedding()
-
-    response = _get_client().embed(
-        texts=[text],
-        model="embed-english-v3.0",
-        input_type="search_query"
-    )
-    return response.embeddings[0]
+    """Generate embedding optimized for queries/search, batched with concurrent requests on a cache miss"""
+    backend = get_backend()
+    if not backend.cacheable or QUERY_BATCH_WINDOW_MS <= 0:
+        return get_query_embeddings([text])[0]
+    
+    key = (backend.model, normalize_text(text))
+    embedding = _query_cache.get(key)
+    if embedding is None:
+        embedding = _get_coalescer(backend).submit(key[1]).result()
+        _query_cache.put(key, embedding)
+    return embedding
+
+
+async def get_query_embedding_async(text: str) -> List[float]:
+    """get_query_embedding() for async callers: the event loop waits on the embed call without blocking"""
+    backend = get_backend()
+    if not backend.cacheable:
+        return (await backend.embed_async([text], "search_query"))[0]
+    
+    key = (backend.model, normalize_text(text))
+    embedding = _query_cache.get(key)
+    if embedding is None:
+        if QUERY_BATCH_WINDOW_MS > 0:
+            embedding = await asyncio.wrap_future(_get_coalescer(backend).submit(key[1]))
+        else:
+            embedding = (await backend.embed_async([key[1]], "search_query"))[0]
+        _query_cache.put(key, embedding)
+    return embedding
@@ -0,0 +1,116 @@
+"""
+Persistent, content-addressed cache of document embeddings.
+
+Entries are keyed by a hash of (model, input_type, normalized text), so
+re-uploads of the same file and boilerplate chunks repeated across
+documents and tenants are embedded once. Vectors are stored as float32
+BLOBs in a SQLite file shared by all worker processes. Each hit refreshes
+the entry's last-used time; when the cache grows past its size bound the
+least recently used entries are evicted.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+
+IS_VERCEL = os.environ.get("VERCEL") == "1"
+CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH") or (
+    "/tmp/embedding_cache.sqlite3" if IS_VERCEL else os.path.join(os.path.dirname(__file__), "..", "..", "embedding_cache.sqlite3")
+)
+CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Per-row overhead on top of the vector (key, timestamp, b-tree cells)
+_ROW_OVERHEAD = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    last_used REAL NOT NULL,
+    embedding BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC with whitespace runs collapsed, so trivially different copies share an entry"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, input_type: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{input_type}\0{normalize_text(text)}".encode(), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = None, max_bytes: int = None):
+        self.path = path or CACHE_PATH
+        self.max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode = WAL")
+        with conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """Cached embeddings for whichever keys have one, refreshing their last-used time"""
+        unique = list(dict.fromkeys(keys))
+        if not unique:
+            return {}
+        conn = self._conn()
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            for key, blob in conn.execute(f"SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})", batch):
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        if found:
+            with conn:
+                conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(time.time(), k) for k in found])
+        return found
+
+    def put_many(self, entries: Dict[bytes, List[float]]):
+        if not entries:
+            return
+        now = time.time()
+        rows = [(key, now, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in entries.items()]
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, last_used, embedding) VALUES (?, ?, ?)", rows)
+        self._evict(len(rows[0][2]) + _ROW_OVERHEAD)
+
+    def _evict(self, entry_bytes: int):
+        """Drop least recently used entries beyond the size bound (all entries share one dimension)"""
+        max_entries = self.max_bytes // entry_bytes
+        conn = self._conn()
+        excess = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - max_entries
+        if excess > 0:
+            with conn:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+
+
+_cache: Optional[EmbeddingCache] = None
+
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache()
+    return _cache
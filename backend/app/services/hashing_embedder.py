@@ -0,0 +1,107 @@
+"""
+Offline embedding by hashed character n-grams, in NumPy.
+
+Each text is lowercased, its whitespace collapsed and padded with
+spaces. Features are every character 3-, 4- and 5-gram of its UTF-8
+bytes, plus every word and pair of adjacent words (weighted higher, so
+shared words count for more than shared fragments). Each feature is
+hashed (polynomial hashes mod 2^64, so the same text gives the same
+vector on every machine and process) and added with a pseudo-random sign
+into N_PROJECTIONS of the output dimensions: a sparse fixed random
+projection of the feature count vector, so texts sharing words get high
+cosine similarity. Rows are log-damped and L2-normalized.
+
+A whole batch is hashed at once: the texts are concatenated and every
+window and word is hashed with array operations, with no per-feature
+Python code.
+"""
+
+import unicodedata
+from typing import List
+
+import numpy as np
+
+NGRAM_SIZES = (3, 4, 5)
+N_PROJECTIONS = 4
+# Weight of word and word-pair features relative to one character n-gram
+WORD_WEIGHT = 4.0
+# Texts hashed per bincount, so the (texts x dim) accumulator stays small
+_BLOCK = 256
+
+_PRIME = np.uint64(0x100000001B3)
+_PRIME_INV = np.uint64(pow(0x100000001B3, -1, 2 ** 64))
+_SPACE = ord(" ")
+# Odd multipliers/offsets of the per-projection hash mixes
+_MIX_MUL = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93], dtype=np.uint64)
+_MIX_ADD = np.array([0x85EBCA77C2B2AE63, 0x27D4EB2F165667C5, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9], dtype=np.uint64)
+
+
+def _encode(texts: List[str]):
+    """Concatenated bytes of the padded texts and the text number of each byte"""
+    encoded = [f" {' '.join(unicodedata.normalize('NFKC', t or '').lower().split())} ".encode() for t in texts]
+    lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    owner = np.repeat(np.arange(len(texts)), lengths)
+    return data, owner
+
+
+def _word_hashes(data: np.ndarray, owner: np.ndarray):
+    """(hashes, text numbers) of every word and adjacent word pair, from prefix hashes"""
+    # prefix[i] = sum(data[j] * P^j for j < i), so data[s:e] hashes to (prefix[e] - prefix[s]) * P^-s
+    one = np.ones(1, dtype=np.uint64)
+    powers = np.concatenate((one, np.cumprod(np.full(len(data) - 1, _PRIME, dtype=np.uint64))))
+    inverse = np.concatenate((one, np.cumprod(np.full(len(data) - 1, _PRIME_INV, dtype=np.uint64))))
+    prefix = np.concatenate((np.zeros(1, dtype=np.uint64), np.cumsum(data * powers, dtype=np.uint64)))
+    space = data == _SPACE
+    # Word starts follow a space and word ends precede one (every text is padded with spaces)
+    starts = np.flatnonzero(space[:-1] & ~space[1:]) + 1
+    ends = np.flatnonzero(~space[:-1] & space[1:]) + 1
+    hashes = (prefix[ends] - prefix[starts]) * inverse[starts]
+    docs = owner[starts]
+    # Word pairs span from a word's start to the next word's end, within one text
+    same_text = docs[:-1] == docs[1:]
+    pairs = (prefix[ends[1:]] - prefix[starts[:-1]]) * inverse[starts[:-1]]
+    return (
+        np.concatenate([hashes ^ np.uint64(1 << 8), pairs[same_text] ^ np.uint64(2 << 8)]),
+        np.concatenate([docs, docs[:-1][same_text]]),
+    )
+
+
+def _char_ngram_hashes(data: np.ndarray, owner: np.ndarray):
+    """(hashes, text numbers) of every character n-gram that lies within one text"""
+    all_hashes, all_docs = [], []
+    rolling = data.copy()
+    for n in range(2, max(NGRAM_SIZES) + 1):
+        # rolling[i] hashes data[i:i + n]
+        rolling = rolling[:-1] * _PRIME + data[n - 1:]
+        if n not in NGRAM_SIZES:
+            continue
+        starts = owner[:len(rolling)]
+        valid = starts == owner[n - 1:]
+        all_hashes.append(rolling[valid] ^ np.uint64(n))
+        all_docs.append(starts[valid])
+    return np.concatenate(all_hashes), np.concatenate(all_docs)
+
+
+def _embed_block(texts: List[str], dim: int) -> np.ndarray:
+    data, owner = _encode(texts)
+    out = np.zeros(len(texts) * dim, dtype=np.float64)
+    with np.errstate(over="ignore"):
+        features = (_char_ngram_hashes(data, owner) + (1.0,), _word_hashes(data, owner) + (WORD_WEIGHT,))
+        for hashes, docs, weight in features:
+            for mul, add in zip(_MIX_MUL[:N_PROJECTIONS], _MIX_ADD[:N_PROJECTIONS]):
+                mixed = hashes * mul + add
+                buckets = ((mixed >> np.uint64(16)) % np.uint64(dim)).astype(np.int64)
+                signs = weight * (1.0 - 2.0 * (mixed >> np.uint64(63)).astype(np.float64))
+                out += np.bincount(docs * dim + buckets, weights=signs, minlength=len(out))
+    # Log-damped counts, so features repeated throughout a text (common words) don't dominate it
+    vectors = (np.sign(out) * np.log1p(np.abs(out))).reshape(len(texts), dim).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-10
+    return vectors
+
+
+def hash_embed(texts: List[str], dim: int = 1024) -> np.ndarray:
+    """(len(texts), dim) float32 unit vectors, deterministic per text"""
+    if not texts:
+        return np.empty((0, dim), dtype=np.float32)
+    return np.concatenate([_embed_block(texts[i:i + _BLOCK], dim) for i in range(0, len(texts), _BLOCK)])
@@ -0,0 +1,336 @@
+"""
+Background ingestion of uploaded documents.
+
+upload_document only saves the file and a Document row with status
+"queued". Worker tasks on the event loop then move each document through
+extracting -> embedding -> indexing -> processed (or failed), writing
+every step to the row, so GET /api/documents/{id}/status shows progress.
+
+The queue is the documents table itself, so it survives restarts. A
+worker claims a document with a conditional UPDATE from "queued", so
+workers in several processes never take the same one. The claim is a
+lease: it records the process (BOOT_ID) and time, and the worker renews
+it at every step and every third of INGEST_LEASE_SECONDS. Documents whose
+lease expired belong to a process that died; the workers of any process
+queue them again, and the retry first drops the chunks the interrupted
+attempt saved. A process that shuts down cleanly queues its own
+unfinished documents right away.
+
+INGEST_CONCURRENCY = 0 disables the workers and uploads are processed
+inside the request (serverless, where nothing runs after the response).
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import uuid
+
+from sqlalchemy import or_, select, update
+
+from app.database.db import async_session
+from app.database.vector_store import add_documents, delete_by_source
+from app.models.document import Document
+from app.services.answer_cache import ANSWER_CACHE, get_answer_cache
+from app.services.chunker import extract_text, chunk_text
+from app.services.embedder import get_embeddings_async
+
+IS_VERCEL = os.environ.get("VERCEL") == "1"
+UPLOAD_DIR = "/tmp/uploads" if IS_VERCEL else os.path.join(os.path.dirname(__file__), "..", "..", "uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# Documents ingested at once per process (0 = inside the upload request)
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "0" if IS_VERCEL else "2"))
+# Idle workers check for documents queued by other processes this often
+INGEST_POLL_SECONDS = float(os.environ.get("INGEST_POLL_SECONDS", "5"))
+# A job whose claim was not renewed for this long is taken over and queued again
+INGEST_LEASE_SECONDS = float(os.environ.get("INGEST_LEASE_SECONDS", "300"))
+
+# Identifies this process's claims in Document.claimed_by
+BOOT_ID = uuid.uuid4().hex
+
+QUEUED = "queued"
+EXTRACTING = "extracting"
+EMBEDDING = "embedding"
+INDEXING = "indexing"
+PROCESSED = "processed"
+FAILED = "failed"
+IN_PROGRESS = (EXTRACTING, EMBEDDING, INDEXING)
+
+# Why recent jobs failed, by (document id, stored filename): SQLite reuses the ids of
+# deleted rows, the filename is unique per upload. There is no column for it; lost on restart
+_errors: Dict[Tuple[int, str], str] = {}
+_MAX_ERRORS = 1000
+
+
+class IngestionError(Exception):
+    """The document itself can't be ingested (no text, nothing to chunk)"""
+
+
+class _Lost(Exception):
+    """The document was deleted while it was being ingested, or its job was taken over"""
+
+
+def _chunk_ids(doc: Document, n_chunks: int) -> List[str]:
+    # The document id keeps re-uploads of a file name apart, so one upload's chunks can be removed alone
+    return [f"{doc.user_id}_{doc.original_name}_{doc.id}_{i}" for i in range(n_chunks)]
+
+
+def _drop_chunks(doc: Document, n_chunks: int):
+    """Remove the chunks this document's job may have indexed"""
+    if n_chunks:
+        delete_by_source(doc.original_name, user_id=doc.user_id, ids=_chunk_ids(doc, n_chunks))
+
+
+async def _advance(document_id: int, status: str, **values) -> None:
+    """Record the job's next step and renew its lease; raises _Lost if the row is gone or no longer ours"""
+    async with async_session() as db:
+        result = await db.execute(
+            update(Document)
+            .where(Document.id == document_id, Document.claimed_by == BOOT_ID)
+            .values(status=status, claimed_at=datetime.utcnow(), **values)
+        )
+        await db.commit()
+    if result.rowcount == 0:
+        raise _Lost()
+
+
+async def _exists(document_id: int) -> bool:
+    async with async_session() as db:
+        return await db.get(Document, document_id) is not None
+
+
+async def _claim(document_id: int) -> Optional[Document]:
+    """Take a queued document for this worker; None if another worker took it first"""
+    async with async_session() as db:
+        result = await db.execute(
+            update(Document)
+            .where(Document.id == document_id, Document.status == QUEUED)
+            .values(status=EXTRACTING, claimed_at=datetime.utcnow(), claimed_by=BOOT_ID)
+        )
+        await db.commit()
+        if result.rowcount == 0:
+            return None
+        return await db.get(Document, document_id)
+
+
+async def _renew_lease(document_id: int):
+    """Keep renewing a running job's lease, so a long step doesn't make it look abandoned"""
+    while True:
+        await asyncio.sleep(INGEST_LEASE_SECONDS / 3)
+        try:
+            async with async_session() as db:
+                await db.execute(
+                    update(Document)
+                    .where(Document.id == document_id, Document.claimed_by == BOOT_ID)
+                    .values(claimed_at=datetime.utcnow())
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"INGEST LEASE ERROR (document {document_id}): {str(e)}")
+
+
+async def _ingest(doc: Document) -> int:
+    """Extract, chunk, embed and index one claimed document; returns the number of chunks"""
+    file_path = os.path.join(UPLOAD_DIR, doc.filename)
+    text = await asyncio.to_thread(extract_text, file_path)
+    if not text.strip():
+        raise IngestionError("Could not extract text from document")
+
+    chunks = await asyncio.to_thread(chunk_text, text, source=doc.original_name)
+    if not chunks:
+        raise IngestionError("No content to process")
+
+    await _advance(doc.id, EMBEDDING)
+    chunk_texts = [c["text"] for c in chunks]
+    embeddings = await get_embeddings_async(chunk_texts)
+
+    if doc.chunk_count:
+        # An earlier attempt was interrupted while indexing: drop whatever it saved
+        await asyncio.to_thread(_drop_chunks, doc, doc.chunk_count)
+    # Recorded before indexing so a retry knows which chunk ids this attempt may leave behind
+    await _advance(doc.id, INDEXING, chunk_count=len(chunks))
+    chunk_ids = _chunk_ids(doc, len(chunks))
+    # Add user_id to each chunk's metadata for isolation
+    metadatas = [{**c["metadata"], "user_id": doc.user_id} for c in chunks]
+    await asyncio.to_thread(
+        add_documents, ids=chunk_ids, documents=chunk_texts, embeddings=embeddings, metadatas=metadatas
+    )
+
+    try:
+        # Chunks are added next to any earlier upload of the same file name, so answers
+        # cached before this one (and citing that source) may be missing its content
+        await asyncio.to_thread(invalidate_answers, doc.user_id, doc.original_name)
+        await _advance(doc.id, PROCESSED, chunk_count=len(chunks))
+    except _Lost:
+        if await _exists(doc.id):
+            # Requeued after the lease expired: the retry drops this attempt's chunks
+            # itself, and may be adding the same ids again by now
+            raise
+        # Deleted while indexing: the delete may have run before these chunks were added
+        await asyncio.to_thread(_drop_chunks, doc, len(chunks))
+        raise
+    except Exception:
+        # A failed document must not stay searchable
+        await asyncio.to_thread(_drop_chunks, doc, len(chunks))
+        raise
+    return len(chunks)
+
+
+async def run_job(document_id: int, raise_errors: bool = False) -> bool:
+    """
+    Ingest a queued document. Returns False if another worker claimed it.
+    Failures mark the document "failed"; raise_errors re-raises them too.
+    """
+    doc = await _claim(document_id)
+    if doc is None:
+        return False
+    # A retried job starts without its earlier failure
+    _errors.pop((doc.id, doc.filename), None)
+    lease = asyncio.create_task(_renew_lease(document_id))
+    try:
+        await _ingest(doc)
+    except _Lost:
+        pass
+    except Exception as e:
+        import traceback
+        print(f"INGEST ERROR (document {document_id}): {str(e)}\n{traceback.format_exc()}")
+        if len(_errors) >= _MAX_ERRORS:
+            _errors.pop(next(iter(_errors)))
+        _errors[(doc.id, doc.filename)] = str(e)
+        try:
+            await _advance(document_id, FAILED)
+        except _Lost:
+            pass
+        if raise_errors:
+            raise
+    finally:
+        lease.cancel()
+    return True
+
+
+def get_error(doc: Document) -> Optional[str]:
+    return _errors.get((doc.id, doc.filename))
+
+
+def invalidate_answers(user_id: str, source: str):
+    """Drop cached answers that cite this source"""
+    if ANSWER_CACHE:
+        get_answer_cache().invalidate_sources(user_id, [source])
+
+
+class IngestionWorkers:
+    """A fixed number of worker tasks taking queued documents, oldest first"""
+
+    def __init__(self, concurrency: int, poll_seconds: float):
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        await self._requeue_expired()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._reap()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Hand this process's unfinished jobs back now rather than when their lease expires
+        try:
+            await self._requeue(Document.claimed_by == BOOT_ID)
+        except Exception as e:
+            print(f"INGEST WORKER ERROR: {str(e)}")
+
+    def notify(self):
+        """A document was queued: wake an idle worker now rather than at its next poll"""
+        self._wake.set()
+
+    async def _reap(self):
+        """Periodically queue again the jobs of processes that died"""
+        while True:
+            await asyncio.sleep(INGEST_LEASE_SECONDS / 2)
+            try:
+                if await self._requeue_expired():
+                    self.notify()
+            except Exception as e:
+                print(f"INGEST WORKER ERROR: {str(e)}")
+
+    async def _requeue_expired(self) -> int:
+        """Queue again documents whose lease expired (their process stopped without handing them back)"""
+        cutoff = datetime.utcnow() - timedelta(seconds=INGEST_LEASE_SECONDS)
+        return await self._requeue(or_(Document.claimed_at.is_(None), Document.claimed_at < cutoff))
+
+    async def _requeue(self, claim) -> int:
+        """
+        Queue again the in-progress documents whose claim matches; returns how
+        many. Their old owner can no longer advance them, and the retry first
+        drops any chunks the interrupted attempt saved (see _ingest).
+        """
+        async with async_session() as db:
+            result = await db.execute(
+                update(Document)
+                .where(Document.status.in_(IN_PROGRESS), claim)
+                .values(status=QUEUED, claimed_at=None, claimed_by=None)
+            )
+            await db.commit()
+        return result.rowcount
+
+    async def _next_queued(self) -> Optional[int]:
+        async with async_session() as db:
+            result = await db.execute(
+                select(Document.id).where(Document.status == QUEUED).order_by(Document.id).limit(1)
+            )
+            return result.scalar_one_or_none()
+
+    async def _work(self):
+        while True:
+            self._wake.clear()
+            try:
+                document_id = await self._next_queued()
+                if document_id is not None:
+                    await run_job(document_id)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The database is unreachable; try again at the next poll
+                print(f"INGEST WORKER ERROR: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+
+_workers: Optional[IngestionWorkers] = None
+
+
+async def start_workers():
+    """Start the worker pool (on startup), resuming documents queued before a restart"""
+    global _workers
+    if INGEST_CONCURRENCY > 0 and _workers is None:
+        _workers = IngestionWorkers(INGEST_CONCURRENCY, INGEST_POLL_SECONDS)
+        await _workers.start()
+
+
+async def stop_workers():
+    """Cancel the workers (on shutdown); documents they were on are resumed at the next start"""
+    global _workers
+    if _workers is not None:
+        await _workers.stop()
+        _workers = None
+
+
+async def submit(document_id: int):
+    """Hand a newly queued document to the workers, or ingest it now if there are none"""
+    if _workers is not None:
+        _workers.notify()
+    else:
+        await run_job(document_id, raise_errors=True)
+
+
+def is_background() -> bool:
+    """Whether submitted documents are ingested after the upload request returns"""
+    return _workers is not None
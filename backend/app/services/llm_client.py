@@ -1,47 +1,292 @@
 """
 LLM client for generating answers using Cohere
+
+Each call has a sync and an async (*_async) form; the async ones use the
+pooled cohere.AsyncClient shared with the embedder (cohere_client.py).
+
+Chat calls are bounded for tail latency:
+- Every call has a deadline (LLM_TIMEOUT_SECONDS).
+- With LLM_HEDGE=true, an async answer still pending after the recent p95
+  latency gets a second, identical request; the first reply wins and the
+  other is cancelled. At most LLM_HEDGE_MAX_RATE of calls are hedged.
+- A circuit breaker opens after LLM_BREAKER_FAILURES consecutive outage
+  errors (deadline, network, 429, 5xx). While open, calls fail at once;
+  after LLM_BREAKER_COOLDOWN_SECONDS one trial call is let through, and
+  its result closes or reopens the breaker.
+An answer that cannot be generated for one of these reasons degrades to
+the top retrieved passages, with confidence 0. get_llm_stats() exports the
+breaker state and the hedge and deadline counters.
 """
 
-import cohere
+from collections import deque
+from typing import Any, AsyncIterator, Iterator, List, Dict, Optional, Tuple
+import asyncio
 import os
-from typing import List, Dict, Tuple
+import threading
+import time
 
-# Lazy-initialized Cohere client (avoids crash at import time if key is missing)
-_co = None
+from cohere.core.api_error import ApiError
+import httpx
 
+from app.services.cohere_client import get_async_client, get_client
 
-def _get_client():
-    """Get or create the Cohere client. Raises RuntimeError if API key is not set."""
-    global _co
-    if _co is None:
-        api_key = os.environ.get("COHERE_API_KEY")
-        if not api_key:
-            raise RuntimeError("COHERE_API_KEY environment variable is not set")
-        _co = cohere.Client(api_key=api_key)
-    return _co
+CHAT_MODEL = "command-a-03-2025"
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "30"))
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "false") == "true"
+# Hedge after this percentile of recent call latencies ...
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+# ... but never sooner than this
+LLM_HEDGE_MIN_DELAY_MS = float(os.environ.get("LLM_HEDGE_MIN_DELAY_MS", "100"))
+# Most calls that may be hedged (the rest wait), so a slowdown can't double the load
+LLM_HEDGE_MAX_RATE = float(os.environ.get("LLM_HEDGE_MAX_RATE", "0.1"))
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.environ.get("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+# Passages quoted in a degraded answer
+DEGRADED_SOURCES = 3
 
+_TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+# Successful call latencies kept for the hedge delay, and how many are needed before hedging
+_LATENCY_WINDOW = 256
+_MIN_LATENCY_SAMPLES = 20
 
-def generate_answer(
-    query: str,
-    context_chunks: List[Dict],
-    max_tokens: int = 500
-) -> Tuple[str, float]:
-    """
-    Generate an answer based on the query and retrieved context chunks.
-    
-    Returns:
-        Tuple of (answer_text, confidence_score)
-    """
-    # Mock mode for local dev
-    if os.environ.get("MOCK_EMBEDDINGS") == "true":
-        sources = [c.get("metadata", {}).get("source", "Unknown") for c in context_chunks]
-        source_list = ", ".join(set(sources)) if sources else "uploaded documents"
-        return (
-            f"[Mock LLM] Based on your documents ({source_list}), here is a placeholder answer for: '{query}'. "
-            f"To get real AI answers, set your COHERE_API_KEY in backend/.env.",
-            75.0
+
+class LLMUnavailable(Exception):
+    """The chat API is down, too slow or shed by the circuit breaker"""
+
+
+class _CircuitBreaker:
+    """closed -> open after consecutive outage errors -> half_open (one trial call) after the cooldown"""
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        # Start of the half-open trial call, None when none is in flight
+        self._trial_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.cooldown_seconds:
+                self.state = "half_open"
+                self._trial_started = None
+            if self.state == "closed":
+                return True
+            # A trial that never reported back (e.g. an abandoned stream) is replaced after a cooldown
+            if self.state == "half_open" and (
+                self._trial_started is None or now - self._trial_started >= self.cooldown_seconds
+            ):
+                self._trial_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+            self._trial_started = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = self.cooldown_seconds - (time.monotonic() - self.opened_at) if self.state == "open" else 0.0
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "retry_in_seconds": round(max(0.0, retry_in), 1),
+            }
+
+
+class _CallStats:
+    """Chat call latencies (for the hedge delay) and outcome counters"""
+
+    def __init__(self, hedge: bool, percentile: float, min_delay_seconds: float, max_hedge_rate: float):
+        self.hedge = hedge
+        self.percentile = percentile
+        self.min_delay_seconds = min_delay_seconds
+        self.max_hedge_rate = max_hedge_rate
+        self._latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.degraded = 0
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < _MIN_LATENCY_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging this call, or None to not hedge it"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            if self.hedged >= self.max_hedge_rate * self.calls:
+                return None
+        delay = self.latency_percentile(self.percentile)
+        return None if delay is None else max(delay, self.min_delay_seconds)
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95, delay = self.latency_percentile(50), self.latency_percentile(95), self.hedge_delay()
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedging": self.hedge,
+                "hedged": self.hedged,
+                "hedge_rate": round(self.hedged / self.calls * 100, 1) if self.calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+                "timeouts": self.timeouts,
+                "failures": self.failures,
+                "degraded_answers": self.degraded,
+                "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+
+
+_breaker = _CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN_SECONDS)
+_calls = _CallStats(LLM_HEDGE, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_DELAY_MS / 1000, LLM_HEDGE_MAX_RATE)
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Circuit breaker state and chat call counters of this process"""
+    return {"circuit_breaker": _breaker.stats(), "chat": _calls.stats()}
+
+
+def _is_outage(error: BaseException) -> bool:
+    if isinstance(error, ApiError):
+        return error.status_code is None or error.status_code in _TRANSIENT_STATUS
+    return isinstance(error, (asyncio.TimeoutError, httpx.TransportError))
+
+
+def _failed(error: Exception) -> Exception:
+    """Record a failed call; outage errors become LLMUnavailable, others are returned as they are"""
+    if not _is_outage(error):
+        # The API answered, so it is up; the request itself was bad
+        _breaker.record_success()
+        return error
+    _breaker.record_failure()
+    _calls.count("timeouts" if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)) else "failures")
+    return LLMUnavailable(f"{type(error).__name__}: {error}" if str(error) else type(error).__name__)
+
+
+def _admit():
+    if not _breaker.allow():
+        raise LLMUnavailable("circuit breaker open")
+    _calls.count("calls")
+
+
+def _chat(request: Dict) -> Any:
+    """client.chat() under the deadline and circuit breaker; raises LLMUnavailable on outages"""
+    _admit()
+    start = time.monotonic()
+    try:
+        response = get_client().chat(
+            **request, request_options={"timeout_in_seconds": LLM_TIMEOUT_SECONDS, "max_retries": 0}
         )
+    except Exception as e:
+        raise _failed(e) from e
+    _breaker.record_success()
+    _calls.observe(time.monotonic() - start)
+    return response
+
+
+async def _chat_async(request: Dict) -> Any:
+    """_chat() for async callers, hedged after the p95 latency when LLM_HEDGE is on"""
+    _admit()
+    start = time.monotonic()
+    try:
+        response = await asyncio.wait_for(_hedged_chat(request), LLM_TIMEOUT_SECONDS)
+    except Exception as e:
+        raise _failed(e) from e
+    _breaker.record_success()
+    _calls.observe(time.monotonic() - start)
+    return response
+
+
+async def _hedged_chat(request: Dict) -> Any:
+    client = get_async_client()
+    options = {"max_retries": 0}
+    tasks = [asyncio.ensure_future(client.chat(**request, request_options=options))]
+    try:
+        delay = _calls.hedge_delay()
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                _calls.count("hedged")
+                tasks.append(asyncio.ensure_future(client.chat(**request, request_options=options)))
+        pending = set(tasks)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not tasks[0]:
+                        _calls.count("hedge_wins")
+                    return task.result()
+            if not pending:
+                # Every request failed: report the last one's error
+                raise done.pop().exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def degraded_answer(context_chunks: List[Dict]) -> str:
+    """The "top sources only" answer given when the LLM is unavailable"""
+    _calls.count("degraded")
+    if not context_chunks:
+        return "The answer service is temporarily unavailable. Please try again in a moment."
+    parts = ["The answer service is temporarily unavailable. These passages from your documents matched your question best:"]
+    for i, chunk in enumerate(context_chunks[:DEGRADED_SOURCES]):
+        source = chunk.get("metadata", {}).get("source", "Unknown")
+        text = chunk.get("text", "")
+        parts.append(f"[{i + 1}] {source}: {text[:300] + '...' if len(text) > 300 else text}")
+    return "\n\n".join(parts)
 
+
+CONFIDENCE_MARKER = "[CONFIDENCE:"
+
+
+def _mock_answer(query: str, context_chunks: List[Dict]) -> Tuple[str, float]:
+    sources = [c.get("metadata", {}).get("source", "Unknown") for c in context_chunks]
+    source_list = ", ".join(set(sources)) if sources else "uploaded documents"
+    return (
+        f"[Mock LLM] Based on your documents ({source_list}), here is a placeholder answer for: '{query}'. "
+        f"To get real AI answers, set your COHERE_API_KEY in backend/.env.",
+        75.0
+    )
+
+
+def _build_prompt(query: str, context_chunks: List[Dict]) -> str:
     # Build context from chunks
     context_parts = []
     for i, chunk in enumerate(context_chunks):
@@ -51,7 +296,7 @@ def generate_answer(
     
     context = "\n\n---\n\n".join(context_parts)
     
-    prompt = f"""You are AgentIQ, an AI knowledge assistant for support agents. Your job is to:
+    return f"""You are AgentIQ, an AI knowledge assistant for support agents. Your job is to:
 1. Answer questions accurately based ONLY on the provided context
 2. Always cite which source(s) you used for your answer
 3. If the context doesn't contain enough information, say so clearly
@@ -67,44 +312,184 @@ Question: {query}
 Provide a helpful answer based on the context above. Include source citations.
 At the end of your response, write exactly: [CONFIDENCE: XX%] where XX is your confidence score from 0-100."""
 
+
+def _answer_request(query: str, context_chunks: List[Dict], max_tokens: int) -> Dict:
+    return {
+        "message": _build_prompt(query, context_chunks),
+        "model": CHAT_MODEL,
+        "temperature": 0.3,
+        "max_tokens": max_tokens,
+    }
+
+
+def parse_confidence(answer: str) -> Tuple[str, float]:
+    """Split the trailing [CONFIDENCE: XX%] marker off an answer; 70 if it is missing or malformed"""
+    confidence = 70.0  # Default
+    if CONFIDENCE_MARKER in answer:
+        try:
+            conf_str = answer.split(CONFIDENCE_MARKER)[1].split("%]")[0].strip()
+            confidence = float(conf_str)
+            # Remove confidence from answer text
+            answer = answer.split(CONFIDENCE_MARKER)[0].strip()
+        except (IndexError, ValueError):
+            pass
+    return answer, confidence
+
+
+def generate_answer(
+    query: str,
+    context_chunks: List[Dict],
+    max_tokens: int = 500
+) -> Tuple[str, float]:
+    """
+    Generate an answer based on the query and retrieved context chunks.
+    
+    Returns:
+        Tuple of (answer_text, confidence_score)
+    """
+    # Mock mode for local dev
+    if os.environ.get("MOCK_EMBEDDINGS") == "true":
+        return _mock_answer(query, context_chunks)
+
     try:
-        response = _get_client().chat(
-            message=prompt,
-            model="command-a-03-2025",
-            temperature=0.3,
-            max_tokens=max_tokens
-        )
-        
-        answer = response.text
-        
-        # Extract confidence score
-        confidence = 70.0  # Default
-        if "[CONFIDENCE:" in answer:
-            try:
-                conf_str = answer.split("[CONFIDENCE:")[1].split("%]")[0].strip()
-                confidence = float(conf_str)
-                # Remove confidence from answer text
-                answer = answer.split("[CONFIDENCE:")[0].strip()
-            except (IndexError, ValueError):
-                pass
-        
-        return answer, confidence
+        response = _chat(_answer_request(query, context_chunks, max_tokens))
+        return parse_confidence(response.text)
+    except LLMUnavailable:
+        return degraded_answer(context_chunks), 0.0
+    except Exception as e:
+        return f"Error generating answer: {str(e)}", 0.0
+
+
+async def generate_answer_async(
+    query: str,
+    context_chunks: List[Dict],
+    max_tokens: int = 500
+) -> Tuple[str, float]:
+    """generate_answer() without blocking the event loop"""
+    if os.environ.get("MOCK_EMBEDDINGS") == "true":
+        return _mock_answer(query, context_chunks)
+
+    try:
+        response = await _chat_async(_answer_request(query, context_chunks, max_tokens))
+        return parse_confidence(response.text)
+    except LLMUnavailable:
+        return degraded_answer(context_chunks), 0.0
     except Exception as e:
         return f"Error generating answer: {str(e)}", 0.0
 
 
+class ConfidenceStripper:
+    """
+    Passes streamed answer text through, holding back anything that could be
+    the start of the trailing [CONFIDENCE: XX%] marker so it never reaches the
+    client. The full text is kept for parse_confidence() at the end.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._emitted = 0
+
+    def feed(self, delta: str) -> str:
+        self.text += delta
+        marker_at = self.text.find(CONFIDENCE_MARKER)
+        if marker_at >= 0:
+            safe = marker_at
+        else:
+            # Longest tail of the text that is a prefix of the marker
+            held = next(
+                (n for n in range(min(len(CONFIDENCE_MARKER), len(self.text)), 0, -1)
+                 if CONFIDENCE_MARKER.startswith(self.text[-n:])),
+                0,
+            )
+            safe = len(self.text) - held
+        out = self.text[self._emitted:safe] if safe > self._emitted else ""
+        self._emitted = max(self._emitted, safe)
+        return out
+
+    def finish(self) -> str:
+        """Text held back that turned out not to be the marker"""
+        if CONFIDENCE_MARKER in self.text:
+            return ""
+        out = self.text[self._emitted:]
+        self._emitted = len(self.text)
+        return out
+
+
+async def stream_answer_async(
+    query: str,
+    context_chunks: List[Dict],
+    max_tokens: int = 500
+) -> AsyncIterator[str]:
+    """
+    generate_answer() as a stream of raw text deltas, marker included (see
+    ConfidenceStripper). Errors are yielded as answer text, like generate_answer.
+    """
+    if os.environ.get("MOCK_EMBEDDINGS") == "true":
+        for delta in _mock_stream(query, context_chunks):
+            yield delta
+        return
+
+    emitted = False
+    try:
+        _admit()
+        events = get_async_client().chat_stream(
+            **_answer_request(query, context_chunks, max_tokens), request_options={"max_retries": 0}
+        ).__aiter__()
+        while True:
+            try:
+                # The deadline bounds the wait for each event, so a stalled stream is cut off too
+                event = await asyncio.wait_for(events.__anext__(), LLM_TIMEOUT_SECONDS)
+            except StopAsyncIteration:
+                break
+            if event.event_type == "text-generation":
+                emitted = True
+                yield event.text
+        _breaker.record_success()
+    except Exception as e:
+        yield _stream_error(e, emitted, context_chunks)
+
+
+def _stream_error(error: Exception, emitted: bool, context_chunks: List[Dict]) -> str:
+    """Final delta of a failed stream: the degraded answer if nothing was sent yet, else the error"""
+    if not isinstance(error, LLMUnavailable):
+        error = _failed(error)
+    if isinstance(error, LLMUnavailable) and not emitted:
+        return f"{degraded_answer(context_chunks)} [CONFIDENCE: 0%]"
+    return f"Error generating answer: {str(error)} [CONFIDENCE: 0%]"
+
+
+def _mock_stream(query: str, context_chunks: List[Dict]) -> Iterator[str]:
+    answer, confidence = _mock_answer(query, context_chunks)
+    for word in f"{answer} [CONFIDENCE: {confidence:.0f}%]".split(" "):
+        yield word + " "
+
+
 def generate_answer_no_context(query: str) -> str:
     """Generate a response when no relevant context is found"""
     if os.environ.get("MOCK_EMBEDDINGS") == "true":
         return "No relevant documents were found for your question. Please upload some documents first, then try again."
     
     try:
-        response = _get_client().chat(
-            message=f"The user asked: '{query}' but no relevant documents were found in the knowledge base. Politely explain this and suggest they upload relevant documents or rephrase their question.",
-            model="command-a-03-2025",
-            temperature=0.5,
-            max_tokens=150
-        )
-        return response.text
+        return _chat(_no_context_request(query)).text
     except Exception as e:
         return f"I couldn't find any relevant documents for your question. Please upload some documents first. (Error: {str(e)})"
+
+
+async def generate_answer_no_context_async(query: str) -> str:
+    """generate_answer_no_context() without blocking the event loop"""
+    if os.environ.get("MOCK_EMBEDDINGS") == "true":
+        return "No relevant documents were found for your question. Please upload some documents first, then try again."
+    
+    try:
+        return (await _chat_async(_no_context_request(query))).text
+    except Exception as e:
+        return f"I couldn't find any relevant documents for your question. Please upload some documents first. (Error: {str(e)})"
+
+
+def _no_context_request(query: str) -> Dict:
+    return {
+        "message": f"The user asked: '{query}' but no relevant documents were found in the knowledge base. Politely explain this and suggest they upload relevant documents or rephrase their question.",
+        "model": CHAT_MODEL,
+        "temperature": 0.5,
+        "max_tokens": 150,
+    }
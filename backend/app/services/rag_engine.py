@@ -1,68 +1,306 @@
 """
 RAG Engine - Core orchestration for retrieval-augmented generation
+
+The per-question pipelines (query_knowledge_base, stream_knowledge_base)
+are async end to end: embedding and generation await the Cohere API, and
+vector search, being CPU-bound, runs on a bounded thread pool, so one
+worker serves many questions at once without stalling its event loop.
 """
 
-from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Any, AsyncIterator, List, Optional
+import asyncio
+import os
 import time
 
-from app.services.embedder import get_embedding, get_query_embedding
-from app.services.llm_client import generate_answer, generate_answer_no_context
-from app.database.vector_store import search_similar
+from app.services.answer_cache import ANSWER_CACHE, get_answer_cache
+from app.services.context_packer import pack_context
+from app.services.embedder import get_query_embedding, get_query_embedding_async, get_query_embeddings
+from app.services.llm_client import (
+    ConfidenceStripper,
+    generate_answer,
+    generate_answer_async,
+    generate_answer_no_context,
+    generate_answer_no_context_async,
+    parse_confidence,
+    stream_answer_async,
+)
+from app.database.vector_store import search_lexical, search_similar, search_similar_many
+
+# Merge BM25 hits into the vector hits, so exact error codes, SKUs and names are found
+HYBRID_SEARCH = os.environ.get("RAG_HYBRID_SEARCH", "true").lower() == "true"
+# Each retriever contributes top_k * HYBRID_CANDIDATES candidates to the fusion
+HYBRID_CANDIDATES = 4
+# Reciprocal rank fusion constant (Cormack et al.); keeps the top ranks from dominating
+RRF_K = 60
+# Threads running searches (and answer cache lookups) for async requests; more queue for a free one
+SEARCH_WORKERS = int(os.environ.get("RAG_SEARCH_WORKERS", str(os.cpu_count() or 4)))
+
+_search_executor = ThreadPoolExecutor(max_workers=max(1, SEARCH_WORKERS), thread_name_prefix="rag-search")
+
 
+def _run_blocking(fn, *args):
+    """Run fn(*args) on the search pool without blocking the event loop"""
+    return asyncio.get_running_loop().run_in_executor(_search_executor, partial(fn, *args))
 
-def query_knowledge_base(
+
+async def query_knowledge_base(
     query: str,
     top_k: int = 5,
     min_relevance: float = 0.3,
-    user_id: str = None
+    user_id: str = None,
+    filters: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Main RAG pipeline: Query -> Embed -> Search -> Generate Answer
     
+    A question close enough to one this user already asked (same top_k and
+    filters) is answered from the answer cache, skipping search and generation.
+    
     Args:
         query: The user's question
         top_k: Number of similar chunks to retrieve
         min_relevance: Minimum similarity score (0-1) to include a result
+        filters: Optional metadata filter (source, file_type, uploaded_after)
     
     Returns:
         Dictionary containing answer, sources, confidence, and metadata
     """
     start_time = time.time()
+    query_embedding = await get_query_embedding_async(query)
+    cached = await _run_blocking(_cached_answer, query, query_embedding, top_k, user_id, filters, start_time)
+    if cached:
+        return cached
+    search_results = await _run_blocking(_retrieve, query, query_embedding, top_k, user_id, filters)
     
-    # Step 1: Generate embedding for the query
-    query_embedding = get_query_embedding(query)
+    # Steps 3-4: Filter results and generate the answer
+    context_chunks, sources, retrieved = _select_context(search_results, 0, min_relevance)
+    if context_chunks:
+        answer, confidence = await generate_answer_async(query, context_chunks)
+    else:
+        answer = await generate_answer_no_context_async(query)
+        confidence = 0.0
     
-    # Step 2: Search for similar documents
-    search_results = search_similar(query_embedding, n_results=top_k, user_id=user_id)
+    result = {
+        "query": query,
+        "answer": answer,
+        "confidence": confidence,
+        "sources": sources,
+        "chunks_retrieved": retrieved,
+        "passages_used": len(context_chunks),
+        "response_time_ms": int((time.time() - start_time) * 1000)
+    }
+    _cache_answer(query_embedding, top_k, user_id, filters, result, start_time)
+    return result
+
+
+async def stream_knowledge_base(
+    query: str,
+    top_k: int = 5,
+    min_relevance: float = 0.3,
+    user_id: str = None,
+    filters: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    query_knowledge_base() as a stream of events, so the answer can be shown as it is generated:
     
-    # Step 3: Filter and format results
-    context_chunks = []
-    sources = []
+        {"event": "sources", "data": {"sources": [...], "chunks_retrieved": n, "passages_used": m}}   once, before generation
+        {"event": "token", "data": {"text": "..."}}                              answer text as it arrives
+        {"event": "done", "data": <same dict as query_knowledge_base>}           once, at the end
+    """
+    start_time = time.time()
+    query_embedding = await get_query_embedding_async(query)
+    cached = await _run_blocking(_cached_answer, query, query_embedding, top_k, user_id, filters, start_time)
+    if cached:
+        yield {"event": "sources", "data": {
+            "sources": cached["sources"],
+            "chunks_retrieved": cached["chunks_retrieved"],
+            "passages_used": cached["passages_used"],
+        }}
+        yield {"event": "token", "data": {"text": cached["answer"]}}
+        yield {"event": "done", "data": cached}
+        return
+    search_results = await _run_blocking(_retrieve, query, query_embedding, top_k, user_id, filters)
+    context_chunks, sources, retrieved = _select_context(search_results, 0, min_relevance)
+    yield {"event": "sources", "data": {
+        "sources": sources, "chunks_retrieved": retrieved, "passages_used": len(context_chunks)
+    }}
     
-    if search_results and search_results.get("documents"):
-        documents = search_results["documents"][0]
-        metadatas = search_results.get("metadatas", [[]])[0]
-        distances = search_results.get("distances", [[]])[0]
-        
-        for i, (doc, metadata, distance) in enumerate(zip(documents, metadatas, distances)):
-            # ChromaDB returns L2 distance, convert to similarity
-            # Lower distance = more similar
-            similarity = 1 / (1 + distance)
-            
-            if similarity >= min_relevance:
-                context_chunks.append({
-                    "text": doc,
-                    "metadata": metadata,
-                    "similarity": similarity
-                })
-                
-                source_info = {
-                    "source": metadata.get("source", "Unknown"),
-                    "chunk_index": metadata.get("chunk_index", 0),
-                    "similarity": round(similarity * 100, 1)
-                }
-                if source_info not in sources:
-                    sources.append(source_info)
+    if context_chunks:
+        stripper = ConfidenceStripper()
+        async for delta in stream_answer_async(query, context_chunks):
+            text = stripper.feed(delta)
+            if text:
+                yield {"event": "token", "data": {"text": text}}
+        text = stripper.finish()
+        if text:
+            yield {"event": "token", "data": {"text": text}}
+        answer, confidence = parse_confidence(stripper.text)
+    else:
+        answer = await generate_answer_no_context_async(query)
+        confidence = 0.0
+        yield {"event": "token", "data": {"text": answer}}
+    
+    result = {
+        "query": query,
+        "answer": answer,
+        "confidence": confidence,
+        "sources": sources,
+        "chunks_retrieved": retrieved,
+        "passages_used": len(context_chunks),
+        "response_time_ms": int((time.time() - start_time) * 1000)
+    }
+    _cache_answer(query_embedding, top_k, user_id, filters, result, start_time)
+    yield {"event": "done", "data": result}
+
+
+def _cached_answer(
+    query: str,
+    query_embedding: List[float],
+    top_k: int,
+    user_id: str = None,
+    filters: Optional[Dict[str, Any]] = None,
+    start_time: float = None
+) -> Optional[Dict[str, Any]]:
+    """The answer cache's result for this question, marked cached and timed; None (and a recorded miss) otherwise"""
+    if not ANSWER_CACHE:
+        return None
+    cache = get_answer_cache()
+    cached = cache.lookup(user_id, query_embedding, top_k, filters)
+    if cached is None:
+        cache.record(user_id, hit=False)
+        return None
+    response_time_ms = int((time.time() - start_time) * 1000)
+    cache.record(user_id, hit=True, saved_ms=cached["response_time_ms"] - response_time_ms)
+    cached.update(query=query, response_time_ms=response_time_ms, cached=True)
+    return cached
+
+
+def _cache_answer(
+    query_embedding: List[float],
+    top_k: int,
+    user_id: str = None,
+    filters: Optional[Dict[str, Any]] = None,
+    result: Dict[str, Any] = None,
+    start_time: float = None
+):
+    """
+    Cache a generated answer; errors and answers without sources (confidence 0) are not reused.
+    The entry dates from start_time, before retrieval, so invalidations during generation apply to it.
+    """
+    if ANSWER_CACHE and result["confidence"] > 0 and result["sources"]:
+        get_answer_cache().store(user_id, query_embedding, top_k, filters, result, created_at=start_time)
+
+
+def _retrieve(
+    query: str,
+    query_embedding: List[float],
+    top_k: int,
+    user_id: str = None,
+    filters: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Step 2: search for documents similar to the embedded query (and matching its terms)"""
+    if HYBRID_SEARCH:
+        vector_results = search_similar(query_embedding, n_results=top_k * HYBRID_CANDIDATES, user_id=user_id, filters=filters)
+        return _hybrid_results(query, query_embedding, vector_results, top_k, user_id, filters)
+    return search_similar(query_embedding, n_results=top_k, user_id=user_id, filters=filters)
+
+
+def query_knowledge_base_batch(
+    queries: List[str],
+    top_k: int = 5,
+    min_relevance: float = 0.3,
+    user_id: str = None,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Batched RAG pipeline for offline jobs (evaluation, ticket triage):
+    all questions are embedded together and scored against the corpus in one
+    matrix-matrix product, then answered one by one.
+    
+    Returns:
+        One result per query, in the same order and shape as query_knowledge_base
+    """
+    if not queries:
+        return []
+    start_time = time.time()
+    
+    query_embeddings = get_query_embeddings(queries)
+    n_results = top_k * HYBRID_CANDIDATES if HYBRID_SEARCH else top_k
+    search_results = search_similar_many(query_embeddings, n_results=n_results, user_id=user_id, filters=filters)
+    per_query = [{key: [hits[i]] for key, hits in search_results.items()} for i in range(len(queries))]
+    if HYBRID_SEARCH:
+        per_query = [
+            _hybrid_results(query, query_embedding, vector_results, top_k, user_id, filters)
+            for query, query_embedding, vector_results in zip(queries, query_embeddings, per_query)
+        ]
+    
+    # Embedding and search cost is shared; each result reports that share plus its own generation time
+    shared_s = (time.time() - start_time) / len(queries)
+    results = []
+    for query, query_results in zip(queries, per_query):
+        result = _answer_from_results(query, query_results, 0, min_relevance, time.time() - shared_s)
+        results.append(result)
+    return results
+
+
+def _hybrid_results(
+    query: str,
+    query_embedding: List[float],
+    vector_results: Dict[str, Any],
+    top_k: int,
+    user_id: str = None,
+    filters: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Fuse one query's vector hits with its BM25 hits into a top_k result of the same shape"""
+    lexical_results = search_lexical(
+        query, n_results=top_k * HYBRID_CANDIDATES, user_id=user_id, filters=filters, query_embedding=query_embedding
+    )
+    return _fuse_results([vector_results, lexical_results], top_k)
+
+
+def _fuse_results(result_sets: List[Dict[str, Any]], top_k: int) -> Dict[str, Any]:
+    """
+    Reciprocal rank fusion: each chunk scores sum(1 / (RRF_K + rank)) over the
+    rankings it appears in. Rank-based, so BM25 and cosine scores never need
+    to be put on one scale.
+    """
+    fused: Dict[str, float] = {}
+    hits: Dict[str, tuple] = {}
+    for results in result_sets:
+        ids = results.get("ids", [[]])[0]
+        for rank, chunk_id in enumerate(ids, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1 / (RRF_K + rank)
+            if chunk_id not in hits:
+                i = rank - 1
+                embeddings = results.get("embeddings", [[]])[0]
+                hits[chunk_id] = (
+                    results["documents"][0][i],
+                    results["metadatas"][0][i],
+                    results["distances"][0][i],
+                    embeddings[i] if i < len(embeddings) else None,
+                )
+    
+    ranked = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return {
+        "ids": [ranked],
+        "documents": [[hits[c][0] for c in ranked]],
+        "metadatas": [[hits[c][1] for c in ranked]],
+        "distances": [[hits[c][2] for c in ranked]],
+        "embeddings": [[hits[c][3] for c in ranked]],
+    }
+
+
+def _answer_from_results(
+    query: str,
+    search_results: Dict[str, Any],
+    index: int,
+    min_relevance: float,
+    start_time: float
+) -> Dict[str, Any]:
+    """Filter the index-th query's search hits and generate its answer"""
+    context_chunks, sources, retrieved = _select_context(search_results, index, min_relevance)
     
     # Step 4: Generate answer
     if context_chunks:
@@ -70,7 +308,6 @@ def query_knowledge_base(
     else:
         answer = generate_answer_no_context(query)
         confidence = 0.0
-        sources = []
     
     # Calculate response time
     response_time_ms = int((time.time() - start_time) * 1000)
@@ -80,15 +317,60 @@ def query_knowledge_base(
         "answer": answer,
         "confidence": confidence,
         "sources": sources,
-        "chunks_retrieved": len(context_chunks),
+        "chunks_retrieved": retrieved,
+        "passages_used": len(context_chunks),
         "response_time_ms": response_time_ms
     }
 
 
-def get_context_preview(query: str, top_k: int = 3, user_id: str = None) -> List[Dict]:
+def _select_context(search_results: Dict[str, Any], index: int, min_relevance: float):
+    """
+    Step 3: the index-th query's hits above min_relevance, packed for the
+    prompt (see context_packer), as (context passages, distinct sources,
+    number of hits above min_relevance). Packing merges adjacent chunks and
+    drops near-duplicates, so there may be fewer passages than hits.
+    """
+    candidates = []
+    
+    if search_results and search_results.get("documents"):
+        documents = search_results["documents"][index]
+        metadatas = search_results.get("metadatas", [[]])[index]
+        distances = search_results.get("distances", [[]])[index]
+        embeddings = search_results["embeddings"][index] if search_results.get("embeddings") else []
+        
+        for i, (doc, metadata, distance) in enumerate(zip(documents, metadatas, distances)):
+            # ChromaDB returns L2 distance, convert to similarity
+            # Lower distance = more similar
+            similarity = 1 / (1 + distance)
+            
+            if similarity >= min_relevance:
+                candidates.append({
+                    "text": doc,
+                    "metadata": metadata,
+                    "similarity": similarity,
+                    "embedding": embeddings[i] if i < len(embeddings) else None
+                })
+    
+    context_chunks = pack_context(candidates)
+    # Cite the chunks that made it into the prompt
+    sources = []
+    for passage in context_chunks:
+        for chunk in passage["parts"]:
+            source_info = {
+                "source": chunk["metadata"].get("source", "Unknown"),
+                "chunk_index": chunk["metadata"].get("chunk_index", 0),
+                "similarity": round(chunk["similarity"] * 100, 1)
+            }
+            if source_info not in sources:
+                sources.append(source_info)
+    
+    return context_chunks, sources, len(candidates)
+
+
+def get_context_preview(query: str, top_k: int = 3, user_id: str = None, filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
     """Get a preview of matching context without generating an answer"""
     query_embedding = get_query_embedding(query)
-    search_results = search_similar(query_embedding, n_results=top_k, user_id=user_id)
+    search_results = search_similar(query_embedding, n_results=top_k, user_id=user_id, filters=filters)
     
     chunks = []
     if search_results and search_results.get("documents"):
@@ -105,3 +387,22 @@ def get_context_preview(query: str, top_k: int = 3, user_id: str = None) -> List
             })
     
     return chunks
+
+
+def get_lexical_preview(query: str, top_k: int = 3, user_id: str = None, filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+    """Preview matching context by BM25 - falls back to get_context_preview (an embedding call) when nothing matches"""
+    search_results = search_lexical(query, n_results=top_k, user_id=user_id, filters=filters)
+    
+    chunks = []
+    for doc, metadata, score in zip(
+        search_results["documents"][0], search_results["metadatas"][0], search_results["scores"][0]
+    ):
+        chunks.append({
+            "text": doc[:300] + "..." if len(doc) > 300 else doc,
+            "source": metadata.get("source", "Unknown"),
+            "score": round(score, 2)
+        })
+    
+    if not chunks:
+        return get_context_preview(query, top_k=top_k, user_id=user_id, filters=filters)
+    return chunks
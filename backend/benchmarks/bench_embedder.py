@@ -0,0 +1,118 @@
+"""
+Embedding pipeline benchmarks, offline (EMBEDDING_BACKEND=hashing).
+
+Run from the backend directory:
+    python -m benchmarks.bench_embedder hashing --sizes 1000 10000
+    python -m benchmarks.bench_embedder pipeline --chunks 100000 --queries 200
+
+hashing:  texts/s of the hashed n-gram backend, and whether a query built
+          from a few words of a chunk finds that chunk in the top 5.
+pipeline: upload -> search through get_embeddings, the vector store and
+          get_query_embedding, with no network access.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+os.environ.setdefault("EMBEDDING_BACKEND", "hashing")
+
+import numpy as np
+
+from app.services import embedder
+from app.services.hashing_embedder import hash_embed
+from app.database.vector_store import SimpleVectorStore
+from benchmarks.bench_vector_store import _percentiles, _synthetic_text
+
+
+def _word_queries(texts: List[str], n_queries: int, n_words: int = 6, seed: int = 1):
+    """(chunk number, query) pairs: a run of n_words words from a random chunk"""
+    rng = np.random.default_rng(seed)
+    out = []
+    for target in rng.choice(len(texts), n_queries, replace=False):
+        words = texts[target].split()
+        start = rng.integers(0, max(1, len(words) - n_words))
+        out.append((int(target), " ".join(words[start:start + n_words])))
+    return out
+
+
+def bench_hashing(sizes: List[int], dim: int, n_queries: int) -> List[Dict]:
+    rows = []
+    for n in sizes:
+        texts = _synthetic_text(n)
+        start = time.perf_counter()
+        vectors = hash_embed(texts, dim)
+        elapsed = time.perf_counter() - start
+        assert np.array_equal(vectors[:10], hash_embed(texts[:10], dim)), "embeddings must be deterministic"
+
+        queries = _word_queries(texts, min(n_queries, n))
+        query_vecs = hash_embed([q for _, q in queries], dim)
+        top5 = np.argsort(-(query_vecs @ vectors.T), axis=1)[:, :5]
+        recall = float(np.mean([target in top for (target, _), top in zip(queries, top5)]))
+        row = {"texts": n, "texts_per_s": n / elapsed, "recall_at_5": recall}
+        rows.append(row)
+        print(f"{n:>9,} texts  {n / elapsed:9,.0f} texts/s  word-query recall@5 {recall:.3f}")
+    return rows
+
+
+def bench_pipeline(n_chunks: int, n_queries: int) -> Dict:
+    texts = _synthetic_text(n_chunks)
+    workdir = tempfile.mkdtemp(prefix="bench_emb_")
+    try:
+        store = SimpleVectorStore(store_dir=os.path.join(workdir, "vector_store"))
+        start = time.perf_counter()
+        # Upload-sized documents of 500 chunks, embedded and added like the documents route
+        for first in range(0, n_chunks, 500):
+            batch = texts[first:first + 500]
+            embeddings = embedder.get_embeddings(batch)
+            store.add(
+                [f"chunk{first + i}" for i in range(len(batch))],
+                batch,
+                embeddings,
+                [{"source": f"doc{first // 500}.txt", "chunk_index": i, "user_id": "bench"} for i in range(len(batch))],
+            )
+        ingest_s = time.perf_counter() - start
+
+        latency_ms, hits = [], 0
+        for target, query in _word_queries(texts, n_queries):
+            start = time.perf_counter()
+            result = store.search(embedder.get_query_embedding(query), 5, user_id="bench")
+            latency_ms.append((time.perf_counter() - start) * 1000)
+            hits += f"chunk{target}" in result["ids"][0]
+        p50, p99 = _percentiles(latency_ms)
+        row = {"chunks": n_chunks, "ingest_chunks_per_s": n_chunks / ingest_s, "query_p50_ms": p50,
+               "query_p99_ms": p99, "recall_at_5": hits / n_queries}
+        print(
+            f"{n_chunks:>9,} chunks  ingest {n_chunks / ingest_s:9,.0f} chunks/s  "
+            f"embed+search p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  recall@5 {hits / n_queries:.3f}"
+        )
+        return row
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    p = sub.add_parser("hashing", help="hashed n-gram backend throughput and retrieval sanity")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000])
+    p.add_argument("--dim", type=int, default=1024)
+    p.add_argument("--queries", type=int, default=200)
+
+    p = sub.add_parser("pipeline", help="offline upload -> search throughput and latency")
+    p.add_argument("--chunks", type=int, default=100_000)
+    p.add_argument("--queries", type=int, default=200)
+
+    args = parser.parse_args()
+    if args.mode == "hashing":
+        bench_hashing(args.sizes, args.dim, args.queries)
+    elif args.mode == "pipeline":
+        bench_pipeline(args.chunks, args.queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+LLM client tail-latency benchmarks against a local fake Cohere chat server.
+
+Run from the backend directory:
+    python -m benchmarks.bench_llm hedging --requests 400 --concurrency 16 --slow-rate 0.05
+    python -m benchmarks.bench_llm deadline --timeout 0.5
+    python -m benchmarks.bench_llm breaker --cooldown 1
+
+The server answers POST /v1/chat (plain and streamed) after an injected
+latency: base_ms with +-20% jitter, or slow_ms for a slow_rate fraction of
+requests. It can also fail every request with a status code, or hang.
+
+hedging:  latency percentiles with hedging off, then on (same workload).
+deadline: calls to a hanging server return degraded answers at the deadline,
+          for plain and streamed answers.
+breaker:  an outage opens the breaker, calls then fail fast without reaching
+          the server, and after the cooldown one trial call closes it again.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+
+CONTEXT = [{"text": "Error E-4012 means the printer is out of toner.", "metadata": {"source": "printers.md"}}]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops bursts of new connections (e.g. hedges), which then wait ~1s for a SYN retry
+    request_queue_size = 128
+
+
+class FakeChatServer:
+    """Threaded HTTP server imitating Cohere's v1 chat endpoint, with injected latency and failures"""
+
+    def __init__(self):
+        self.base_ms = 40.0
+        self.slow_ms = 1000.0
+        self.slow_rate = 0.0
+        self.fail_status: Optional[int] = None
+        self.hang = False
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                if server.hang:
+                    time.sleep(30)
+                if server.fail_status:
+                    return self._send(server.fail_status, b'{"message": "injected failure"}')
+                slow = random.random() < server.slow_rate
+                time.sleep((server.slow_ms if slow else server.base_ms * random.uniform(0.8, 1.2)) / 1000)
+                text = "Replace the toner cartridge. [CONFIDENCE: 85%]"
+                if not body.get("stream"):
+                    return self._send(200, json.dumps({"text": text, "generation_id": "fake"}).encode())
+                events = [{"event_type": "stream-start", "generation_id": "fake", "is_finished": False}]
+                events += [{"event_type": "text-generation", "text": word + " ", "is_finished": False} for word in text.split(" ")]
+                events.append({"event_type": "stream-end", "finish_reason": "COMPLETE", "is_finished": True,
+                               "response": {"text": text, "generation_id": "fake"}})
+                self._send(200, b"".join(json.dumps(e).encode() + b"\n" for e in events), "application/stream+json")
+
+            def _send(self, status: int, payload: bytes, content_type: str = "application/json"):
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled this request (the losing half of a hedge)
+                    pass
+
+        self.httpd = _Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+
+def _start_server() -> FakeChatServer:
+    """Start the fake server and point the Cohere clients at it (before app modules are imported)"""
+    server = FakeChatServer()
+    os.environ["COHERE_BASE_URL"] = server.url
+    os.environ["COHERE_API_KEY"] = "fake-key"
+    os.environ.pop("MOCK_EMBEDDINGS", None)
+    return server
+
+
+def _percentiles_ms(samples: List[float]) -> Dict[str, float]:
+    ms = np.asarray(samples) * 1000
+    return {f"p{p}": float(np.percentile(ms, p)) for p in (50, 95, 99)}
+
+
+async def _run_load(llm_client, n_requests: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await llm_client.generate_answer_async("What does E-4012 mean?", CONTEXT)
+            return time.perf_counter() - start
+
+    return list(await asyncio.gather(*(one() for _ in range(n_requests))))
+
+
+def bench_hedging(server: FakeChatServer, n_requests: int, concurrency: int, slow_rate: float) -> List[Dict]:
+    from app.services import llm_client
+
+    server.slow_rate = slow_rate
+    rows = []
+    for hedge in (False, True):
+        llm_client._calls = llm_client._CallStats(
+            hedge, llm_client.LLM_HEDGE_PERCENTILE, llm_client.LLM_HEDGE_MIN_DELAY_MS / 1000, llm_client.LLM_HEDGE_MAX_RATE
+        )
+        # Warm-up calls fill the latency window the hedge delay is taken from
+        asyncio.run(_run_load(llm_client, 50, concurrency))
+        before = server.requests
+        latencies = asyncio.run(_run_load(llm_client, n_requests, concurrency))
+        stats = llm_client.get_llm_stats()["chat"]
+        row = {"hedging": hedge, **_percentiles_ms(latencies), "server_requests": server.requests - before,
+               "hedge_rate": stats["hedge_rate"], "hedge_wins": stats["hedge_wins"], "hedge_delay_ms": stats["hedge_delay_ms"]}
+        rows.append(row)
+        print(
+            f"hedging {'on ' if hedge else 'off'}  p50 {row['p50']:7.1f} ms  p95 {row['p95']:7.1f} ms  "
+            f"p99 {row['p99']:7.1f} ms  server requests {row['server_requests']:5}  "
+            f"hedged {row['hedge_rate']:5.1f}%  hedge wins {row['hedge_wins']}  delay {row['hedge_delay_ms']} ms"
+        )
+    return rows
+
+
+def bench_deadline(server: FakeChatServer, timeout: float) -> Dict:
+    from app.services import llm_client
+
+    llm_client.LLM_TIMEOUT_SECONDS = timeout
+    server.hang = True
+
+    async def run():
+        start = time.perf_counter()
+        answer, confidence = await llm_client.generate_answer_async("What does E-4012 mean?", CONTEXT)
+        plain = time.perf_counter() - start
+        assert confidence == 0.0 and "printers.md" in answer, answer
+        start = time.perf_counter()
+        streamed = "".join([delta async for delta in llm_client.stream_answer_async("What does E-4012 mean?", CONTEXT)])
+        stream = time.perf_counter() - start
+        assert "printers.md" in streamed and streamed.endswith("[CONFIDENCE: 0%]"), streamed
+        return plain, stream
+
+    plain, stream = asyncio.run(run())
+    server.hang = False
+    row = {"timeout_s": timeout, "plain_s": plain, "stream_s": stream, **llm_client.get_llm_stats()["chat"]}
+    print(f"deadline {timeout:.2f}s  plain answer degraded after {plain:.2f}s  streamed after {stream:.2f}s  "
+          f"timeouts {row['timeouts']}  degraded {row['degraded_answers']}")
+    return row
+
+
+def bench_breaker(server: FakeChatServer, cooldown: float) -> Dict:
+    from app.services import llm_client
+
+    llm_client._breaker = llm_client._CircuitBreaker(llm_client.LLM_BREAKER_FAILURES, cooldown)
+
+    async def call() -> float:
+        start = time.perf_counter()
+        await llm_client.generate_answer_async("What does E-4012 mean?", CONTEXT)
+        return time.perf_counter() - start
+
+    async def run():
+        await call()
+        assert llm_client._breaker.state == "closed"
+        server.fail_status = 503
+        before = server.requests
+        outage = [await call() for _ in range(50)]
+        reached = server.requests - before
+        assert llm_client._breaker.state == "open" and reached == llm_client.LLM_BREAKER_FAILURES, reached
+        server.fail_status = None
+        await asyncio.sleep(cooldown)
+        await call()
+        assert llm_client._breaker.state == "closed"
+        return outage, reached
+
+    outage, reached = asyncio.run(run())
+    fast = outage[reached:]
+    row = {"outage_calls": len(outage), "reached_server": reached,
+           "fast_fail_p50_ms": float(np.median(fast) * 1000), **llm_client._breaker.stats()}
+    print(f"outage: {len(outage)} calls, {reached} reached the server, the rest failed fast "
+          f"(p50 {row['fast_fail_p50_ms']:.3f} ms); closed again after a {cooldown:.1f}s cooldown")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    p = sub.add_parser("hedging", help="latency percentiles with hedging off and on")
+    p.add_argument("--requests", type=int, default=400)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--slow-rate", type=float, default=0.05)
+
+    p = sub.add_parser("deadline", help="answers from a hanging server degrade at the deadline")
+    p.add_argument("--timeout", type=float, default=0.5)
+
+    p = sub.add_parser("breaker", help="circuit breaker through an outage and recovery")
+    p.add_argument("--cooldown", type=float, default=1.0)
+
+    args = parser.parse_args()
+    server = _start_server()
+    if args.mode == "hedging":
+        bench_hedging(server, args.requests, args.concurrency, args.slow_rate)
+    elif args.mode == "deadline":
+        bench_deadline(server, args.timeout)
+    elif args.mode == "breaker":
+        bench_breaker(server, args.cooldown)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,595 @@
+"""
+Vector store benchmarks on synthetic data.
+
+Run from the backend directory:
+    python -m benchmarks.bench_vector_store persistence --sizes 10000 100000 1000000
+    python -m benchmarks.bench_vector_store ann --sizes 100000 500000 2000000 --dim 256
+    python -m benchmarks.bench_vector_store quantization --sizes 100000 500000
+    python -m benchmarks.bench_vector_store concurrency --size 100000 --threads 1 2 4 8
+    python -m benchmarks.bench_vector_store workers --size 200000 --workers 1 2 4 8
+    python -m benchmarks.bench_vector_store metadata --sizes 100000 1000000
+    python -m benchmarks.bench_vector_store lexical --sizes 10000 100000 500000
+    python -m benchmarks.bench_vector_store sqlite --sizes 10000 100000
+
+Synthetic chunks are ~500 characters with 1024-dim embeddings by default,
+matching chunk_text() and Cohere embed-english-v3.0. Large sizes need disk
+space for the float32 matrix (4 GB at 1M x 1024).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Dict, List
+
+import numpy as np
+
+from app.database.ann_index import IVFIndex, top_k_indices
+from app.database.lexical_index import LexicalIndex, tokenize
+from app.database.metadata_columns import MetadataColumns
+from app.database.quantization import QuantizedIndex
+from app.database.sqlite_vector_store import SQLiteVectorStore
+from app.database.vector_persistence import ArrayColumn, read_snapshot, write_snapshot
+from app.database.vector_store import SimpleVectorStore
+
+CHUNK_TEXT = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 9)[:500]
+
+
+def _synthetic(n: int, dim: int, n_users: int = 20, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((n, dim), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    ids = [f"user{i % n_users}_doc{i // 50}.pdf_{i % 50}" for i in range(n)]
+    documents = [CHUNK_TEXT] * n
+    metadatas = [
+        {
+            "source": f"doc{i // 50}.pdf",
+            "chunk_index": i % 50,
+            "char_start": (i % 50) * 400,
+            "char_end": (i % 50) * 400 + 500,
+            "total_chunks": 50,
+            "user_id": f"user{i % n_users}",
+        }
+        for i in range(n)
+    ]
+    return ids, documents, embeddings, metadatas
+
+
+def _clustered(n: int, dim: int, n_topics: int = 1000, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around topic centres, closer to real embeddings than pure noise"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((n_topics, dim), dtype=np.float32)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100_000):
+        end = min(n, start + 100_000)
+        vectors[start:end] = centres[rng.integers(0, n_topics, end - start)]
+        vectors[start:end] += 1.2 * rng.standard_normal((end - start, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def _percentiles(samples_ms: List[float]):
+    return float(np.percentile(samples_ms, 50)), float(np.percentile(samples_ms, 99))
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def bench_persistence(sizes: List[int], dim: int, json_max: int) -> List[Dict]:
+    """Load time and on-disk size: legacy JSON file vs binary memmap snapshot"""
+    rows = []
+    for n in sizes:
+        ids, documents, embeddings, metadatas = _synthetic(n, dim)
+        workdir = tempfile.mkdtemp(prefix="bench_vs_")
+        try:
+            row = {"chunks": n}
+
+            if n <= json_max:
+                json_path = os.path.join(workdir, "vector_store.json")
+                with open(json_path, "w", encoding="utf-8") as f:
+                    json.dump({"documents": documents, "embeddings": embeddings.tolist(),
+                               "metadatas": metadatas, "ids": ids}, f)
+                start = time.perf_counter()
+                with open(json_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                    np.asarray(data["embeddings"], dtype=np.float32)
+                row["json_load_ms"] = (time.perf_counter() - start) * 1000
+                row["json_size"] = os.path.getsize(json_path)
+                del data
+
+            store_dir = os.path.join(workdir, "vector_store")
+            start = time.perf_counter()
+            write_snapshot(store_dir, ids, documents, embeddings, metadatas)
+            row["binary_write_ms"] = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            snapshot = read_snapshot(store_dir)
+            row["binary_load_ms"] = (time.perf_counter() - start) * 1000
+            row["binary_size"] = _dir_size(store_dir)
+            del snapshot
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        rows.append(row)
+
+        json_part = (
+            f"json load {row['json_load_ms']:9.1f} ms  size {_fmt_bytes(row['json_size']):>10}  |  "
+            if "json_load_ms" in row else "json skipped (--json-max)  |  "
+        )
+        print(
+            f"{n:>9,} chunks  {json_part}"
+            f"binary load {row['binary_load_ms']:8.1f} ms  size {_fmt_bytes(row['binary_size']):>10}"
+        )
+    return rows
+
+
+def bench_ann(sizes: List[int], dim: int, n_queries: int, n_probes: List[int]) -> List[Dict]:
+    """Recall@5/10 and p50/p99 latency of the IVF index against exact search"""
+    rows = []
+    for n in sizes:
+        vectors = _clustered(n, dim)
+        rng = np.random.default_rng(1)
+        queries = vectors[rng.choice(n, n_queries, replace=False)] + 0.05 * rng.standard_normal((n_queries, dim), dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        exact_ms, truth = [], []
+        for q in queries:
+            start = time.perf_counter()
+            truth.append(top_k_indices(vectors @ q, 10))
+            exact_ms.append((time.perf_counter() - start) * 1000)
+        exact_p50, exact_p99 = _percentiles(exact_ms)
+        print(f"{n:>9,} vectors  exact           p50 {exact_p50:7.2f} ms  p99 {exact_p99:7.2f} ms")
+
+        start = time.perf_counter()
+        index = IVFIndex()
+        index.build(vectors, np.arange(n))
+        build_s = time.perf_counter() - start
+
+        for n_probe in n_probes:
+            ivf_ms, recall5, recall10 = [], [], []
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found, _ = index.search(vectors, q, 10, n_probe=n_probe)
+                ivf_ms.append((time.perf_counter() - start) * 1000)
+                recall5.append(len(set(found[:5]) & set(expected[:5])) / 5)
+                recall10.append(len(set(found) & set(expected)) / 10)
+            p50, p99 = _percentiles(ivf_ms)
+            row = {"vectors": n, "n_lists": len(index.centroids), "n_probe": n_probe, "build_s": build_s,
+                   "recall@5": float(np.mean(recall5)), "recall@10": float(np.mean(recall10)),
+                   "p50_ms": p50, "p99_ms": p99, "exact_p50_ms": exact_p50, "exact_p99_ms": exact_p99}
+            rows.append(row)
+            print(
+                f"{'':>9}          ivf nprobe={n_probe:<3} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  "
+                f"recall@5 {row['recall@5']:.3f}  recall@10 {row['recall@10']:.3f}  "
+                f"({row['n_lists']} lists, built in {build_s:.1f} s)"
+            )
+    return rows
+
+
+def bench_quantization(sizes: List[int], dim: int, n_queries: int, kinds: List[str]) -> List[Dict]:
+    """Resident bytes per row, latency and recall@10 of quantized scans against float32"""
+    rows = []
+    for n in sizes:
+        vectors = _clustered(n, dim)
+        column = ArrayColumn(base=vectors)
+        rng = np.random.default_rng(1)
+        queries = vectors[rng.choice(n, n_queries, replace=False)] + 0.05 * rng.standard_normal((n_queries, dim), dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        exact_ms, truth = [], []
+        for q in queries:
+            start = time.perf_counter()
+            truth.append(set(top_k_indices(vectors @ q, 10)))
+            exact_ms.append((time.perf_counter() - start) * 1000)
+        p50, p99 = _percentiles(exact_ms)
+        print(f"{n:>9,} vectors  float32            {dim * 4:>6} B/row  p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  recall@10 1.000")
+
+        for kind in kinds:
+            binary_prefilter = kind.endswith("+binary")
+            index = QuantizedIndex(kind.replace("+binary", ""), binary_prefilter=binary_prefilter)
+            index.build(column)
+            latency_ms, recall = [], []
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found, _ = index.search(column, None, q, 10)
+                latency_ms.append((time.perf_counter() - start) * 1000)
+                recall.append(len(set(found) & expected) / 10)
+            p50, p99 = _percentiles(latency_ms)
+            row = {"vectors": n, "kind": kind, "bytes_per_row": index.nbytes_per_row,
+                   "p50_ms": p50, "p99_ms": p99, "recall@10": float(np.mean(recall))}
+            rows.append(row)
+            print(
+                f"{'':>9}          {kind:<18} {row['bytes_per_row']:>6.0f} B/row  p50 {p50:7.2f} ms  "
+                f"p99 {p99:7.2f} ms  recall@10 {row['recall@10']:.3f}  ({dim * 4 / row['bytes_per_row']:.1f}x smaller)"
+            )
+    return rows
+
+
+def _torn(result: Dict, n_results: int) -> bool:
+    """A result is torn if its lists disagree, rows don't match their metadata, or it is unsorted"""
+    documents, metadatas, distances = result["documents"][0], result["metadatas"][0], result["distances"][0]
+    if not (len(documents) == len(metadatas) == len(distances)) or len(documents) > n_results:
+        return True
+    if any(doc != meta["chunk_id"] for doc, meta in zip(documents, metadatas)):
+        return True
+    return any(a > b + 1e-6 for a, b in zip(distances, distances[1:]))
+
+
+def bench_concurrency(size: int, dim: int, threads: List[int], duration: float, write_rate: float,
+                      n_users: int = 20) -> List[Dict]:
+    """
+    Search throughput per reader thread count while a writer adds 50-chunk
+    uploads (and deletes every fourth one) at write_rate per second, paced
+    the way embedding calls pace real uploads.
+    """
+    ids, _, embeddings, metadatas = _synthetic(size, dim, n_users)
+    for chunk_id, m in zip(ids, metadatas):
+        m["chunk_id"] = chunk_id
+    rng = np.random.default_rng(2)
+    queries = embeddings[rng.choice(size, 256, replace=False)]
+    workdir = tempfile.mkdtemp(prefix="bench_vs_")
+    rows = []
+    try:
+        store = SimpleVectorStore(store_dir=os.path.join(workdir, "vector_store"))
+        # Documents equal their ids so a reader can check every row against its metadata
+        store.add(ids, ids, embeddings, metadatas)
+        store.checkpoint()
+
+        for n_threads in threads:
+            stop = threading.Event()
+            counts = [0] * n_threads
+            torn = [0] * n_threads
+            writes = [0]
+
+            def writer():
+                batch = 0
+                while not stop.is_set():
+                    source = f"upload{n_threads}_{batch}.pdf"
+                    vecs = rng.standard_normal((50, dim), dtype=np.float32)
+                    new_ids = [f"{source}_{i}" for i in range(50)]
+                    store.add(new_ids, new_ids, vecs, [
+                        {"source": source, "chunk_index": i, "user_id": f"user{batch % n_users}", "chunk_id": new_ids[i]}
+                        for i in range(50)
+                    ])
+                    if batch % 4 == 3:
+                        store.delete_by_source(f"upload{n_threads}_{batch - 2}.pdf", user_id=f"user{(batch - 2) % n_users}")
+                    batch += 1
+                    writes[0] += 1
+                    stop.wait(1 / write_rate)
+
+            def reader(slot: int):
+                i = slot
+                while not stop.is_set():
+                    user_id = f"user{i % n_users}" if i % 2 else None
+                    result = store.search(queries[i % len(queries)], 5, user_id=user_id)
+                    torn[slot] += _torn(result, 5)
+                    counts[slot] += 1
+                    i += n_threads
+
+            workers = [threading.Thread(target=reader, args=(slot,)) for slot in range(n_threads)]
+            workers.append(threading.Thread(target=writer))
+            for worker in workers:
+                worker.start()
+            time.sleep(duration)
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+            row = {"threads": n_threads, "qps": sum(counts) / duration, "writes_per_s": writes[0] / duration,
+                   "torn": sum(torn)}
+            rows.append(row)
+            print(
+                f"{size:>9,} chunks  {n_threads:>2} reader threads  {row['qps']:9.1f} searches/s  "
+                f"{row['writes_per_s']:7.1f} uploads/s  torn results {row['torn']}"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+def _memory_kb() -> Dict[str, int]:
+    """Proportional (shared pages split between processes) and private resident memory, Linux only"""
+    fields = {}
+    with open("/proc/self/smaps_rollup", "r") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                fields[name] = int(value.split()[0])
+    return fields
+
+
+def _worker_process(store_dir: str, dim: int, expected: int, ready, results):
+    store = SimpleVectorStore(store_dir=store_dir)
+    rng = np.random.default_rng(os.getpid())
+    for _ in range(20):
+        store.search(rng.standard_normal(dim), 5)
+    ready.put(store.count())
+    # Poll like a busy worker would search, until the parent's upload shows up
+    while store.count() < expected:
+        time.sleep(0.001)
+    results.put({"visible_at": time.time(), **_memory_kb()})
+
+
+def bench_workers(size: int, dim: int, workers: List[int]) -> List[Dict]:
+    """Per-process memory with N worker processes on one store, and how fast an upload reaches all of them"""
+    ids, documents, embeddings, metadatas = _synthetic(size, dim)
+    workdir = tempfile.mkdtemp(prefix="bench_vs_")
+    rows = []
+    try:
+        store_dir = os.path.join(workdir, "vector_store")
+        write_snapshot(store_dir, ids, documents, embeddings, metadatas)
+        del ids, documents, embeddings, metadatas
+        ctx = multiprocessing.get_context("spawn")
+        for n_workers in workers:
+            writer = SimpleVectorStore(store_dir=store_dir)
+            expected = writer.count() + 50
+            ready, results = ctx.Queue(), ctx.Queue()
+            processes = [ctx.Process(target=_worker_process, args=(store_dir, dim, expected, ready, results))
+                         for _ in range(n_workers)]
+            for process in processes:
+                process.start()
+            for _ in processes:
+                ready.get()
+            vecs = np.random.default_rng(3).standard_normal((50, dim), dtype=np.float32)
+            upload_ids = [f"upload{n_workers}_{i}" for i in range(50)]
+            writer.add(upload_ids, upload_ids, vecs, [{"source": f"upload{n_workers}.pdf", "user_id": "user0"}] * 50)
+            committed_at = time.time()
+            stats = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            writer.delete_by_source(f"upload{n_workers}.pdf", user_id="user0")
+            writer.checkpoint()
+
+            row = {
+                "workers": n_workers,
+                "pss_kb": sum(s["Pss"] for s in stats) / n_workers,
+                "private_kb": sum(s["Private_Clean"] + s["Private_Dirty"] for s in stats) / n_workers,
+                "total_pss_kb": sum(s["Pss"] for s in stats),
+                "max_visible_ms": max(0.0, max(s["visible_at"] for s in stats) - committed_at) * 1000,
+            }
+            rows.append(row)
+            print(
+                f"{size:>9,} chunks  {n_workers:>2} workers  PSS/worker {_fmt_bytes(row['pss_kb'] * 1024):>10}  "
+                f"private/worker {_fmt_bytes(row['private_kb'] * 1024):>10}  total PSS {_fmt_bytes(row['total_pss_kb'] * 1024):>10}  "
+                f"upload visible on every worker {row['max_visible_ms']:.1f} ms after add() returned"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+def bench_metadata(sizes: List[int], dim: int, n_queries: int) -> List[Dict]:
+    """Bytes per chunk of list-of-dicts vs columnar metadata, and search latency with metadata filters"""
+    rows = []
+    for n in sizes:
+        ids, documents, embeddings, metadatas = _synthetic(n, dim)
+        # Copies, so the measurement doesn't count the strings shared with the inputs
+        tracemalloc.start()
+        as_dicts = json.loads(json.dumps(metadatas))
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del as_dicts
+        tracemalloc.start()
+        columns = MetadataColumns.from_dicts(metadatas)
+        column_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del columns
+
+        workdir = tempfile.mkdtemp(prefix="bench_vs_")
+        try:
+            store = SimpleVectorStore(store_dir=os.path.join(workdir, "vector_store"))
+            store.add(ids, documents, embeddings, metadatas)
+            store.checkpoint()
+            rng = np.random.default_rng(1)
+            queries = embeddings[rng.choice(n, n_queries, replace=False)]
+            cases = {
+                "user": ("user3", None),
+                "user + 2 sources": ("user3", {"source": [metadatas[3]["source"], metadatas[23]["source"]]}),
+                "all users, 1 source": (None, {"source": [metadatas[3]["source"]]}),
+                "all users, file type": (None, {"file_type": ".pdf"}),
+                "all users, unfiltered": (None, None),
+            }
+            row = {"chunks": n, "dict_bytes_per_chunk": dict_bytes / n, "column_bytes_per_chunk": column_bytes / n}
+            print(
+                f"{n:>9,} chunks  metadata {row['dict_bytes_per_chunk']:6.0f} B/chunk as dicts  "
+                f"{row['column_bytes_per_chunk']:5.0f} B/chunk as columns"
+            )
+            for name, (user_id, filters) in cases.items():
+                latency_ms = []
+                for q in queries:
+                    start = time.perf_counter()
+                    store.search(q, 5, user_id=user_id, filters=filters)
+                    latency_ms.append((time.perf_counter() - start) * 1000)
+                p50, p99 = _percentiles(latency_ms)
+                row[f"{name} p50_ms"] = p50
+                print(f"{'':>9}         search {name:<22} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms")
+            rows.append(row)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+def _synthetic_text(n: int, seed: int = 0) -> List[str]:
+    """~80-word chunks over a Zipf-distributed 50k-word vocabulary, with an error code in every tenth chunk"""
+    rng = np.random.default_rng(seed)
+    words = [f"w{i}" for i in range(50_000)]
+    ranks = np.minimum(rng.zipf(1.2, size=(n, 80)), len(words)) - 1
+    texts = []
+    for i in range(n):
+        text = " ".join(words[r] for r in ranks[i])
+        if i % 10 == 0:
+            text += f" ERR-{i % 9973:04d}"
+        texts.append(text)
+    return texts
+
+
+def bench_lexical(sizes: List[int], n_queries: int) -> List[Dict]:
+    """BM25 index build time, memory, incremental add cost and query latency"""
+    rows = []
+    for n in sizes:
+        texts = _synthetic_text(n)
+        start = time.perf_counter()
+        index = LexicalIndex()
+        index.build(np.arange(n), texts)
+        build_s = time.perf_counter() - start
+        # Postings arrays plus the vocabulary dict, its term strings and term id ints
+        memory = index.nbytes + sys.getsizeof(index.vocab) + sum(
+            sys.getsizeof(term) + sys.getsizeof(term_id) for term, term_id in index.vocab.items()
+        )
+
+        start = time.perf_counter()
+        index.add(np.arange(n, n + 50), _synthetic_text(50, seed=1))
+        add_ms = (time.perf_counter() - start) * 1000
+
+        rng = np.random.default_rng(2)
+        queries = [f"ERR-{rng.integers(0, 9973):04d}" if i % 2 else " ".join(texts[rng.integers(n)].split()[:4])
+                   for i in range(n_queries)]
+        latency_ms = []
+        for q in queries:
+            start = time.perf_counter()
+            found_rows, scores = index.search(tokenize(q))
+            top_k_indices(scores, 5)
+            latency_ms.append((time.perf_counter() - start) * 1000)
+        p50, p99 = _percentiles(latency_ms)
+        row = {"chunks": n, "build_s": build_s, "memory_bytes": memory, "vocab": len(index.vocab),
+               "add_50_ms": add_ms, "p50_ms": p50, "p99_ms": p99}
+        rows.append(row)
+        print(
+            f"{n:>9,} chunks  build {build_s:6.2f} s  memory {_fmt_bytes(memory):>10} ({memory / n:.0f} B/chunk, "
+            f"{len(index.vocab):,} terms)  add 50 chunks {add_ms:6.1f} ms  query p50 {p50:6.2f} ms  p99 {p99:6.2f} ms"
+        )
+    return rows
+
+
+def bench_sqlite(sizes: List[int], dim: int, n_queries: int) -> List[Dict]:
+    """Insert rate, search latency and peak search memory of the SQLite backend against the in-memory store"""
+    rows = []
+    for n in sizes:
+        ids, documents, embeddings, metadatas = _synthetic(n, dim)
+        rng = np.random.default_rng(1)
+        queries = embeddings[rng.choice(n, n_queries, replace=False)]
+        workdir = tempfile.mkdtemp(prefix="bench_vs_")
+        try:
+            stores = {
+                "memory": SimpleVectorStore(store_dir=os.path.join(workdir, "vector_store")),
+                "sqlite": SQLiteVectorStore(path=os.path.join(workdir, "vector_store.sqlite3")),
+            }
+            for name, store in stores.items():
+                # Upload-sized batches, as the documents route adds them
+                start = time.perf_counter()
+                for first in range(0, n, 1000):
+                    last = first + 1000
+                    store.add(ids[first:last], documents[first:last], embeddings[first:last], metadatas[first:last])
+                store.checkpoint()
+                insert_s = time.perf_counter() - start
+                row = {"backend": name, "chunks": n, "inserts_per_s": n / insert_s}
+                print(f"{n:>9,} chunks  {name:<6}  insert {n / insert_s:9,.0f} chunks/s")
+                for case, user_id in (("user", "user3"), ("all users", None)):
+                    latency_ms = []
+                    for q in queries:
+                        start = time.perf_counter()
+                        store.search(q, 5, user_id=user_id)
+                        latency_ms.append((time.perf_counter() - start) * 1000)
+                    p50, p99 = _percentiles(latency_ms)
+                    tracemalloc.start()
+                    store.search(queries[0], 5, user_id=user_id)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    row[f"{case} p50_ms"] = p50
+                    row[f"{case} peak_bytes"] = peak
+                    print(
+                        f"{'':>9}                 search {case:<10} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms  "
+                        f"peak allocation {_fmt_bytes(peak):>10}"
+                    )
+                rows.append(row)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    p = sub.add_parser("persistence", help="load time and file size, JSON vs binary snapshot")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    p.add_argument("--dim", type=int, default=1024)
+    p.add_argument("--json-max", type=int, default=100_000,
+                   help="skip the JSON baseline above this many chunks")
+
+    p = sub.add_parser("ann", help="IVF recall and latency against exact search")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100_000, 500_000, 2_000_000])
+    p.add_argument("--dim", type=int, default=1024)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--n-probe", type=int, nargs="+", default=[8, 16, 32])
+
+    p = sub.add_parser("quantization", help="footprint, latency and recall of compressed scans")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100_000, 500_000])
+    p.add_argument("--dim", type=int, default=1024)
+    p.add_argument("--queries", type=int, default=100)
+    p.add_argument("--kinds", nargs="+", default=["float16", "int8", "int8+binary", "binary"])
+
+    p = sub.add_parser("concurrency", help="search throughput across threads during uploads")
+    p.add_argument("--size", type=int, default=100_000)
+    p.add_argument("--dim", type=int, default=1024)
+    p.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--duration", type=float, default=5.0, help="seconds per thread count")
+    p.add_argument("--write-rate", type=float, default=20.0, help="uploads per second during the run")
+
+    p = sub.add_parser("workers", help="per-process memory and write visibility across worker processes")
+    p.add_argument("--size", type=int, default=200_000)
+    p.add_argument("--dim", type=int, default=1024)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+
+    p = sub.add_parser("metadata", help="metadata memory per chunk and filtered search latency")
+    p.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    p.add_argument("--dim", type=int, default=1024)
+    p.add_argument("--queries", type=int, default=100)
+
+    p = sub.add_parser("lexical", help="BM25 index build time, memory and query latency")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    p.add_argument("--queries", type=int, default=200)
+
+    p = sub.add_parser("sqlite", help="SQLite backend insert rate, search latency and memory vs in-memory")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    p.add_argument("--dim", type=int, default=1024)
+    p.add_argument("--queries", type=int, default=50)
+
+    args = parser.parse_args()
+    if args.mode == "persistence":
+        bench_persistence(args.sizes, args.dim, args.json_max)
+    elif args.mode == "ann":
+        bench_ann(args.sizes, args.dim, args.queries, args.n_probe)
+    elif args.mode == "quantization":
+        bench_quantization(args.sizes, args.dim, args.queries, args.kinds)
+    elif args.mode == "concurrency":
+        bench_concurrency(args.size, args.dim, args.threads, args.duration, args.write_rate)
+    elif args.mode == "workers":
+        bench_workers(args.size, args.dim, args.workers)
+    elif args.mode == "metadata":
+        bench_metadata(args.sizes, args.dim, args.queries)
+    elif args.mode == "lexical":
+        bench_lexical(args.sizes, args.queries)
+    elif args.mode == "sqlite":
+        bench_sqlite(args.sizes, args.dim, args.queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+LLM client deadline, circuit breaker and hedging against the fake chat server
+from benchmarks/bench_llm.py.
+
+Run from the backend directory:
+    python -m pytest tests/test_llm_client.py
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.services import cohere_client, llm_client
+from benchmarks.bench_llm import CONTEXT, FakeChatServer
+
+QUESTION = "What does E-4012 mean?"
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeChatServer()
+    server.base_ms = 5
+    monkeypatch.setenv("COHERE_API_KEY", "fake-key")
+    monkeypatch.delenv("MOCK_EMBEDDINGS", raising=False)
+    monkeypatch.setattr(cohere_client, "COHERE_BASE_URL", server.url)
+    monkeypatch.setattr(cohere_client, "_co", None)
+    monkeypatch.setattr(cohere_client, "_async_state", None)
+    monkeypatch.setattr(llm_client, "_breaker", llm_client._CircuitBreaker(3, 0.3))
+    monkeypatch.setattr(llm_client, "_calls", llm_client._CallStats(False, 95, 0.05, 1.0))
+    yield server
+    server.hang = False
+    server.httpd.shutdown()
+
+
+def test_deadline_degrades_answer(server, monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_TIMEOUT_SECONDS", 0.3)
+    server.hang = True
+
+    async def run():
+        start = time.perf_counter()
+        answer, confidence = await llm_client.generate_answer_async(QUESTION, CONTEXT)
+        plain = time.perf_counter() - start
+        start = time.perf_counter()
+        streamed = "".join([delta async for delta in llm_client.stream_answer_async(QUESTION, CONTEXT)])
+        return answer, confidence, plain, streamed, time.perf_counter() - start
+
+    answer, confidence, plain, streamed, stream = asyncio.run(run())
+    # The top sources instead of an answer, as soon as the deadline passes
+    assert confidence == 0.0 and "printers.md" in answer
+    assert "printers.md" in streamed and streamed.endswith("[CONFIDENCE: 0%]")
+    assert plain < 1.0 and stream < 1.0
+    stats = llm_client.get_llm_stats()["chat"]
+    assert stats["timeouts"] == 2 and stats["degraded_answers"] == 2
+
+
+def test_breaker_opens_then_half_opens(server):
+    async def run():
+        server.fail_status = 503
+        for _ in range(10):
+            answer, confidence = await llm_client.generate_answer_async(QUESTION, CONTEXT)
+            assert confidence == 0.0 and "printers.md" in answer
+        # Only the calls up to the threshold reached the server; the rest failed fast
+        assert server.requests == 3
+        assert llm_client._breaker.state == "open"
+
+        await asyncio.sleep(0.3)
+        server.fail_status = None
+        server.base_ms = 200
+        trial = asyncio.create_task(llm_client.generate_answer_async(QUESTION, CONTEXT))
+        await asyncio.sleep(0.05)
+        assert llm_client._breaker.state == "half_open"
+        # One trial call at a time: others keep failing fast while it is in flight
+        _, confidence = await llm_client.generate_answer_async(QUESTION, CONTEXT)
+        assert confidence == 0.0 and server.requests == 4
+        answer, confidence = await trial
+        assert confidence == 85.0 and answer == "Replace the toner cartridge."
+        assert llm_client._breaker.state == "closed"
+
+    asyncio.run(run())
+    assert llm_client._breaker.stats()["times_opened"] == 1
+
+
+def test_hedge_cancels_losing_call(server, monkeypatch):
+    monkeypatch.setattr(llm_client, "_calls", llm_client._CallStats(True, 95, 0.05, 1.0))
+
+    async def run():
+        client = cohere_client.get_async_client()
+        chat = client.chat
+        started, cancelled = [], []
+
+        async def tracked_chat(**kwargs):
+            call = len(started)
+            started.append(call)
+            if server.slow_rate and call > 0:
+                # The hedge goes out while the first request is still stuck: answer it quickly
+                server.slow_rate = 0.0
+            try:
+                return await chat(**kwargs)
+            except asyncio.CancelledError:
+                cancelled.append(call)
+                raise
+
+        monkeypatch.setattr(client, "chat", tracked_chat)
+        # Warm-up calls fill the latency window the hedge delay is taken from
+        for _ in range(20):
+            await llm_client.generate_answer_async(QUESTION, CONTEXT)
+        assert not cancelled
+
+        started.clear()
+        server.slow_rate = 1.0
+        start = time.perf_counter()
+        answer, confidence = await llm_client.generate_answer_async(QUESTION, CONTEXT)
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(0)
+        return answer, confidence, elapsed, started, cancelled
+
+    answer, confidence, elapsed, started, cancelled = asyncio.run(run())
+    assert confidence == 85.0 and answer == "Replace the toner cartridge."
+    # Answered by the hedge well before the slow request would have finished, which was cancelled
+    assert elapsed < server.slow_ms / 1000 / 2
+    assert started == [0, 1] and cancelled == [0]
+    stats = llm_client.get_llm_stats()["chat"]
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
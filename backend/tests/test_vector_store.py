@@ -0,0 +1,116 @@
+"""
+Vector store consistency under concurrent searches and writes, and lexical search.
+
+Run from the backend directory:
+    python -m pytest tests/test_vector_store.py
+"""
+
+import os
+import random
+import threading
+
+import numpy as np
+import pytest
+
+from app.database.vector_store import SimpleVectorStore
+
+DIM = 32
+USERS = [f"user{u}" for u in range(4)]
+BATCH = 20
+
+
+def _batch(source: str, user_id: str, vecs: np.ndarray):
+    ids = [f"{source}_{i}" for i in range(len(vecs))]
+    # Documents equal their ids so each row can be checked against its metadata
+    metadatas = [{"source": source, "chunk_index": i, "user_id": user_id, "chunk_id": ids[i]} for i in range(len(vecs))]
+    return ids, ids, vecs.tolist(), metadatas
+
+
+@pytest.mark.parametrize("index_type", ["exact", "ivf"])
+def test_searches_stay_consistent_while_writing(tmp_path, index_type):
+    rng = np.random.default_rng(0)
+    # Low thresholds so IVF training and compactions run while readers search
+    store = SimpleVectorStore(
+        store_dir=os.path.join(tmp_path, "vector_store"),
+        index_type=index_type,
+        ann_min_rows=200,
+        compact_dead_ratio=0.05,
+    )
+    for b in range(40):
+        store.add(*_batch(f"seed{b}.pdf", USERS[b % len(USERS)], rng.standard_normal((BATCH, DIM))))
+
+    # source -> (user_id, vector of its first chunk); written by the writer once the add returned
+    added = {}
+    # Sources from before their delete_by_source call, and from after it returned
+    deleting, deleted = set(), set()
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        try:
+            for b in range(60):
+                source, user_id = f"upload{b}.pdf", USERS[b % len(USERS)]
+                vecs = rng.standard_normal((BATCH, DIM)).astype(np.float32)
+                store.add(*_batch(source, user_id, vecs))
+                added[source] = (user_id, vecs[0])
+                if b % 4 == 3:
+                    gone = f"upload{b - 2}.pdf"
+                    deleting.add(gone)
+                    store.delete_by_source(gone, user_id=USERS[(b - 2) % len(USERS)])
+                    deleted.add(gone)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            stop.set()
+
+    def reader(seed: int):
+        pick = random.Random(seed)
+        try:
+            while not stop.is_set():
+                deleted_before = set(deleted)
+                visible = [s for s in list(added) if s not in deleted_before]
+                source = pick.choice(visible) if visible else None
+                user_id = added[source][0] if source else pick.choice(USERS)
+                query = added[source][1] if source else rng.standard_normal(DIM)
+                result = store.search(query, 5, user_id=user_id)
+
+                documents, metadatas, distances = result["documents"][0], result["metadatas"][0], result["distances"][0]
+                assert len(documents) == len(metadatas) == len(distances) == 5
+                assert all(doc == meta["chunk_id"] for doc, meta in zip(documents, metadatas))
+                assert all(meta["user_id"] == user_id for meta in metadatas)
+                assert distances == sorted(distances)
+                # A delete that finished before the search started is never seen
+                assert not {meta["source"] for meta in metadatas} & deleted_before
+                # An add that finished before the search started is always seen
+                if source is not None and source not in deleting:
+                    assert documents[0] == f"{source}_0"
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=reader, args=(seed,)) for seed in range(4)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    assert store.count() == 40 * BATCH + (60 - len(deleted)) * BATCH
+    for source, (user_id, vec) in added.items():
+        top = store.search(vec, 1, user_id=user_id)["documents"][0]
+        assert (top != [f"{source}_0"]) if source in deleted else (top == [f"{source}_0"])
+
+
+def test_lexical_search_finds_new_partition_before_its_index_is_built(tmp_path):
+    store = SimpleVectorStore(store_dir=os.path.join(tmp_path, "vector_store"))
+    rng = np.random.default_rng(0)
+    store.add(
+        ["a_0", "a_1"],
+        ["reset the router with ERR-4012", "billing questions"],
+        rng.standard_normal((2, DIM)).tolist(),
+        [{"source": "a.pdf", "chunk_index": i, "user_id": "user0"} for i in range(2)],
+    )
+    result = store.search_lexical("ERR-4012", n_results=2, user_id="user0")
+    assert result["ids"][0] == ["a_0"]
@@ -44,7 +44,7 @@ export default function Upload({ onNavigate }) {
                 const response = await axios.post('/api/documents/upload', formData, {
                     headers: { 'Content-Type': 'multipart/form-data' }
                 })
-                results.push({ name: file.name, success: true, chunks: response.data.chunks_created })
+                results.push({ name: file.name, success: true, queued: response.status === 202, chunks: response.data.chunks_created })
             } catch (err) {
                 results.push({ name: file.name, success: false, error: err.response?.data?.detail || 'Upload failed' })
             }
@@ -209,7 +209,7 @@ export default function Upload({ onNavigate }) {
                                                     {result.name}
                                                 </p>
                                                 <p style={{ fontSize: '11px', margin: '2px 0 0', color: result.success ? '#6ee7b7' : '#f87171' }}>
-                                                    {result.success ? `Success details: ${result.chunks} chunks` : result.error}
+                                                    {result.success ? (result.queued ? 'Queued for processing' : `Success details: ${result.chunks} chunks`) : result.error}
                                                 </p>
                                             </div>
                                         </div>